@@ -6,13 +6,16 @@ Beschreibung:
   Es werden nur Dateien kopiert,
     - deren Änderungsdatum zwischen (JETZT - DAYS_BACK) und JETZT liegt
     - die lokal noch nicht existieren oder deren lokale Größe kleiner ist als die entfernte
-    - die nicht als "in Benutzung" erkannt wurden (Größe ändert sich zwischen zwei Checks)
+      (mit CHECKSUM_MODE zusätzlich: deren Inhalt laut Prüfsumme abweicht)
+    - die nicht als "in Benutzung" erkannt wurden (zu junge mtime und Änderung bei erneuter Prüfung)
 
 Statistiken am Ende:
   - Anzahl kopierter Dateien
   - Gesamtvolumen (MB) kopiert
   - Prozentualer Anteil gegenüber potentiell kopierbaren Dateien
   - Datenrate (MB/s) und Dateirate (Dateien/s)
+  - optional Metriken je Lauf (Phasen, Dauer/Durchsatz je Datei, Rate über die Zeit) als JSON-Zeilen
+    und Prometheus-Textfile, siehe METRICS_*
 
 Konfiguration (Anpassen nach Bedarf):
 """
@@ -25,8 +28,9 @@ PRIVATE_KEY_PATH = None  # z.B. r"C:/Users/USER/.ssh/id_rsa"
 REMOTE_BASE_DIR = "/home/ngpsuser/NGPS"  # Kein abschließender Slash nötig
 LOCAL_BASE_DIR = "NGPS"  # Relativ zum Skriptpfad oder absolut angeben
 DAYS_BACK = 7  # Dateien mit mtime >= now - DAYS_BACK Tage
-SECONDS_STABILITY_CHECK = 3  # Wartezeit zwischen zwei Größenchecks
+SECONDS_STABILITY_CHECK = 3  # Dateien mit jüngerer mtime (Remote-Uhr) werden nach einmaliger Wartezeit gesammelt erneut geprüft
 MAX_PARALLEL_TRANSFERS = 2  # Einfaches Parallelitäts-Limit (Thread-Anzahl)
+TAR_STREAMS = 2  # Anzahl paralleler tar-Sessions im tar Stream Modus (nach Größe ausbalanciert)
 EXCLUDE_PATTERNS = [".tmp", ".swp"]  # Endungen oder Teilstrings die ignoriert werden
 FOLLOW_SYMLINKS = True  # Symlinks auf Verzeichnisse folgen
 LOG_EVERY_N_FILES = 20  # Fortschritts-Log
@@ -39,24 +43,82 @@ MAX_RETRIES_PER_FILE = 3  # Anzahl Wiederholungen bei Transferfehler
 STATUS_UPDATE_INTERVAL = 1.0  # Sekunden zwischen Status-Aktualisierungen
 USE_SINGLE_LINE_STATUS = True  # Einzeilige dynamische Anzeige benutzen
 SIZE_TOLERANCE_BYTES = 512  # Dateien gelten als identisch, wenn Differenz <= Toleranz
+CHECKSUM_MODE = None  # None: nur Größenvergleich; "sha256" oder "xxh64" (xxhsum remote, xxhash lokal): vorhandene Dateien zusätzlich per Inhalt vergleichen
 # Performance Optionen
 USE_TAR_STREAM = True  # tar über SSH streamen statt Einzel-SFTP (wenn RSYNC nicht aktiv)
-TAR_STREAM_COMPRESS = True  # gzip Kompression im tar Stream (-z)
+TAR_STREAM_COMPRESS = True  # Kompression im tar Stream (False = unkomprimiert, Codec siehe TAR_STREAM_CODEC)
+TAR_STREAM_CODEC = "gzip"  # "gzip", "zstd", "lz4", "none" oder "auto" (Messung vor dem Transfer, überträgt TAR_CODEC_PROBE_MB zusätzlich)
+TAR_STREAM_LEVEL = 0  # Kompressionsstufe des Codecs, 0 = Standardstufe (gzip 1-9, zstd 1-19, lz4 1-12)
+TAR_CODEC_PROBE_MB = 8  # Datenmenge (aus den gefundenen Dateien) für die Messung im auto-Modus
 USE_RSYNC = False  # rsync verwenden (falls auf Server verfügbar)
 RSYNC_PATH = "/usr/bin/rsync"  # Pfad rsync Server
 RSYNC_COMPRESS = False  # -z aktivieren
+HYBRID_TRANSFER = False  # kleine Dateien per tar Stream, große parallel per SFTP (hat Vorrang vor USE_TAR_STREAM)
+HYBRID_SIZE_THRESHOLD_MB = 8  # ab dieser Größe per SFTP statt tar
+SCAN_MODE = "auto"  # "auto": ein Remote-Befehl (find) mit SFTP-Fallback, "find": nur Remote-Befehl, "sftp": rekursives SFTP-Listing
+SCAN_PARALLEL_CHANNELS = 4  # SFTP-Kanäle für paralleles Verzeichnis-Listing (1 = sequentiell rekursiv)
+TRANSFER_QUEUE_MAX = 1000  # Begrenzte Warteschlange zwischen Scan und SFTP-Transfer (Scan und Kopieren überlappen)
+# Lokales Manifest (SQLite) bereits gesicherter Dateien statt Dateisystem-Prüfung pro Datei
+USE_MANIFEST = True
+MANIFEST_PATH = None  # None: <LOCAL_BASE_DIR>/.backup_manifest.sqlite
+MANIFEST_COMMIT_EVERY = 200  # Änderungen je Commit (nach Absturz wird Fehlendes per Dateisystem nachgeprüft)
+# Fortsetzen wachsender bzw. abgebrochener Dateien (nur SFTP-Modus)
+RESUME_PARTIAL = True  # nur den fehlenden Teil ab lokaler Größe holen statt die ganze Datei
+RESUME_VERIFY_KB = 64  # letzte N KB lokal/remote vergleichen; bei Abweichung vollständiger Transfer
+# Segmentierter Download großer Dateien über mehrere SFTP-Kanäle (nur SFTP-Modus)
+SEGMENTED_MIN_MB = 256  # Dateien ab dieser Größe segmentiert laden (0 = aus)
+SEGMENT_CHANNELS = 4  # parallele SFTP-Kanäle je segmentierter Datei
+SEGMENT_SIZE_MB = 32  # Größe eines Byte-Bereichs
+# Reihenfolge und Bandbreite
+TRANSFER_ORDER = "scan"  # "scan": Fundreihenfolge, "newest": neueste zuerst, "smallest": kleinste zuerst, "priority": nach PRIORITY_PATTERNS
+# (außer "scan" beginnen die Transfers im SFTP-Modus erst nach dem vollständigen Scan, damit die Reihenfolge global gilt)
+PRIORITY_PATTERNS = []  # für "priority": Muster (fnmatch auf relativen Pfad), frühere zuerst, z.B. ["*/linpos_*", "*.csv"]
+BANDWIDTH_LIMIT_MBPS = 0  # gemeinsame Obergrenze aller Worker, tar Streams und asyncio-Transfers in MB/s (0 = unbegrenzt)
+BANDWIDTH_CONTROL_FILE = None  # Datei mit Limit in MB/s, wird zur Laufzeit neu gelesen (SIGUSR1: sofort), z.B. "bwlimit.txt"
+BANDWIDTH_CONTROL_POLL = 5.0  # Sekunden zwischen zwei Prüfungen der Steuerdatei
+# Schreib-Pipeline: Empfang und Schreiben auf getrennten Threads (SFTP-Worker und tar Stream)
+WRITE_PIPELINE = True
+WRITE_BUFFER_KB = 256  # Größe eines wiederverwendeten Puffers
+WRITE_BUFFERS = 64  # Anzahl Puffer (begrenzt den Speicher zwischen Empfang und Schreiben)
+FSYNC_BATCH_FILES = 100  # fsync gesammelt alle N Dateien (0 = kein fsync, Umbenennen sofort)
+FSYNC_BATCH_SECONDS = 5.0  # spätestens nach dieser Zeit werden offene Dateien gesynct und umbenannt
+# Transfer-Engine für den SFTP-Modus (USE_TAR_STREAM, USE_RSYNC und HYBRID_TRANSFER = False)
+TRANSFER_ENGINE = "threads"  # "threads": paramiko-Worker-Threads, "asyncio": asyncssh auf einer Event-Loop
+ASYNC_MAX_TRANSFERS = 16  # asyncio: gleichzeitig laufende Dateitransfers
+ASYNC_MAX_REQUESTS = 128  # asyncio: SFTP-Requests gleichzeitig in Bearbeitung je Datei bzw. für Scan/Stat
+# Flotten-Modus (mehrere Hosts parallel, je Host ein Unterordner in LOCAL_BASE_DIR, z.B. "host" oder "user@host_2222")
+FLEET_HOSTS = None  # None: nur SSH_HOST; sonst Liste ["10.42.0.11", "user@10.42.0.12:2222", ...] oder Pfad zu Textdatei (ein Host pro Zeile)
+FLEET_MAX_HOSTS = 4  # Hosts gleichzeitig (je Host ein Prozess mit einer SSH-Verbindung, alle Kanäle teilen deren Transport)
+FLEET_MAX_TRANSFERS = 8  # globale Obergrenze gleichzeitiger Transfers über alle Hosts (pro Host gilt MAX_PARALLEL_TRANSFERS/TAR_STREAMS)
+# Metriken (Vergleich über Läufe und Fahrzeuge)
+METRICS_JSONL_PATH = None  # z.B. "backup_metrics.jsonl": Ereignisse als JSON-Zeilen (angehängt), am Ende eine Zusammenfassung je Lauf
+METRICS_PROM_PATH = None  # z.B. "/var/lib/node_exporter/textfile_collector/remote_backup.prom" (Flotten-Modus: je Host eine Datei)
+METRICS_SAMPLE_INTERVAL = 5.0  # Sekunden je Messpunkt der Gesamtrate (MB/s)
+METRICS_FILE_EVENTS = True  # je übertragener Datei eine JSON-Zeile (Dauer, Durchsatz, Versuche)
 # ==================================================
 
 import os
 import sys
+import asyncio
 import time
 import stat
 import threading
 import queue
 import traceback
 import getpass
-from dataclasses import dataclass
-from typing import List, Optional, Tuple, Any
+import shlex
+import re
+import hashlib
+import json
+import bisect
+import signal
+import itertools
+from fnmatch import fnmatch
+import sqlite3
+import heapq
+from dataclasses import dataclass, fields
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple, Any, Callable, Dict, Set
 
 try:
     import paramiko
@@ -64,12 +126,34 @@ except ImportError:
     print("Paramiko nicht installiert. Bitte zuerst installieren (siehe README).")
     paramiko = None  # Ermöglicht Syntaxcheck ohne Installation
 
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None  # TRANSFER_ENGINE "asyncio" dann nicht verfügbar
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # zstd im tar Stream dann nicht verfügbar
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None  # lz4 im tar Stream dann nicht verfügbar
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None  # CHECKSUM_MODE "xxh64" dann mit sha256
+
 @dataclass
 class FileTask:
     remote_path: str
     relative_path: str
     size: int
     mtime: float
+    changed: bool = False  # CHECKSUM_MODE: lokal vorhanden, Inhalt abweichend -> vollständig neu übertragen
+    listed_at: float = 0.0  # lokale Uhrzeit des Listings (Bezug der Stabilitätsprüfung)
 
 @dataclass
 class Stats:
@@ -79,6 +163,7 @@ class Stats:
     copied_bytes: int = 0
     skipped_existing_files: int = 0
     skipped_existing_bytes: int = 0
+    failed_files: int = 0  # Transfer endgültig fehlgeschlagen (Lauf endet mit Fehlerstatus)
     start_time: float = time.time()
 
     def finalize(self) -> dict:
@@ -92,6 +177,7 @@ class Stats:
             "potential_files": self.potential_files,
             "potential_mb": round(potential_mb, 2),
             "percent_of_potential": round(pct, 2),
+            "failed_files": self.failed_files,
             "file_rate_per_s": round(self.copied_files / duration, 2),
             "data_rate_mb_per_s": round(mb_copied / duration, 2),
             "duration_s": round(duration, 2),
@@ -103,6 +189,17 @@ def debug(msg: str):
         print(f"[DEBUG] {msg}")
 
 
+def resolve_password(prompt: Optional[str] = None) -> Optional[str]:
+    """SSH_PASSWORD oder, falls weder Key noch Passwort gesetzt, interaktive Abfrage."""
+    if PRIVATE_KEY_PATH or SSH_PASSWORD is not None:
+        return SSH_PASSWORD
+    try:
+        return getpass.getpass(prompt or f"SSH Passwort für {SSH_USER}@{SSH_HOST}: ")
+    except Exception:
+        print("Verdeckte Eingabe nicht möglich, Passwort wird mit Echo angezeigt:")
+        return input("Passwort: ")
+
+
 def connect_ssh() -> Tuple[Any, Any]:
     """Stellt eine SSH/SFTP Verbindung her.
 
@@ -116,13 +213,7 @@ def connect_ssh() -> Tuple[Any, Any]:
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
-    password_to_use = SSH_PASSWORD
-    if not PRIVATE_KEY_PATH and password_to_use is None:
-        try:
-            password_to_use = getpass.getpass(f"SSH Passwort für {SSH_USER}@{SSH_HOST}: ")
-        except Exception:
-            print("Verdeckte Eingabe nicht möglich, Passwort wird mit Echo angezeigt:")
-            password_to_use = input("Passwort: ")
+    password_to_use = resolve_password()
 
     try:
         if PRIVATE_KEY_PATH:
@@ -151,91 +242,558 @@ def connect_ssh() -> Tuple[Any, Any]:
         pass
     return client, sftp
 
-def run_tar_stream(client: Any, stats: Stats, tasks: List[FileTask]):
-    """Schneller Transfer via tar über SSH.
-    Erwartet bereits vorab gescannte "tasks" (scan_remote wurde in main ausgeführt).
-    Ablauf:
-      1. Chunked Liste relativer Pfade verwenden (kein erneutes Listing)
-      2. Remote tar (optional gzip) ausführen und Stream lokal entpacken
-      3. Dateien schreiben, Stats aktualisieren (ohne doppelte Skip-Zählung)
+class ChannelPump:
+    """Liest einen SSH-Kanal in einem eigenen Thread in eine begrenzte Queue.
+
+    read() stellt die Daten dateiartig für gzip/tarfile bereit, sodass Netzwerk-Lesen
+    und Entpacken/Schreiben auf getrennten Threads laufen.
     """
-    if not tasks:
-        return
-    rel_paths = [t.relative_path for t in tasks]
-    import tarfile, gzip
-    CHUNK_SIZE = 2000
-    global CURRENT_FILE
-    for i in range(0, len(rel_paths), CHUNK_SIZE):
-        chunk = rel_paths[i:i + CHUNK_SIZE]
-        tar_flag = "cf -"
-        cmd = f"cd {REMOTE_BASE_DIR} && tar {tar_flag} " + " ".join(chunk)
-        if TAR_STREAM_COMPRESS:
-            cmd += " | gzip -c"
-        transport = client.get_transport()
-        session = transport.open_session()
+
+    def __init__(self, channel: Any, max_blocks: int = 64):
+        self.q: 'queue.Queue[Optional[bytes]]' = queue.Queue(maxsize=max_blocks)
+        self.buf = b""
+        self.pos = 0
+        self.eof = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._pump, args=(channel,), daemon=True)
+        self.thread.start()
+
+    def _put(self, item: Optional[bytes]):
+        while not self.closed:
+            try:
+                self.q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _pump(self, channel: Any):
+        try:
+            while not self.closed:
+                data = channel.recv(256 * 1024)
+                if not data:
+                    break
+                BANDWIDTH.consume(len(data))
+                self._put(data)
+        finally:
+            self._put(None)
+
+    def read(self, n: int = -1) -> bytes:
+        parts = []
+        while n != 0:
+            if self.pos >= len(self.buf):
+                if self.eof:
+                    break
+                block = self.q.get()
+                if block is None:
+                    self.eof = True
+                    break
+                self.buf, self.pos = block, 0
+            avail = len(self.buf) - self.pos
+            take = avail if n < 0 else min(n, avail)
+            parts.append(self.buf[self.pos:self.pos + take])
+            self.pos += take
+            if n > 0:
+                n -= take
+        return b"".join(parts)
+
+    def close(self):
+        self.closed = True
+
+
+def partition_tasks(tasks: List[FileTask], parts: int) -> List[List[FileTask]]:
+    """Verteilt Tasks nach Größe auf parts Gruppen (größte zuerst in die jeweils kleinste Gruppe)."""
+    parts = max(1, min(parts, len(tasks)))
+    heap = [(0, i) for i in range(parts)]
+    groups: List[List[FileTask]] = [[] for _ in range(parts)]
+    for task in sorted(tasks, key=lambda t: t.size, reverse=True):
+        total, i = heapq.heappop(heap)
+        groups[i].append(task)
+        heapq.heappush(heap, (total + task.size, i))
+    for group in groups:
+        # innerhalb der Gruppe nach TRANSFER_ORDER, sonst Pfadreihenfolge (tar liest dann verzeichnisweise)
+        if TRANSFER_ORDER == "scan":
+            group.sort(key=lambda t: t.relative_path)
+        else:
+            group.sort(key=transfer_sort_key)
+    return groups
+
+
+def codec_command(codec: str) -> str:
+    """Remote-Kompressionsbefehl für den tar Stream ("" für unkomprimiert)."""
+    if codec == "none":
+        return ""
+    level = f" -{TAR_STREAM_LEVEL}" if TAR_STREAM_LEVEL > 0 else ""
+    if codec == "gzip":
+        return f"gzip -c{level}"
+    if codec == "zstd":
+        return f"zstd -c -q{level}"
+    if codec == "lz4":
+        return f"lz4 -c -q{level}"
+    raise ValueError(f"Unbekannter Codec: {codec}")
+
+
+def open_decoder(codec: str, stream: Any) -> Any:
+    """Lokale Dekompression passend zu codec_command."""
+    if codec == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=stream)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    if codec == "lz4":
+        return lz4frame.LZ4FrameFile(stream, mode="rb")
+    return stream
+
+
+def run_remote_with_file_list(client: Any, cmd: str, file_list: bytes,
+                              head_bytes: Optional[int] = 64) -> Tuple[int, float, bytes]:
+    """Führt cmd mit file_list auf stdin aus, liest stdout vollständig.
+
+    Die Ausgabe läuft über die Leitung und wird deshalb auf BANDWIDTH angerechnet.
+    Rückgabe: (gelesene Bytes, Dauer in s, die ersten head_bytes der Ausgabe bzw. alles bei None)
+    """
+    session = client.get_transport().open_session()
+    start = time.time()
+    try:
         session.exec_command(cmd)
-        stream = session.makefile("rb")
-        if TAR_STREAM_COMPRESS:
-            stream = gzip.GzipFile(fileobj=stream)
+
+        def feed_file_list():
+            session.sendall(file_list)
+            session.shutdown_write()
+
+        threading.Thread(target=feed_file_list, daemon=True).start()
+        total = 0
+        head: List[bytes] = []
+        while True:
+            data = session.recv(256 * 1024)
+            if not data:
+                break
+            BANDWIDTH.consume(len(data))
+            if head_bytes is None:
+                head.append(data)
+            elif total < head_bytes:
+                head.append(data[:head_bytes - total])
+            total += len(data)
+        session.recv_exit_status()
+    finally:
+        session.close()
+    return total, time.time() - start, b"".join(head)
+
+
+def available_codecs(client: Any) -> List[str]:
+    """Codecs, die remote als Programm und lokal als Python-Modul vorhanden sind."""
+    local = {"gzip": True, "zstd": zstandard is not None, "lz4": lz4frame is not None}
+    session = client.get_transport().open_session()
+    try:
+        session.exec_command("for c in gzip zstd lz4; do command -v $c >/dev/null 2>&1 && echo $c; done")
+        out = b""
+        while True:
+            data = session.recv(4096)
+            if not data:
+                break
+            out += data
+        session.recv_exit_status()
+    finally:
+        session.close()
+    return [c for c in out.decode("utf-8", errors="replace").split() if local.get(c)]
+
+
+def choose_codec(client: Any, tasks: List[FileTask]) -> str:
+    """Bestimmt den Codec für den tar Stream gemäß TAR_STREAM_COMPRESS/TAR_STREAM_CODEC.
+
+    Im auto-Modus wird eine Stichprobe der Dateien einmal unkomprimiert übertragen
+    (Leitungsrate B) und je Codec remote komprimiert und nur gezählt (Remote-Rate R,
+    Verhältnis V). Gewählt wird der Codec mit der höchsten effektiven Rate min(R, B * V).
+    """
+    if not TAR_STREAM_COMPRESS or TAR_STREAM_CODEC == "none":
+        return "none"
+    try:
+        codecs = available_codecs(client)
+    except Exception as e:
+        debug(f"Codec-Abfrage fehlgeschlagen: {e}")
+        codecs = ["gzip"]
+    if TAR_STREAM_CODEC != "auto":
+        if TAR_STREAM_CODEC in codecs:
+            return TAR_STREAM_CODEC
+        print(f"Codec {TAR_STREAM_CODEC} nicht verfügbar (remote oder lokal), nutze gzip.")
+        return "gzip"
+    sample: List[FileTask] = []
+    sample_bytes = 0
+    for t in sorted(tasks, key=lambda t: t.relative_path):
+        if sample_bytes >= TAR_CODEC_PROBE_MB * 1024 * 1024:
+            break
+        sample.append(t)
+        sample_bytes += t.size
+    if not sample or sample_bytes == 0:
+        return "gzip" if "gzip" in codecs else "none"
+    file_list = b"".join(f"./{t.relative_path}".encode("utf-8") + b"\0" for t in sample)
+    tar_cmd = f"cd {shlex.quote(REMOTE_BASE_DIR)} && tar --null -T - -cf -"
+    mb = 1024 * 1024
+    try:
+        raw, duration, _ = run_remote_with_file_list(client, tar_cmd, file_list)
+        link = raw / max(duration, 0.001)
+        rates = {"none": link}
+        for codec in codecs:
+            # wc -c liefert nur die komprimierte Größe zurück, die Leitung wird dabei kaum belastet
+            _, duration, out = run_remote_with_file_list(
+                client, f"{tar_cmd} | {codec_command(codec)} | wc -c", file_list)
+            compressed = max(int(out.split()[0]), 1)
+            remote_rate = raw / max(duration, 0.001)
+            rates[codec] = min(remote_rate, link * raw / compressed)
+            debug(f"Codec {codec}: Remote {remote_rate / mb:.1f} MB/s, Verhältnis {raw / compressed:.2f}")
+    except Exception as e:
+        debug(f"Codec-Messung fehlgeschlagen: {e}")
+        return "gzip" if "gzip" in codecs else "none"
+    best = max(rates, key=rates.get)
+    print(f"tar Stream Codec (auto): {best} | Leitung {link / mb:.1f} MB/s | "
+          + ", ".join(f"{c} {r / mb:.1f} MB/s" for c, r in rates.items()))
+    return best
+
+
+def run_tar_session(client: Any, stats: Stats, tasks: List[FileTask], codec: str = "gzip",
+                    received: Optional[set] = None):
+    """Eine tar-Session für eine Gruppe von Tasks; Netzwerk-Lesen läuft im ChannelPump-Thread.
+
+    Die Pfadliste geht NUL-getrennt über stdin an "tar --null -T -", damit läuft die
+    ganze Gruppe in einem einzigen Stream, unabhängig von ARG_MAX und Sonderzeichen.
+    received sammelt die relativen Pfade vollständig empfangener Dateien.
+    """
+    import tarfile
+    by_rel = {t.relative_path: t for t in tasks}
+    # "./" davor, damit Namen mit führendem "-" nicht als tar-Option gelesen werden
+    file_list = b"".join(f"./{t.relative_path}".encode("utf-8") + b"\0" for t in tasks)
+    global CURRENT_FILE
+    cmd = f"cd {shlex.quote(REMOTE_BASE_DIR)} && tar --null -T - -cf -"
+    if codec != "none":
+        cmd += f" | {codec_command(codec)}"
+    transport = client.get_transport()
+    session = transport.open_session()
+    session.exec_command(cmd)
+
+    def feed_file_list():
+        # eigener Thread: stdin kann blockieren, solange stdout noch nicht gelesen wird
+        try:
+            session.sendall(file_list)
+            session.shutdown_write()
+        except Exception as e:
+            debug(f"Fehler beim Senden der Dateiliste: {e}")
+
+    feeder = threading.Thread(target=feed_file_list, daemon=True)
+    feeder.start()
+    pump = ChannelPump(session)
+    stream = open_decoder(codec, pump)
+    try:
         tar = tarfile.open(fileobj=stream, mode="r|")
         for member in tar:
             if not member.isreg():
                 continue
-            rel_path = member.name
+            rel_path = member.name[2:] if member.name.startswith("./") else member.name
             CURRENT_FILE = rel_path
             local_path = os.path.join(LOCAL_BASE_DIR, rel_path.replace('/', os.sep))
             ensure_local_dir(os.path.dirname(local_path))
+            task = by_rel.get(rel_path)
             # Sollte normalerweise immer kopiert werden; erneuter Check nur zur Sicherheit (kein erneutes Hochzählen von skipped)
-            if not should_copy(local_path, member.size):
+            # Mit Manifest wurde die Entscheidung bereits im Scan getroffen
+            if MANIFEST is None and not (task is not None and task.changed) and not should_copy(local_path, member.size):
                 continue
             f = tar.extractfile(member)
             if f is None:
                 continue
-            with open(local_path, 'wb') as out:
-                while True:
-                    buf = f.read(1024 * 128)
-                    if not buf:
-                        break
-                    out.write(buf)
-            stats.copied_files += 1
-            stats.copied_bytes += member.size
+            member_start = time.time()
+            if MANIFEST is not None and task is not None:
+                MANIFEST.mark(task, STATE_PENDING)
+
+            done_task = FileTask(task.remote_path if task else rel_path, rel_path, member.size, member.mtime)
+
+            def finish(task=task, done=done_task):
+                if MANIFEST is not None and task is not None:
+                    MANIFEST.mark(done, STATE_DONE)
+                with STATS_LOCK:
+                    stats.copied_files += 1
+                    stats.copied_bytes += done.size
+
+            if DISK_WRITER is not None:
+                # Entpacken hier, Schreiben im Writer-Thread
+                job = DISK_WRITER.begin(local_path)
+                try:
+                    DISK_WRITER.copy(job, f)
+                except Exception:
+                    DISK_WRITER.abort(job)
+                    raise
+                DISK_WRITER.commit(job, finish)
+            else:
+                with open(local_path, 'wb') as out:
+                    while True:
+                        buf = f.read(1024 * 128)
+                        if not buf:
+                            break
+                        out.write(buf)
+                finish()
+            if received is not None:
+                received.add(rel_path)
+            if METRICS is not None:
+                METRICS.observe_file(rel_path, member.size, time.time() - member_start, via="tar")
         tar.close()
+    finally:
+        pump.close()
         stream.close()
         session.close()
 
-def run_rsync(stats: Stats):
-    """Verwendet rsync über SSH für fehlende Dateien. Erwartet rsync auf Remote und lokal."""
-    # rsync Befehl zusammenbauen
-    compress_flag = "-z" if RSYNC_COMPRESS else ""
-    delete_flag = ""  # optional
-    # Filter nach DAYS_BACK: schwer direkt in rsync -> wir nutzen vorerst komplettes Verzeichnis
-    cmd = (
-        f"{RSYNC_PATH} -av {compress_flag} --ignore-existing "
-        f"-e \"ssh -p {SSH_PORT}\" {SSH_USER}@{SSH_HOST}:{REMOTE_BASE_DIR.rstrip('/')} {LOCAL_BASE_DIR}".strip()
-    )
-    debug(f"Starte rsync: {cmd}")
-    # Ausführen
+
+def run_tar_stream(client: Any, stats: Stats, tasks: List[FileTask], codec: Optional[str] = None) -> Optional[str]:
+    """Schneller Transfer via tar über SSH.
+    Erwartet bereits vorab gescannte "tasks" (scan_remote wurde in main ausgeführt).
+    Ablauf:
+      1. Tasks nach Größe auf TAR_STREAMS Gruppen verteilen (kein erneutes Listing)
+      2. Je Gruppe eine eigene Remote tar Session (Codec gemäß TAR_STREAM_CODEC), Gruppen laufen parallel
+      3. Dateien schreiben, Stats aktualisieren (ohne doppelte Skip-Zählung)
+    Bricht ein Stream ab, wird der Fehler immer ausgegeben und die nicht empfangenen
+    Dateien zählen als fehlgeschlagen (stats.failed_files).
+    Rückgabe: verwendeter Codec (für Folgeaufrufe ohne erneute Messung)
+    """
+    if not tasks:
+        return codec
+    if codec is None:
+        start = time.time()
+        codec = choose_codec(client, tasks)
+        if METRICS is not None:
+            METRICS.add_phase("codec_probe", time.time() - start)
+    groups = partition_tasks(tasks, TAR_STREAMS)
+    debug("tar Streams: " + ", ".join(
+        f"{len(g)} Dateien/{sum(t.size for t in g) / (1024 * 1024):.1f} MB" for g in groups))
+
+    def run_group(group: List[FileTask]):
+        received: set = set()
+        try:
+            if TRANSFER_SLOTS is not None:
+                with TRANSFER_SLOTS:
+                    run_tar_session(client, stats, group, codec, received)
+            else:
+                run_tar_session(client, stats, group, codec, received)
+        except Exception as e:
+            # auch ohne PRINT_DEBUG (Flotten-Modus) sichtbar, sonst meldet der Host "ok" trotz fehlender Dateien
+            missing = [t for t in group if t.relative_path not in received]
+            print(f"Fehler im tar Stream ({len(missing)} Dateien nicht übertragen): {e}")
+            debug(traceback.format_exc())
+            record_failed(stats, missing, e)
+
+    threads = [threading.Thread(target=run_group, args=(g,), daemon=True) for g in groups]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return codec
+
+def build_rsync_command() -> List[str]:
+    """rsync-Aufruf: Dateiliste NUL-getrennt über stdin, eine Ausgabezeile pro übertragener Datei."""
+    cmd = [RSYNC_PATH, "-a", "--from0", "--files-from=-", "--out-format=>>%l\t%n",
+           "-e", f"ssh -p {SSH_PORT}"]
+    if RSYNC_COMPRESS:
+        cmd.append("-z")
+    if BANDWIDTH.rate > 0:
+        # rsync regelt selbst; Änderungen über die Steuerdatei wirken erst beim nächsten Lauf
+        cmd.append(f"--bwlimit={max(1, int(BANDWIDTH.rate / 1024))}")
+    if CHECKSUM_MODE:
+        # Liste enthält nur neue und inhaltlich abweichende Dateien: ohne Quick-Check übertragen
+        # (rsync-Delta statt Anhängen, --append würde gleich große Dateien auslassen)
+        cmd.append("--ignore-times")
+    elif RESUME_PARTIAL:
+        # wachsende Dateien wie im SFTP-Modus nur am Ende ergänzen, mit Prüfung des vorhandenen Teils
+        cmd.append("--append-verify")
+    cmd += [f"{SSH_USER}@{SSH_HOST}:{REMOTE_BASE_DIR.rstrip('/')}/", LOCAL_BASE_DIR.rstrip('/\\') + os.sep]
+    return cmd
+
+
+def run_rsync(stats: Stats, tasks: List[FileTask]):
+    """Überträgt die gescannten tasks per rsync über SSH. Erwartet rsync auf Remote und lokal.
+
+    Die Liste aus scan_remote geht über --files-from an rsync (DAYS_BACK und Skip-Prüfung
+    gelten damit wie in den anderen Modi), die --out-format-Zeilen werden laufend
+    ausgewertet und zählen copied_files/copied_bytes exakt mit. copied_bytes ist wie in
+    den anderen Modi die Dateigröße (%l), nicht die per Delta/Kompression übertragene Menge.
+    """
+    if not tasks:
+        return
     import subprocess
-    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    by_rel = {t.relative_path: t for t in tasks}
+    file_list = b"".join(t.relative_path.encode("utf-8") + b"\0" for t in tasks)
+    cmd = build_rsync_command()
+    debug("Starte rsync: " + " ".join(shlex.quote(c) for c in cmd))
+    ensure_local_dir(LOCAL_BASE_DIR)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def feed_file_list():
+        try:
+            proc.stdin.write(file_list)
+            proc.stdin.close()
+        except OSError as e:
+            debug(f"Fehler beim Senden der Dateiliste an rsync: {e}")
+
+    threading.Thread(target=feed_file_list, daemon=True).start()
     global CURRENT_FILE
-    for line in proc.stdout:
-        line = line.strip()
-        if line.endswith('/'):
+    # rsync meldet keine Zeiten je Datei: Dauer = Abstand zur vorherigen Ausgabezeile
+    last_done = time.time()
+    for raw in proc.stdout:
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        if not line.startswith(">>"):
+            if line and PRINT_DEBUG:
+                print("[RSYNC] " + line)
+            continue
+        parts = line[2:].split("\t", 1)
+        if len(parts) != 2 or parts[1].endswith('/'):
+            continue
+        try:
+            length = int(parts[0])
+        except ValueError:
             continue
-        if line and not line.startswith('sending incremental'):  # einfache Heuristik
-            CURRENT_FILE = line
-        if PRINT_DEBUG:
-            print("[RSYNC] " + line)
-    proc.wait()
-    # Nachlauf: wir können Stats aktualisieren indem wir erneut scannen und Größen vergleichen
-    _, sftp = connect_ssh()
-    tasks = scan_remote(sftp, stats)
-    sftp.close()
-    # Kopierstatistiken approximieren (Annahme: alles was jetzt fehlt ist kopiert)
-    # Diese einfache Methode wird nicht erneut schon kopierte Bytes addieren
-    # Für Genauigkeit müsste rsync Ausgabe geparst werden -> ausgelassen für erste Version
+        rel_path = parts[1]
+        CURRENT_FILE = rel_path
+        task = by_rel.get(rel_path)
+        if MANIFEST is not None and task is not None:
+            MANIFEST.mark(task, STATE_DONE)
+        record_copied(stats, STATS_LOCK, length)
+        if METRICS is not None:
+            now = time.time()
+            METRICS.observe_file(rel_path, length, now - last_done, via="rsync")
+            last_done = now
+    status = proc.wait()
+    if status != 0:
+        print(f"rsync beendet mit Exit {status} (nicht alle Dateien übertragen)")
+
+
+def transfer_sort_key(task: FileTask) -> tuple:
+    """Rang eines Tasks gemäß TRANSFER_ORDER (kleiner = früher)."""
+    if TRANSFER_ORDER == "newest":
+        return (-task.mtime,)
+    if TRANSFER_ORDER == "smallest":
+        return (task.size,)
+    if TRANSFER_ORDER == "priority":
+        rank = next((i for i, pat in enumerate(PRIORITY_PATTERNS) if fnmatch(task.relative_path, pat)),
+                    len(PRIORITY_PATTERNS))
+        return (rank, -task.mtime)
+    return (0,)
+
+
+class TaskQueue(queue.PriorityQueue):
+    """Transfer-Warteschlange, die Tasks nach transfer_sort_key ausgibt (bei gleichem Rang FIFO).
+
+    Gefüllt wird sie außer bei TRANSFER_ORDER "scan" erst nach dem Scan; die Sortierung
+    hält dann auch bei begrenzter Größe (TRANSFER_QUEUE_MAX), weil schon sortiert eingestellt wird.
+    """
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.seq = itertools.count()
+
+    def _put(self, task):
+        super()._put((transfer_sort_key(task), next(self.seq), task))
+
+    def _get(self):
+        return super()._get()[2]
+
+
+class TokenBucket:
+    """Gemeinsames Bandbreitenlimit (Token-Bucket) für alle empfangenden Threads; Rate 0 = unbegrenzt.
+
+    Zählt nebenbei alle empfangenen Bytes (received, für die Raten-Zeitreihe der Metriken).
+    """
+
+    def __init__(self, rate_mbps: float):
+        self.lock = threading.Lock()
+        self.received = 0
+        self.tokens = 0.0
+        self.last = time.time()
+        self.set_rate(rate_mbps)
+
+    def set_rate(self, rate_mbps: float):
+        with self.lock:
+            self.rate = max(0.0, rate_mbps) * 1024 * 1024
+            # bis zu 0,25 s Burst, mindestens ein Empfangsblock
+            self.capacity = max(self.rate / 4, 256 * 1024)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def note(self, n: int):
+        """Zählt n empfangene Bytes ohne Drosselung."""
+        with self.lock:
+            self.received += n
+
+    def _reserve(self, n: int) -> float:
+        """Bucht n Bytes ab, wenn genug Tokens da sind (Rückgabe 0), sonst die nötige Wartezeit in s."""
+        with self.lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= min(n, self.capacity):
+                # größere Blöcke als capacity gehen "auf Kredit"
+                self.tokens -= n
+                return 0.0
+            return (min(n, self.capacity) - self.tokens) / self.rate
+
+    def consume(self, n: int):
+        """Blockiert, bis n Bytes im Rahmen des Limits empfangen werden dürfen."""
+        self.note(n)
+        while True:
+            wait = self._reserve(n)
+            if wait <= 0:
+                return
+            # kurz schlafen, damit Änderungen der Rate schnell wirken
+            time.sleep(min(wait, 0.5))
+
+    async def consume_async(self, n: int):
+        """Wie consume für die asyncio-Engine (wartet mit asyncio.sleep statt die Loop zu blockieren)."""
+        self.note(n)
+        while True:
+            wait = self._reserve(n)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 0.5))
 
 
+BANDWIDTH = TokenBucket(BANDWIDTH_LIMIT_MBPS)
+
+
+def start_bandwidth_control():
+    """Überwacht BANDWIDTH_CONTROL_FILE; SIGUSR1 (falls vorhanden) liest die Datei sofort neu."""
+    if not BANDWIDTH_CONTROL_FILE:
+        return
+    reload_now = threading.Event()
+    last_value: List[Optional[float]] = [None]
+
+    def reload():
+        try:
+            with open(BANDWIDTH_CONTROL_FILE, "r", encoding="utf-8") as f:
+                value = float(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return
+        if value != last_value[0]:
+            last_value[0] = value
+            BANDWIDTH.set_rate(value)
+            print(f"Bandbreitenlimit: {value:g} MB/s" if value > 0 else "Bandbreitenlimit: aus")
+
+    def poll():
+        while True:
+            reload()
+            reload_now.wait(BANDWIDTH_CONTROL_POLL)
+            reload_now.clear()
+
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: reload_now.set())
+    threading.Thread(target=poll, daemon=True).start()
+
+
+class ThrottledReader:
+    """readinto-Wrapper, der empfangene Bytes gegen BANDWIDTH verbucht."""
+
+    def __init__(self, src: Any):
+        self.src = src
+
+    def readinto(self, buf: bytearray) -> int:
+        n = self.src.readinto(buf)
+        if n:
+            BANDWIDTH.consume(n)
+        return n
+
 
 def is_excluded(name: str) -> bool:
     lname = name.lower()
@@ -245,10 +803,340 @@ def is_excluded(name: str) -> bool:
     return False
 
 
-def scan_remote(sftp: Any, stats: Stats) -> List[FileTask]:
-    cutoff = time.time() - DAYS_BACK * 86400
+MANIFEST_SCHEMA_VERSION = "1"
+STATE_PENDING = "pending"  # Transfer begonnen, lokale Datei evtl. unvollständig
+STATE_DONE = "done"
 
-    tasks: List[FileTask] = []
+
+class Manifest:
+    """Lokales Manifest der gesicherten Dateien (relativer Pfad, Größe, mtime, Zustand).
+
+    Alle Einträge werden beim Öffnen mit einer Abfrage geladen; die Skip-Entscheidung
+    im Scan kommt damit ohne os.path.exists/getsize pro Datei aus. Nur Dateien ohne
+    Eintrag werden noch im Dateisystem geprüft und dabei nachgetragen.
+    Vor jedem Transfer wird "pending", danach "done" vermerkt. Ein nach einem Absturz
+    liegengebliebenes "pending" führt im nächsten Lauf zu einem erneuten Transfer;
+    wird die Datei dort nicht mehr übertragen, ist ihre .part verwaist (stale_pending).
+    """
+
+    def __init__(self, path: str):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is None or row[0] != MANIFEST_SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS hashes; DELETE FROM meta;")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS files (rel_path TEXT PRIMARY KEY, remote_path TEXT,
+                                                               size INTEGER, mtime REAL, state TEXT)""")
+        # Prüfsummen-Cache (CHECKSUM_MODE): je Seite gültig, solange (Größe, mtime) gleich bleiben
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS hashes (rel_path TEXT PRIMARY KEY, algo TEXT,
+                                                                local_size INTEGER, local_mtime_ns INTEGER, local_digest TEXT,
+                                                                remote_size INTEGER, remote_mtime REAL, remote_digest TEXT)""")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'remote_base'").fetchone()
+        if row is None or row[0] != REMOTE_BASE_DIR.rstrip('/'):
+            with self.conn:
+                self.conn.execute("DELETE FROM files")
+                self.conn.execute("DELETE FROM hashes")
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('remote_base', ?)",
+                                  (REMOTE_BASE_DIR.rstrip('/'),))
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)",
+                                  (MANIFEST_SCHEMA_VERSION,))
+        self.entries: Dict[str, Tuple[int, str]] = {
+            rel_path: (size, state) for rel_path, size, state in
+            self.conn.execute("SELECT rel_path, size, state FROM files")
+        }
+        self.hashes: Dict[str, Tuple[str, int, int, str, int, float, str]] = {
+            row[0]: tuple(row[1:]) for row in self.conn.execute("SELECT * FROM hashes")
+        }
+        self.uncommitted = 0
+        self.pending_at_open = {rel_path for rel_path, (_, state) in self.entries.items() if state == STATE_PENDING}
+        self.touched: set = set()  # in diesem Lauf vermerkte Pfade
+        debug(f"Manifest {path}: {len(self.entries)} Einträge, {len(self.pending_at_open)} unvollständig aus letztem Lauf")
+
+    def is_done(self, rel_path: str, size: int) -> Optional[bool]:
+        """True: vollständig gesichert, False: (erneut) kopieren, None: unbekannt."""
+        with self.lock:
+            entry = self.entries.get(rel_path)
+        if entry is None:
+            return None
+        local_size, state = entry
+        if state != STATE_DONE:
+            return False
+        return abs(local_size - size) <= SIZE_TOLERANCE_BYTES or local_size >= size
+
+    def mark(self, task: FileTask, state: str):
+        with self.lock:
+            self.touched.add(task.relative_path)
+            self.entries[task.relative_path] = (task.size, state)
+            self.conn.execute("INSERT OR REPLACE INTO files (rel_path, remote_path, size, mtime, state) "
+                              "VALUES (?, ?, ?, ?, ?)",
+                              (task.relative_path, task.remote_path, task.size, task.mtime, state))
+            self.uncommitted += 1
+            if self.uncommitted >= MANIFEST_COMMIT_EVERY:
+                self.conn.commit()
+                self.uncommitted = 0
+
+    def stale_pending(self) -> List[str]:
+        """Pfade, die ein früherer Lauf unvollständig hinterließ und dieser Lauf nicht angefasst hat."""
+        with self.lock:
+            return [rel_path for rel_path in self.pending_at_open if rel_path not in self.touched]
+
+    def cached_hash(self, rel_path: str) -> Optional[Tuple[str, int, int, str, int, float, str]]:
+        """(algo, local_size, local_mtime_ns, local_digest, remote_size, remote_mtime, remote_digest) oder None."""
+        with self.lock:
+            return self.hashes.get(rel_path)
+
+    def store_hash(self, rel_path: str, entry: Tuple[str, int, int, str, int, float, str]):
+        with self.lock:
+            self.hashes[rel_path] = entry
+            self.conn.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (rel_path,) + entry)
+            self.uncommitted += 1
+            if self.uncommitted >= MANIFEST_COMMIT_EVERY:
+                self.conn.commit()
+                self.uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+MANIFEST: Optional[Manifest] = None  # in main geöffnet, falls USE_MANIFEST
+
+
+def remove_stale_parts():
+    """Löscht verwaiste <name>.part (laut Manifest), nur nach einem vollständig gelaufenen Backup.
+
+    Nach einem abgebrochenen Lauf bleiben sie für RESUME_PARTIAL liegen. Ohne Manifest
+    werden sie erst beim nächsten Transfer derselben Datei wiederverwendet oder überschrieben.
+    """
+    if MANIFEST is None:
+        return
+    removed = 0
+    for rel_path in MANIFEST.stale_pending():
+        try:
+            os.remove(os.path.join(LOCAL_BASE_DIR, rel_path.replace('/', os.sep)) + ".part")
+            removed += 1
+        except OSError:
+            continue
+    if removed:
+        debug(f"{removed} verwaiste .part-Dateien gelöscht")
+
+
+def default_manifest_path() -> str:
+    return MANIFEST_PATH or os.path.join(LOCAL_BASE_DIR, ".backup_manifest.sqlite")
+
+
+STATS_LOCK = threading.Lock()  # schützt Stats bei parallelem Scan und Transfer
+SCAN_SEEN: Optional[Set[str]] = None  # während des Scans bereits gemeldete Pfade (Fortsetzung nach abgebrochenem find)
+
+CHECKSUM_COMMANDS = {"sha256": "sha256sum", "xxh64": "xxhsum -H1"}
+CHECKSUM_LINE = re.compile(r"^([0-9a-fA-F]+) [ *](.*)$")
+
+
+def hash_file(path: str, algo: str) -> str:
+    h = xxhash.xxh64() if algo == "xxh64" else hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ChecksumVerifier:
+    """Inhaltsvergleich für Dateien, die laut Größe schon vorhanden sind (CHECKSUM_MODE).
+
+    add_candidate hält diese Dateien während des Scans zurück. Danach werden die
+    Remote-Prüfsummen in einem einzigen Befehl (xargs -0 sha256sum bzw. xxhsum) über die
+    gesammelte Liste berechnet, parallel dazu die lokalen. Beide Seiten werden im
+    Manifest je (Größe, mtime) zwischengespeichert und nur nach einer Änderung neu
+    berechnet. Nur abweichende Dateien gehen als changed-Task weiter; ohne Ergebnis
+    (Datei verschwunden, Befehl fehlt) bleibt es beim Größenvergleich.
+    """
+
+    def __init__(self, algo: str):
+        if algo not in CHECKSUM_COMMANDS:
+            print(f"CHECKSUM_MODE {algo!r} unbekannt, nutze sha256.")
+            algo = "sha256"
+        elif algo == "xxh64" and xxhash is None:
+            print("xxhash (Python) nicht installiert, Prüfsummen mit sha256.")
+            algo = "sha256"
+        self.algo = algo
+        self.lock = threading.Lock()
+        self.held: List[FileTask] = []
+
+    def hold(self, task: FileTask):
+        with self.lock:
+            self.held.append(task)
+
+    def take(self) -> List[FileTask]:
+        with self.lock:
+            held, self.held = self.held, []
+        return held
+
+    def _cached(self, rel_path: str) -> Optional[Tuple[str, int, int, str, int, float, str]]:
+        entry = MANIFEST.cached_hash(rel_path) if MANIFEST is not None else None
+        return entry if entry is not None and entry[0] == self.algo else None
+
+    def needs_remote(self, held: List[FileTask]) -> List[FileTask]:
+        """Dateien, deren Remote-Prüfsumme nicht für die aktuelle (Größe, mtime) im Cache liegt."""
+        need = []
+        for task in held:
+            entry = self._cached(task.relative_path)
+            if entry is None or (entry[4], entry[5]) != (task.size, task.mtime):
+                need.append(task)
+        return need
+
+    def remote_command(self, tasks: List[FileTask]) -> Tuple[str, bytes]:
+        """(Befehl, NUL-getrennte Pfadliste für stdin); "./" wie bei tar gegen Namen mit führendem "-"."""
+        file_list = b"".join(f"./{t.relative_path}".encode("utf-8") + b"\0" for t in tasks)
+        return f"cd {shlex.quote(REMOTE_BASE_DIR)} && xargs -0 {CHECKSUM_COMMANDS[self.algo]}", file_list
+
+    @staticmethod
+    def parse(output: bytes) -> Dict[str, str]:
+        """Ausgabe "digest  ./pfad" je Zeile -> {relativer Pfad: digest}; Zeilen mit "\\" am Anfang sind escaped (GNU)."""
+        result = {}
+        for line in output.decode("utf-8", errors="replace").split("\n"):
+            escaped = line.startswith("\\")
+            match = CHECKSUM_LINE.match(line[1:] if escaped else line)
+            if not match:
+                continue
+            name = match.group(2)
+            if escaped:
+                name = re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), name)
+            result[name[2:] if name.startswith("./") else name] = match.group(1).lower()
+        return result
+
+    def local_digests(self, held: List[FileTask]) -> Dict[str, Tuple[int, int, str]]:
+        """{relativer Pfad: (Größe, mtime_ns, digest)} der lokalen Dateien, aus dem Cache wenn unverändert."""
+        result = {}
+        for task in held:
+            local_path = os.path.join(LOCAL_BASE_DIR, task.relative_path.replace('/', os.sep))
+            try:
+                st = os.stat(local_path)
+                entry = self._cached(task.relative_path)
+                if entry is not None and (entry[1], entry[2]) == (st.st_size, st.st_mtime_ns):
+                    digest = entry[3]
+                else:
+                    digest = hash_file(local_path, self.algo)
+            except OSError as e:
+                debug(f"Lokale Prüfsumme nicht möglich {local_path}: {e}")
+                continue
+            result[task.relative_path] = (st.st_size, st.st_mtime_ns, digest)
+        return result
+
+    def resolve(self, stats: Stats, held: List[FileTask], remote: Dict[str, str],
+                local: Dict[str, Tuple[int, int, str]], remote_hashed: int, start: float) -> List[FileTask]:
+        """Zählt gleiche Dateien als vorhanden, gibt abweichende als changed-Tasks zurück (für emit)."""
+        changed: List[FileTask] = []
+        unknown = 0
+        for task in held:
+            digest = remote.get(task.relative_path)
+            if digest is None:
+                entry = self._cached(task.relative_path)
+                if entry is not None and (entry[4], entry[5]) == (task.size, task.mtime):
+                    digest = entry[6]
+            local_entry = local.get(task.relative_path)
+            if digest is None or local_entry is None:
+                unknown += 1
+            elif digest != local_entry[2]:
+                debug(f"Inhalt abweichend: {task.remote_path}")
+                task.changed = True
+                changed.append(task)
+            if digest is not None and local_entry is not None and MANIFEST is not None:
+                MANIFEST.store_hash(task.relative_path, (self.algo,) + local_entry + (task.size, task.mtime, digest))
+            if not task.changed:
+                with STATS_LOCK:
+                    stats.skipped_existing_files += 1
+                    stats.skipped_existing_bytes += task.size
+        with STATS_LOCK:
+            stats.potential_files += len(changed)
+            stats.potential_bytes += sum(t.size for t in changed)
+        print(f"Prüfsummen ({self.algo}): {len(held)} vorhandene Dateien, {remote_hashed} remote berechnet, "
+              f"{len(changed)} abweichend, {unknown} ohne Ergebnis (Größenvergleich), Dauer {time.time() - start:.2f} s")
+        if remote_hashed and len(remote) == 0:
+            print(f"Remote keine Prüfsummen erhalten ({CHECKSUM_COMMANDS[self.algo]} verfügbar?)")
+        if METRICS is not None:
+            METRICS.add_phase("checksum", time.time() - start)
+        return changed
+
+
+VERIFIER: Optional[ChecksumVerifier] = None  # in run_backup angelegt, falls CHECKSUM_MODE
+
+
+def verify_checksums(client: Any, stats: Stats, emit: Callable[[FileTask], None]):
+    """Prüft die von add_candidate zurückgehaltenen Dateien (Remote per exec, lokal gleichzeitig)."""
+    held = VERIFIER.take()
+    if not held:
+        return
+    start = time.time()
+    need = VERIFIER.needs_remote(held)
+    remote: Dict[str, str] = {}
+
+    def fetch_remote():
+        try:
+            cmd, file_list = VERIFIER.remote_command(need)
+            _, _, output = run_remote_with_file_list(client, cmd, file_list, head_bytes=None)
+            remote.update(VERIFIER.parse(output))
+        except Exception as e:
+            debug(f"Remote-Prüfsummen fehlgeschlagen: {e}")
+
+    fetcher = threading.Thread(target=fetch_remote, daemon=True)
+    if need and client is not None:
+        fetcher.start()
+    local = VERIFIER.local_digests(held)
+    if fetcher.is_alive():
+        fetcher.join()
+    for task in VERIFIER.resolve(stats, held, remote, local, len(need), start):
+        emit(task)
+
+
+def add_candidate(emit: Callable[[FileTask], None], stats: Stats, remote_path: str, rel_path: str, size: int,
+                  mtime: float):
+    """Lokale Prüfung und ggf. Übergabe einer entfernten Datei an emit (z.B. list.append oder Queue.put)."""
+    if SCAN_SEEN is not None:
+        with STATS_LOCK:
+            if rel_path in SCAN_SEEN:
+                return
+            SCAN_SEEN.add(rel_path)
+    task = FileTask(remote_path=remote_path, relative_path=rel_path, size=size, mtime=mtime, listed_at=time.time())
+    done = MANIFEST.is_done(rel_path, size) if MANIFEST is not None else None
+    if done is None:
+        # Ohne Manifest-Eintrag: Dateisystem prüfen, vorhandene Dateien ins Manifest übernehmen
+        local_path = os.path.join(LOCAL_BASE_DIR, rel_path.replace('/', os.sep))
+        done = False
+        try:
+            lsize = os.path.getsize(local_path)
+            done = abs(lsize - size) <= SIZE_TOLERANCE_BYTES or lsize >= size
+            if done and MANIFEST is not None:
+                MANIFEST.mark(FileTask(remote_path, rel_path, lsize, mtime), STATE_DONE)
+        except OSError:
+            pass
+    if done:
+        if VERIFIER is not None:
+            # Größe passt: Inhalt wird nach dem Scan gesammelt per Prüfsumme verglichen
+            VERIFIER.hold(task)
+            return
+        with STATS_LOCK:
+            stats.skipped_existing_files += 1
+            stats.skipped_existing_bytes += size
+        return
+    with STATS_LOCK:
+        stats.potential_files += 1
+        stats.potential_bytes += size
+    emit(task)
+
+
+def scan_remote_sftp(sftp: Any, stats: Stats, emit: Callable[[FileTask], None]):
+    """Rekursives Listing per SFTP (ein listdir_attr Roundtrip pro Verzeichnis)."""
+    cutoff = time.time() - DAYS_BACK * 86400
 
     def walk(remote_dir: str, rel_prefix: str = ""):
         try:
@@ -270,73 +1158,953 @@ def scan_remote(sftp: Any, stats: Stats) -> List[FileTask]:
                 mtime = entry.st_mtime
                 size = entry.st_size
                 if mtime >= cutoff:
-                    rel_path = f"{rel_prefix}{name}"
-                    # Lokale Prüfung vor Aufnahme in Liste
-                    local_path = os.path.join(LOCAL_BASE_DIR, rel_path.replace('/', os.sep))
-                    take = True
-                    if os.path.exists(local_path):
-                        try:
-                            lsize = os.path.getsize(local_path)
-                            if abs(lsize - size) <= SIZE_TOLERANCE_BYTES or lsize >= size:
-                                take = False
-                                stats.skipped_existing_files += 1
-                                stats.skipped_existing_bytes += size
-                        except Exception:
-                            pass
-                    if take:
-                        tasks.append(FileTask(remote_path=remote_path, relative_path=rel_path, size=size, mtime=mtime))
-                        stats.potential_files += 1
-                        stats.potential_bytes += size
+                    add_candidate(emit, stats, remote_path, f"{rel_prefix}{name}", size, mtime)
             else:
                 continue
 
     walk(REMOTE_BASE_DIR.rstrip('/'))
-    return tasks
 
 
-def file_in_use(sftp: Any, remote_path: str, initial_size: int) -> bool:
-    try:
-        time.sleep(SECONDS_STABILITY_CHECK)
-        st = sftp.stat(remote_path)
-        return st.st_size != initial_size
-    except IOError:
-        return False
+def scan_remote_sftp_parallel(client: Any, stats: Stats, emit: Callable[[FileTask], None], channels: int):
+    """Breitensuche über mehrere SFTP-Kanäle auf dem Transport von client.
 
+    Jeder Scan-Thread nutzt eine eigene SFTP-Session und holt
+    Verzeichnisse aus einer gemeinsamen Warteschlange. Gefundene Dateien gehen
+    sofort an emit, sodass der Transfer schon während des Listings beginnen kann.
+    """
+    cutoff = time.time() - DAYS_BACK * 86400
+    dirs: 'queue.Queue[Optional[Tuple[str, str]]]' = queue.Queue()
+    pending = [1]  # Verzeichnisse in Warteschlange oder in Bearbeitung
+    pending_lock = threading.Lock()
+    dirs.put((REMOTE_BASE_DIR.rstrip('/'), ""))
 
-def ensure_local_dir(path: str):
-    os.makedirs(path, exist_ok=True)
+    def scan_worker(thread_sftp: Any):
+        while True:
+            item = dirs.get()
+            if item is None:
+                return
+            remote_dir, rel_prefix = item
+            try:
+                scan_dir(thread_sftp, remote_dir, rel_prefix)
+            except Exception as e:
+                # z.B. sqlite3-Fehler aus MANIFEST.mark: Verzeichnis abbrechen, Thread bleibt für die Queue aktiv
+                debug(f"Fehler beim Scan {remote_dir}: {e}")
+            finally:
+                # immer herunterzählen, sonst warten die übrigen Threads ewig auf dirs.get()
+                with pending_lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    for _ in range(channels):
+                        dirs.put(None)
 
+    def scan_dir(thread_sftp: Any, remote_dir: str, rel_prefix: str):
+        try:
+            entries = thread_sftp.listdir_attr(remote_dir)
+        except IOError as e:
+            debug(f"Kann Verzeichnis nicht lesen: {remote_dir} ({e})")
+            return
+        except Exception as e:
+            debug(f"Fehler beim Listing {remote_dir}: {e}")
+            return
+        for entry in entries:
+            name = entry.filename
+            if is_excluded(name):
+                continue
+            mode = entry.st_mode
+            remote_path = f"{remote_dir}/{name}" if not remote_dir.endswith('/') else f"{remote_dir}{name}"
+            if stat.S_ISDIR(mode):
+                if stat.S_ISLNK(mode) and not FOLLOW_SYMLINKS:
+                    continue
+                with pending_lock:
+                    pending[0] += 1
+                dirs.put((remote_path, f"{rel_prefix}{name}/"))
+            elif stat.S_ISREG(mode) and entry.st_mtime >= cutoff:
+                add_candidate(emit, stats, remote_path, f"{rel_prefix}{name}", entry.st_size, entry.st_mtime)
 
-def should_copy(local_path: str, remote_size: int) -> bool:
-    if not os.path.exists(local_path):
-        return True
+    sessions = []
+    threads = []
     try:
-        local_size = os.path.getsize(local_path)
-    except OSError:
-        return True
-    # Kopieren nur wenn lokale Datei deutlich kleiner ist (Toleranz beachten)
-    if local_size >= remote_size:
-        return False
-    if abs(local_size - remote_size) <= SIZE_TOLERANCE_BYTES:
-        return False
-    return True
+        for _ in range(channels):
+            sessions.append(client.open_sftp())
+        for thread_sftp in sessions:
+            th = threading.Thread(target=scan_worker, args=(thread_sftp,), daemon=True)
+            th.start()
+            threads.append(th)
+        for th in threads:
+            th.join()
+    finally:
+        for thread_sftp in sessions:
+            try:
+                thread_sftp.close()
+            except Exception:
+                pass
 
 
-def create_sftp_session() -> Any:
-    """Erzeugt neue SFTP Session auf bestehender SSH Verbindung (Transport wird geteilt)."""
-    # Diese Funktion erwartet, dass ein globaler Client existiert
-    global _GLOBAL_SSH_CLIENT
-    transport = _GLOBAL_SSH_CLIENT.get_transport()
-    return paramiko.SFTPClient.from_transport(transport)
+def build_find_command(cutoff: float) -> str:
+    """Remote-Befehl für das Inventar: eine Zeile pro Datei "Größe<TAB>mtime<TAB>relativer Pfad<NUL>"."""
+    follow = "-L " if FOLLOW_SYMLINKS else ""
+    base = shlex.quote(REMOTE_BASE_DIR.rstrip('/') or '/')
+    return f"find {follow}{base} -type f -newermt @{int(cutoff)} -printf '%s\\t%T@\\t%P\\0'"
 
 
-CURRENT_FILE = None  # global für Statusanzeige
-_STOP_STATUS = False
+def handle_find_record(rec: bytes, cutoff: float, base: str, stats: Stats, emit: Callable[[FileTask], None]) -> int:
+    """Verarbeitet einen Datensatz von build_find_command; Rückgabe 1, wenn er gültig aufgebaut war."""
+    parts = rec.decode("utf-8", errors="replace").split("\t", 2)
+    if len(parts) != 3:
+        return 0
+    try:
+        size = int(parts[0])
+        mtime = float(parts[1])
+    except ValueError:
+        return 1
+    rel_path = parts[2]
+    if mtime < cutoff or any(is_excluded(part) for part in rel_path.split('/')):
+        return 1
+    add_candidate(emit, stats, f"{base}/{rel_path}", rel_path, size, mtime)
+    return 1
 
-def _format_status(stats: Stats) -> str:
-    remaining_files = max(stats.potential_files - stats.copied_files, 0)
-    pct_files = (stats.copied_files / stats.potential_files * 100) if stats.potential_files else 0.0
-    duration = max(time.time() - stats.start_time, 0.001)
+
+def scan_remote_find(client: Any, stats: Stats, emit: Callable[[FileTask], None]) -> bool:
+    """Inventar über einen einzigen Remote-Befehl (GNU find -printf), Ausgabe wird gestreamt geparst.
+
+    Rückgabe False, wenn der Befehl auf dem Remote nicht nutzbar ist (dann SFTP-Fallback).
+    Bricht find nach den ersten Datensätzen ab, folgt RuntimeError (Teilinventar).
+    """
+    cutoff = time.time() - DAYS_BACK * 86400
+    base = REMOTE_BASE_DIR.rstrip('/')
+    records = 0
+    stderr_tail = b""
+    session = client.get_transport().open_session()
+    try:
+        session.exec_command(build_find_command(cutoff))
+        pending = b""
+        while True:
+            data = session.recv(65536)
+            while session.recv_stderr_ready():
+                stderr_tail = (stderr_tail + session.recv_stderr(4096))[-2048:]
+            if not data:
+                break
+            pending += data
+            *complete, pending = pending.split(b"\0")
+            for rec in complete:
+                records += handle_find_record(rec, cutoff, base, stats, emit)
+        status = session.recv_exit_status()
+        while session.recv_stderr_ready():
+            stderr_tail = (stderr_tail + session.recv_stderr(4096))[-2048:]
+    finally:
+        session.close()
+    if status != 0:
+        msg = stderr_tail.decode("utf-8", errors="replace").strip()
+        if records == 0:
+            debug(f"Remote find nicht nutzbar (Exit {status}): {msg}")
+            return False
+        raise RuntimeError(f"Exit {status}: {msg}")
+    return True
+
+
+def scan_remote(sftp: Any, stats: Stats, client: Any = None,
+                emit: Optional[Callable[[FileTask], None]] = None) -> List[FileTask]:
+    """Ermittelt die zu kopierenden Dateien gemäß SCAN_MODE und meldet die Scan-Dauer.
+
+    Ist emit gesetzt, wird jede gefundene Datei sofort zusätzlich an emit übergeben
+    (z.B. Queue.put der Transfer-Worker), noch während der Scan läuft.
+    Bricht find mittendrin ab, ergänzt der SFTP-Scan die noch nicht gemeldeten Pfade.
+    """
+    global SCAN_SEEN
+    start = time.time()
+    tasks: List[FileTask] = []
+
+    def collect(task: FileTask):
+        tasks.append(task)
+        if emit is not None:
+            emit(task)
+
+    done = False
+    partial = False
+    mode = "sftp"
+    try:
+        if client is not None and SCAN_MODE in ("auto", "find"):
+            SCAN_SEEN = set()
+            try:
+                done = scan_remote_find(client, stats, collect)
+            except Exception as e:
+                print(f"Remote find abgebrochen nach {len(SCAN_SEEN)} Dateien: {e}")
+                # Bereits gemeldete Dateien (übergeben, übersprungen, zurückgehalten) lassen sich nicht
+                # zurücknehmen -> SFTP-Scan ergänzt nur die fehlenden Pfade (Dedup über SCAN_SEEN)
+                partial = bool(SCAN_SEEN)
+            if done:
+                mode = "find"
+                SCAN_SEEN = None
+            elif partial:
+                mode = "find+sftp"
+            elif SCAN_MODE == "find":
+                raise RuntimeError("SCAN_MODE 'find' angefordert, Remote-Befehl aber nicht nutzbar.")
+            else:
+                # Noch nichts gemeldet: SFTP-Scan beginnt ohne Abgleich neu
+                SCAN_SEEN = None
+        if not done:
+            if SCAN_PARALLEL_CHANNELS > 1 and client is not None:
+                mode = f"{mode} x{SCAN_PARALLEL_CHANNELS}"
+                scan_remote_sftp_parallel(client, stats, collect, SCAN_PARALLEL_CHANNELS)
+            else:
+                scan_remote_sftp(sftp, stats, collect)
+    finally:
+        SCAN_SEEN = None
+    if VERIFIER is not None:
+        verify_checksums(client, stats, collect)
+    print(f"Scan ({mode}): {len(tasks)} Kandidaten, {stats.skipped_existing_files} bereits vorhanden, "
+          f"Dauer {time.time() - start:.2f} s")
+    if METRICS is not None:
+        METRICS.add_phase("scan", time.time() - start)
+    return tasks
+
+
+def resume_base(task: FileTask, local_path: str) -> Optional[Tuple[str, int]]:
+    """Lokaler Anfang, an den angehängt werden kann: (Pfad, Größe) oder None.
+
+    Bevorzugt die <name>.part eines abgebrochenen Versuchs, sonst die lokal kürzere Datei.
+    """
+    for path in (local_path + ".part", local_path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if 0 < size < task.size:
+            return path, size
+    return None
+
+
+def resume_transfer(sftp: Any, task: FileTask, local_path: str,
+                    on_done: Optional[Callable[[int], None]] = None) -> Optional[int]:
+    """Hängt nur den fehlenden Teil einer lokal kürzeren Datei an.
+
+    Vorher werden die letzten RESUME_VERIFY_KB der lokalen Datei mit demselben
+    Bereich der entfernten Datei verglichen; stimmen sie nicht überein (Datei
+    wurde neu geschrieben statt verlängert), wird None zurückgegeben und der
+    Aufrufer kopiert vollständig. Rückgabe sonst: Anzahl angehängter Bytes.
+    Angehängt wird an <name>.part (eine kürzere fertige Datei wird dorthin
+    umbenannt), danach wird umbenannt; mit DISK_WRITER übernimmt das der Writer
+    und ruft anschließend on_done(Bytes) auf.
+    """
+    base = resume_base(task, local_path)
+    if base is None:
+        return None
+    base_path, local_size = base
+    window = min(RESUME_VERIFY_KB * 1024, local_size)
+    with open(base_path, 'rb') as f:
+        f.seek(local_size - window)
+        local_tail = f.read(window)
+    temp_path = local_path + ".part"
+    with sftp.open(task.remote_path, 'rb') as rf:
+        rf.seek(local_size - window)
+        remote_tail = b""
+        while len(remote_tail) < window:
+            buf = rf.read(window - len(remote_tail))
+            if not buf:
+                break
+            remote_tail += buf
+        if remote_tail != local_tail:
+            debug(f"Fortsetzen nicht möglich (Inhalt abweichend), vollständiger Transfer: {task.remote_path}")
+            return None
+        # Position steht jetzt bei local_size; prefetch liest ab dort parallel voraus
+        rf.prefetch(task.size)
+        if base_path != temp_path:
+            os.replace(base_path, temp_path)
+        if DISK_WRITER is not None:
+            job = DISK_WRITER.begin(local_path, append=True)
+            try:
+                appended = DISK_WRITER.copy(job, ThrottledReader(rf))
+            except Exception:
+                DISK_WRITER.abort(job, keep=True)
+                raise
+            DISK_WRITER.commit(job, (lambda: on_done(appended)) if on_done is not None else None)
+        else:
+            appended = 0
+            with open(temp_path, 'ab') as out:
+                while True:
+                    buf = rf.read(1024 * 128)
+                    if not buf:
+                        break
+                    BANDWIDTH.consume(len(buf))
+                    out.write(buf)
+                    appended += len(buf)
+            os.replace(temp_path, local_path)
+    debug(f"Fortgesetzt ab {local_size} Bytes: {task.remote_path} (+{appended} Bytes)")
+    return appended
+
+
+def segmented_transfer(task: FileTask, local_path: str) -> int:
+    """Lädt eine große Datei in Byte-Bereichen parallel über mehrere SFTP-Kanäle.
+
+    Die Bereiche werden per positioniertem Schreiben in eine vorab auf volle Größe
+    angelegte Temp-Datei (<name>.part) geschrieben. Erst wenn alle Bereiche
+    vollständig angekommen sind, wird die Temp-Datei an ihren Platz umbenannt;
+    bei einem Fehler bleibt die bisherige lokale Datei unverändert.
+    Rückgabe: Anzahl übertragener Bytes.
+    """
+    segment = max(1, SEGMENT_SIZE_MB) * 1024 * 1024
+    ranges: 'queue.Queue[Tuple[int, int]]' = queue.Queue()
+    for offset in range(0, task.size, segment):
+        ranges.put((offset, min(segment, task.size - offset)))
+    tmp_path = local_path + ".part"
+    with open(tmp_path, 'wb') as f:
+        f.truncate(task.size)
+    errors: List[Exception] = []
+
+    def fetch_ranges(thread_sftp: Any):
+        with open(tmp_path, 'r+b') as out:
+            fd = out.fileno()
+            while not errors:
+                try:
+                    offset, length = ranges.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with thread_sftp.open(task.remote_path, 'rb') as rf:
+                        rf.seek(offset)
+                        rf.prefetch(offset + length)
+                        pos = offset
+                        end = offset + length
+                        while pos < end:
+                            buf = rf.read(min(1024 * 128, end - pos))
+                            if not buf:
+                                raise IOError(f"Unerwartetes Dateiende bei {pos} von {task.remote_path}")
+                            BANDWIDTH.consume(len(buf))
+                            if hasattr(os, "pwrite"):
+                                os.pwrite(fd, buf, pos)
+                            else:
+                                out.seek(pos)
+                                out.write(buf)
+                            pos += len(buf)
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+    channels = max(1, min(SEGMENT_CHANNELS, ranges.qsize()))
+    sessions = []
+    try:
+        for _ in range(channels):
+            sessions.append(create_sftp_session())
+        threads = [threading.Thread(target=fetch_ranges, args=(sess,), daemon=True) for sess in sessions]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    finally:
+        for sess in sessions:
+            try:
+                sess.close()
+            except Exception:
+                pass
+    if errors:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise errors[0]
+    os.replace(tmp_path, local_path)
+    return task.size
+
+
+def remote_time_offset(client: Any) -> float:
+    """Abweichung der Remote-Uhr von der lokalen Uhr in Sekunden (0, falls nicht ermittelbar)."""
+    if client is None:
+        return 0.0
+    try:
+        session = client.get_transport().open_session()
+        try:
+            local_before = time.time()
+            session.exec_command("date +%s")
+            out = b""
+            while True:
+                data = session.recv(256)
+                if not data:
+                    break
+                out += data
+            local_now = (local_before + time.time()) / 2
+        finally:
+            session.close()
+        return float(out.strip()) - local_now
+    except Exception as e:
+        debug(f"Remote-Uhrzeit nicht ermittelbar, nutze lokale Uhr: {e}")
+        return 0.0
+
+
+def restat_remote(client: Any, sftp: Any, tasks: List[FileTask]) -> Dict[str, Tuple[int, int]]:
+    """Ermittelt Größe und mtime (ganze Sekunden) aller tasks in einem Remote-Befehl.
+
+    Fehlt GNU stat auf dem Remote, wird pro Datei sftp.stat genutzt (ohne Wartezeit).
+    Rückgabe: relativer Pfad -> (Größe, mtime); gelöschte Dateien fehlen.
+    """
+    result: Dict[str, Tuple[int, int]] = {}
+    if client is not None:
+        file_list = b"".join(f"./{t.relative_path}".encode("utf-8") + b"\0" for t in tasks)
+        cmd = f"cd {shlex.quote(REMOTE_BASE_DIR)} && xargs -0 -r stat -L --printf '%s\\t%Y\\t%n\\0' --"
+        session = client.get_transport().open_session()
+        try:
+            session.exec_command(cmd)
+
+            def feed_file_list():
+                session.sendall(file_list)
+                session.shutdown_write()
+
+            threading.Thread(target=feed_file_list, daemon=True).start()
+            out = b""
+            while True:
+                data = session.recv(65536)
+                if not data:
+                    break
+                out += data
+            session.recv_exit_status()
+        finally:
+            session.close()
+        for rec in out.split(b"\0"):
+            parts = rec.decode("utf-8", errors="replace").split("\t", 2)
+            if len(parts) != 3:
+                continue
+            try:
+                rel_path = parts[2][2:] if parts[2].startswith("./") else parts[2]
+                result[rel_path] = (int(parts[0]), int(parts[1]))
+            except ValueError:
+                continue
+        if result or not tasks:
+            return result
+        debug("Remote stat ohne Ergebnis, prüfe per SFTP")
+    for t in tasks:
+        try:
+            st = sftp.stat(t.remote_path)
+            result[t.relative_path] = (st.st_size, int(st.st_mtime))
+        except IOError:
+            continue
+    return result
+
+
+class StabilityGate:
+    """Sammelt die Stabilitätsprüfung aller Kandidaten statt einer Wartezeit pro Datei.
+
+    Dateien, deren mtime zum Zeitpunkt des Listings (task.listed_at, Remote-Uhr) älter
+    als SECONDS_STABILITY_CHECK war, gehen sofort an emit; die Zeit zwischen Inventar
+    und offer (tar, rsync, hybrid) zählt nicht als Stabilität. Jüngere werden zurückgehalten; settle() wartet einmal, prüft sie
+    gesammelt erneut (restat_remote) und gibt nur unveränderte Dateien weiter.
+    """
+
+    def __init__(self, emit: Callable[[FileTask], None], stats: Stats, clock_offset: float):
+        self.emit = emit
+        self.stats = stats
+        self.clock_offset = clock_offset
+        self.held: List[FileTask] = []
+        self.last_held_at = 0.0
+        self.lock = threading.Lock()
+
+    def offer(self, task: FileTask):
+        listed_at = task.listed_at or time.time()
+        if listed_at + self.clock_offset - task.mtime >= SECONDS_STABILITY_CHECK:
+            self.emit(task)
+            return
+        with self.lock:
+            self.held.append(task)
+            self.last_held_at = max(self.last_held_at, listed_at)
+
+    def take_held(self) -> Tuple[List[FileTask], float]:
+        """Entnimmt die zurückgehaltenen Dateien; Rückgabe: (Dateien, verbleibende Wartezeit in s)."""
+        with self.lock:
+            held, self.held = self.held, []
+        return held, max(0.0, self.last_held_at + SECONDS_STABILITY_CHECK - time.time())
+
+    def settle(self, client: Any, sftp: Any) -> int:
+        """Prüft zurückgehaltene Dateien; Rückgabe: Anzahl verworfener (in Benutzung) Dateien."""
+        held, wait = self.take_held()
+        if not held:
+            return 0
+        start = time.time()
+        if wait > 0:
+            time.sleep(wait)
+        dropped = self.apply_restat(held, restat_remote(client, sftp, held))
+        if METRICS is not None:
+            METRICS.add_phase("stability", time.time() - start)
+        return dropped
+
+    def apply_restat(self, held: List[FileTask], current: Dict[str, Tuple[int, int]]) -> int:
+        """Gibt unveränderte Dateien an emit weiter, zählt veränderte aus der Statistik heraus."""
+        dropped = 0
+        for task in held:
+            if current.get(task.relative_path) == (task.size, int(task.mtime)):
+                self.emit(task)
+                continue
+            debug(f"Übersprungen (in Benutzung): {task.remote_path}")
+            dropped += 1
+            with STATS_LOCK:
+                self.stats.potential_files -= 1
+                self.stats.potential_bytes -= task.size
+        debug(f"Stabilitätsprüfung: {len(held)} junge Dateien, {dropped} in Benutzung")
+        return dropped
+
+
+class WriteJob:
+    """Eine lokale Zieldatei in der Schreib-Pipeline (geschrieben wird in <name>.part).
+
+    append: an eine vorhandene <name>.part anhängen (Fortsetzen) statt sie neu anzulegen.
+    """
+
+    def __init__(self, local_path: str, append: bool = False):
+        self.local_path = local_path
+        self.temp_path = local_path + ".part"
+        self.append = append
+        self.keep = False  # abort: .part für einen späteren Fortsetzen-Versuch behalten
+        self.settled = threading.Event()  # abort vom Writer verarbeitet
+        self.file: Optional[Any] = None
+        self.error: Optional[Exception] = None
+        self.on_done: Optional[Callable[[], None]] = None
+
+
+class DiskWriter:
+    """Entkoppelt Netzwerk-Empfang und Schreiben auf die (langsame) lokale Karte.
+
+    Empfangende Threads füllen Puffer aus einem festen Pool und reichen sie an einen
+    einzigen Writer-Thread weiter. Fertige Dateien werden gesammelt per fsync gesichert
+    und erst danach von <name>.part auf den endgültigen Namen umbenannt, sodass
+    should_copy nie eine halbe Datei als vollständig sieht. on_done (Manifest,
+    Statistik) läuft nach dem Umbenennen im Writer-Thread. Ein abgebrochener Download
+    kann seine .part behalten, resume_transfer setzt dort fort.
+    Gemessen wird, wie lange Empfänger auf freie Puffer und der Writer auf Daten wartet.
+    """
+
+    def __init__(self):
+        self.free: 'queue.Queue[bytearray]' = queue.Queue()
+        for _ in range(max(1, WRITE_BUFFERS)):
+            self.free.put(bytearray(WRITE_BUFFER_KB * 1024))
+        self.ops: 'queue.Queue[Tuple[str, Optional[WriteJob], Any, int]]' = queue.Queue()
+        self.synced: List[WriteJob] = []  # geschlossen, warten auf fsync + Umbenennen
+        self.first_unsynced = 0.0
+        self.metrics_lock = threading.Lock()
+        self.recv_blocked = 0.0
+        self.writer_idle = 0.0
+        self.write_time = 0.0
+        self.fsync_time = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # --- Empfangsseite ---
+    def begin(self, local_path: str, append: bool = False) -> WriteJob:
+        job = WriteJob(local_path, append)
+        self.ops.put(("open", job, None, 0))
+        return job
+
+    def copy(self, job: WriteJob, src: Any) -> int:
+        """Liest src (readinto) in Pool-Puffer und reicht sie an den Writer; Rückgabe: Bytes."""
+        total = 0
+        while True:
+            t0 = time.time()
+            buf = self.free.get()
+            waited = time.time() - t0
+            with self.metrics_lock:
+                self.recv_blocked += waited
+            try:
+                n = src.readinto(buf)
+            except BaseException:
+                self.free.put(buf)
+                raise
+            if not n:
+                self.free.put(buf)
+                return total
+            self.ops.put(("write", job, buf, n))
+            total += n
+
+    def commit(self, job: WriteJob, on_done: Optional[Callable[[], None]] = None):
+        job.on_done = on_done
+        self.ops.put(("commit", job, None, 0))
+
+    def abort(self, job: WriteJob, keep: bool = False):
+        """Verwirft die Datei; mit keep bleibt das bisher Geschriebene als .part liegen.
+
+        Mit keep wird gewartet, bis der Writer die .part geschlossen hat (danach kann
+        resume_transfer ihre Größe lesen).
+        """
+        job.keep = keep
+        self.ops.put(("abort", job, None, 0))
+        if keep:
+            job.settled.wait()
+
+    def close(self):
+        """Schreibt alles Ausstehende, synct und benennt um; beendet den Writer-Thread."""
+        self.ops.put(("close", None, None, 0))
+        self.thread.join()
+
+    def report(self) -> str:
+        return (f"Schreib-Pipeline: Empfang wartete {self.recv_blocked:.2f} s auf Puffer, "
+                f"Writer wartete {self.writer_idle:.2f} s auf Daten, schrieb {self.write_time:.2f} s, "
+                f"fsync {self.fsync_time:.2f} s")
+
+    # --- Writer-Thread ---
+    def _run(self):
+        while True:
+            t0 = time.time()
+            try:
+                kind, job, buf, n = self.ops.get(timeout=0.5)
+            except queue.Empty:
+                self.writer_idle += time.time() - t0
+                self._sync_if_due()
+                continue
+            self.writer_idle += time.time() - t0
+            if kind == "close":
+                self._sync_all()
+                return
+            t0 = time.time()
+            try:
+                self._handle(kind, job, buf, n)
+            except Exception as e:
+                # der Thread muss weiterlaufen, sonst warten alle Empfänger ewig auf freie Puffer
+                print(f"Schreib-Pipeline Fehler ({kind} {job.local_path}): {e}")
+                job.error = job.error or e
+                self._discard(job)
+            finally:
+                if kind == "write":
+                    self.free.put(buf)
+                elif kind == "abort":
+                    job.settled.set()
+            self.write_time += time.time() - t0
+            self._sync_if_due()
+
+    def _handle(self, kind: str, job: WriteJob, buf: Any, n: int):
+        if kind == "open":
+            try:
+                job.file = open(job.temp_path, 'ab' if job.append else 'wb')
+            except OSError as e:
+                job.error = e
+        elif kind == "write":
+            if job.file is not None and job.error is None:
+                try:
+                    job.file.write(memoryview(buf)[:n])
+                except OSError as e:
+                    job.error = e
+        elif kind == "commit":
+            if job.error is not None:
+                print(f"Schreibfehler {job.local_path}: {job.error}")
+                self._discard(job)
+            elif FSYNC_BATCH_FILES > 0:
+                if not self.synced:
+                    self.first_unsynced = time.time()
+                self.synced.append(job)
+            elif self._close(job, sync=False):
+                self._finish(job)
+        elif kind == "abort":
+            if job.keep and job.error is None and job.file is not None:
+                # geschrieben wird streng fortlaufend: die .part ist ein gültiger Anfang der Datei
+                if not self._close(job, sync=False):
+                    debug(f"Teildatei verworfen: {job.temp_path}")
+            else:
+                self._discard(job)
+
+    def _close(self, job: WriteJob, sync: bool) -> bool:
+        """Schreibt den Puffer (und ggf. fsync) und schließt; bei Fehler wird die .part verworfen."""
+        try:
+            job.file.flush()
+            if sync:
+                os.fsync(job.file.fileno())
+            job.file.close()
+        except OSError as e:
+            print(f"Schreibfehler {job.local_path}: {e}")
+            job.error = e
+            self._discard(job)
+            return False
+        return True
+
+    def _discard(self, job: WriteJob):
+        if job.file is not None:
+            try:
+                job.file.close()
+            except OSError:
+                pass  # z.B. erneut volle Karte beim Leeren des Puffers
+        try:
+            os.remove(job.temp_path)
+        except OSError:
+            pass
+
+    def _finish(self, job: WriteJob):
+        try:
+            os.replace(job.temp_path, job.local_path)
+        except OSError as e:
+            print(f"Umbenennen fehlgeschlagen {job.temp_path}: {e}")
+            self._discard(job)
+            return
+        if job.on_done is not None:
+            try:
+                job.on_done()
+            except Exception as e:
+                print(f"Abschluss fehlgeschlagen {job.local_path}: {e}")
+
+    def _sync_if_due(self):
+        if self.synced and (len(self.synced) >= FSYNC_BATCH_FILES
+                            or time.time() - self.first_unsynced >= FSYNC_BATCH_SECONDS):
+            self._sync_all()
+
+    def _sync_all(self):
+        jobs, self.synced = self.synced, []
+        t0 = time.time()
+        done = [job for job in jobs if self._close(job, sync=True)]
+        self.fsync_time += time.time() - t0
+        for job in done:
+            self._finish(job)
+
+
+DISK_WRITER: Optional[DiskWriter] = None  # in run_backup gestartet, falls WRITE_PIPELINE
+
+
+def pipelined_download(sftp: Any, task: FileTask, local_path: str, on_done: Callable[[], None]):
+    """Vollständiger Download über DISK_WRITER (statt sftp.get mit Schreiben im selben Thread)."""
+    job = DISK_WRITER.begin(local_path)
+    try:
+        with sftp.open(task.remote_path, 'rb') as rf:
+            rf.prefetch(task.size)
+            DISK_WRITER.copy(job, ThrottledReader(rf))
+    except Exception:
+        # der nächste Versuch setzt an der .part fort (RESUME_PARTIAL)
+        DISK_WRITER.abort(job, keep=RESUME_PARTIAL)
+        raise
+    DISK_WRITER.commit(job, on_done)
+
+
+def ensure_local_dir(path: str):
+    os.makedirs(path, exist_ok=True)
+
+
+def should_copy(local_path: str, remote_size: int) -> bool:
+    if not os.path.exists(local_path):
+        return True
+    try:
+        local_size = os.path.getsize(local_path)
+    except OSError:
+        return True
+    # Kopieren nur wenn lokale Datei deutlich kleiner ist (Toleranz beachten)
+    if local_size >= remote_size:
+        return False
+    if abs(local_size - remote_size) <= SIZE_TOLERANCE_BYTES:
+        return False
+    return True
+
+
+def create_sftp_session() -> Any:
+    """Erzeugt neue SFTP Session auf bestehender SSH Verbindung (Transport wird geteilt)."""
+    # Diese Funktion erwartet, dass ein globaler Client existiert
+    global _GLOBAL_SSH_CLIENT
+    transport = _GLOBAL_SSH_CLIENT.get_transport()
+    return paramiko.SFTPClient.from_transport(transport)
+
+
+FILE_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+FILE_MB_PER_S_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Histogramm mit festen Obergrenzen (le) wie bei Prometheus."""
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # letzter Eintrag: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        result = []
+        total = 0
+        for bound, n in zip([f"{b:g}" for b in self.bounds] + ["+Inf"], self.counts):
+            total += n
+            result.append((bound, total))
+        return result
+
+    def to_dict(self) -> dict:
+        return {"buckets": dict(self.cumulative()), "sum": round(self.sum, 3), "count": self.count}
+
+
+def transfer_mode() -> str:
+    if USE_RSYNC:
+        return "rsync"
+    if HYBRID_TRANSFER:
+        return "hybrid"
+    if USE_TAR_STREAM:
+        return "tar"
+    return "sftp-asyncio" if TRANSFER_ENGINE == "asyncio" else "sftp"
+
+
+class Metrics:
+    """Messwerte eines Laufs: Phasendauern, Dauer und Durchsatz je Datei, Wiederholungen, Rate über die Zeit.
+
+    Ereignisse gehen laufend als JSON-Zeilen nach METRICS_JSONL_PATH (jede Zeile mit
+    host und run), close() schreibt eine Zusammenfassung dorthin und ein Prometheus-
+    Textfile nach METRICS_PROM_PATH. Phasen können sich überlappen (im SFTP-Modus
+    laufen Scan und Transfer gleichzeitig), mehrfach gemeldete Phasen werden addiert.
+    """
+
+    def __init__(self, stats: Stats):
+        self.stats = stats
+        self.host = SSH_HOST
+        self.start = time.time()
+        self.run_id = f"{SSH_HOST}-{time.strftime('%Y%m%dT%H%M%S', time.localtime(self.start))}"
+        self.lock = threading.Lock()
+        self.phases: Dict[str, float] = {}
+        self.pipeline: Dict[str, float] = {}
+        self.file_seconds = Histogram(FILE_SECONDS_BUCKETS)
+        self.file_mb_per_s = Histogram(FILE_MB_PER_S_BUCKETS)
+        self.retries = 0
+        self.failed_files = 0
+        self.rate_series: List[Tuple[float, float, float]] = []  # (s seit Start, MB/s empfangen, MB/s fertig kopiert)
+        self.last_sample = (self.start, BANDWIDTH.received, 0)
+        # zeilengepuffert: jede Zeile ein write, mehrere Host-Prozesse können in dieselbe Datei anhängen
+        self.out = open(METRICS_JSONL_PATH, "a", encoding="utf-8", buffering=1) if METRICS_JSONL_PATH else None
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self.sampler.start()
+        self.event("start", mode=transfer_mode(), remote_dir=REMOTE_BASE_DIR, days_back=DAYS_BACK)
+
+    def event(self, kind: str, **values: Any):
+        if self.out is None:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "host": self.host, "run": self.run_id, "event": kind, **values},
+                          ensure_ascii=False)
+        with self.lock:
+            self.out.write(line + "\n")
+
+    def add_phase(self, name: str, seconds: float):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.event("phase", phase=name, seconds=round(seconds, 3))
+
+    def observe_file(self, rel_path: str, nbytes: int, seconds: float, attempts: int = 1, via: str = ""):
+        mb_per_s = nbytes / (1024 * 1024) / max(seconds, 0.000001)
+        with self.lock:
+            self.file_seconds.observe(seconds)
+            self.file_mb_per_s.observe(mb_per_s)
+        if METRICS_FILE_EVENTS:
+            self.event("file", path=rel_path, bytes=nbytes, seconds=round(seconds, 4), mb_per_s=round(mb_per_s, 2),
+                       attempts=attempts, via=via)
+
+    def count_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def count_failure(self, rel_path: str, error: Any):
+        with self.lock:
+            self.failed_files += 1
+        self.event("failed", path=rel_path, error=str(error))
+
+    def record_pipeline(self, writer: 'DiskWriter'):
+        self.pipeline = {"recv_blocked": writer.recv_blocked, "writer_idle": writer.writer_idle,
+                         "write": writer.write_time, "fsync": writer.fsync_time}
+
+    def _sample(self):
+        """Messpunkt der Gesamtrate: empfangen (Netz, bei tar komprimiert) und fertig kopiert (nach Schreiben/fsync)."""
+        now = time.time()
+        received = BANDWIDTH.received
+        with STATS_LOCK:
+            copied = self.stats.copied_bytes
+            files = self.stats.copied_files
+        last_t, last_received, last_copied = self.last_sample
+        elapsed = max(now - last_t, 0.001) * 1024 * 1024
+        point = (round(now - self.start, 1), round((received - last_received) / elapsed, 2),
+                 round((copied - last_copied) / elapsed, 2))
+        self.last_sample = (now, received, copied)
+        with self.lock:
+            self.rate_series.append(point)
+        self.event("rate", t=point[0], recv_mb_per_s=point[1], copied_mb_per_s=point[2],
+                   copied_files=files, copied_bytes=copied)
+
+    def _sample_loop(self):
+        while not self.stopped.wait(METRICS_SAMPLE_INTERVAL):
+            self._sample()
+
+    def close(self, error: Optional[str] = None):
+        """Beendet die Messung und schreibt Zusammenfassung und Prometheus-Textfile."""
+        self.stopped.set()
+        self.sampler.join(timeout=2)
+        self._sample()
+        results = self.stats.finalize()
+        results["duration_s"] = round(time.time() - self.start, 2)
+        peak = max((recv for _, recv, _ in self.rate_series), default=0.0)
+        self.event("summary", ok=error is None, error=error, results=results,
+                   phases={k: round(v, 3) for k, v in self.phases.items()},
+                   pipeline_s={k: round(v, 3) for k, v in self.pipeline.items()},
+                   retries=self.retries, failed_files=self.failed_files, peak_mb_per_s=peak,
+                   file_seconds=self.file_seconds.to_dict(), file_mb_per_s=self.file_mb_per_s.to_dict(),
+                   rate_series=self.rate_series)
+        if self.out is not None:
+            self.out.close()
+        if METRICS_PROM_PATH:
+            try:
+                self.write_prometheus(results, peak, error is None)
+            except OSError as e:
+                print(f"Prometheus-Textfile nicht geschrieben: {e}")
+
+    def write_prometheus(self, results: dict, peak: float, ok: bool):
+        """Schreibt alle Werte atomar (temporäre Datei + Umbenennen) für den node_exporter textfile collector."""
+        host = self.host.replace("\\", "\\\\").replace('"', '\\"')
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]):
+            lines.append(f"# HELP remote_backup_{name} {help_text}")
+            lines.append(f"# TYPE remote_backup_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f'remote_backup_{name}{{host="{host}"{labels}}} {round(value, 3)}')
+
+        def histogram(name: str, help_text: str, hist: Histogram):
+            lines.append(f"# HELP remote_backup_{name} {help_text}")
+            lines.append(f"# TYPE remote_backup_{name} histogram")
+            for bound, n in hist.cumulative():
+                lines.append(f'remote_backup_{name}_bucket{{host="{host}",le="{bound}"}} {n}')
+            lines.append(f'remote_backup_{name}_sum{{host="{host}"}} {round(hist.sum, 3)}')
+            lines.append(f'remote_backup_{name}_count{{host="{host}"}} {hist.count}')
+
+        metric("success", "gauge", "1 wenn der letzte Lauf ohne Abbruch endete", [("", 1 if ok else 0)])
+        metric("last_run_timestamp_seconds", "gauge", "Startzeit des letzten Laufs", [("", int(self.start))])
+        metric("duration_seconds", "gauge", "Gesamtdauer des letzten Laufs", [("", results["duration_s"])])
+        metric("phase_seconds", "gauge", "Dauer je Phase (Phasen können sich überlappen)",
+               [(f',phase="{k}"', round(v, 3)) for k, v in sorted(self.phases.items())])
+        if self.pipeline:
+            metric("pipeline_seconds", "gauge", "Wartezeiten und Arbeitszeit der Schreib-Pipeline",
+                   [(f',kind="{k}"', round(v, 3)) for k, v in sorted(self.pipeline.items())])
+        metric("files", "gauge", "Dateien im letzten Lauf",
+               [(',state="potential"', self.stats.potential_files), (',state="copied"', self.stats.copied_files),
+                (',state="skipped"', self.stats.skipped_existing_files), (',state="failed"', self.failed_files)])
+        metric("bytes", "gauge", "Bytes im letzten Lauf",
+               [(',state="potential"', self.stats.potential_bytes), (',state="copied"', self.stats.copied_bytes),
+                (',state="skipped"', self.stats.skipped_existing_bytes)])
+        metric("retries", "gauge", "Wiederholte Transferversuche im letzten Lauf", [("", self.retries)])
+        metric("rate_mb_per_s", "gauge", "Datenrate im letzten Lauf (peak: höchster Messpunkt der Empfangsrate)",
+               [(',stat="mean"', results["data_rate_mb_per_s"]), (',stat="peak"', peak)])
+        histogram("file_duration_seconds", "Übertragungsdauer je Datei", self.file_seconds)
+        histogram("file_throughput_mb_per_s", "Durchsatz je Datei in MB/s", self.file_mb_per_s)
+        temp_path = f"{METRICS_PROM_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, METRICS_PROM_PATH)
+
+
+METRICS: Optional[Metrics] = None  # in run_backup angelegt, falls METRICS_JSONL_PATH oder METRICS_PROM_PATH
+
+
+def open_metrics(stats: Stats) -> Optional[Metrics]:
+    if not (METRICS_JSONL_PATH or METRICS_PROM_PATH):
+        return None
+    try:
+        return Metrics(stats)
+    except OSError as e:
+        print(f"Metriken nicht nutzbar: {e}")
+        return None
+
+
+CURRENT_FILE = None  # global für Statusanzeige
+_STOP_STATUS = False
+TRANSFER_SLOTS = None  # im Flotten-Modus: prozessübergreifende Semaphore (FLEET_MAX_TRANSFERS)
+
+def _format_status(stats: Stats) -> str:
+    remaining_files = max(stats.potential_files - stats.copied_files, 0)
+    pct_files = (stats.copied_files / stats.potential_files * 100) if stats.potential_files else 0.0
+    duration = max(time.time() - stats.start_time, 0.001)
     data_mb = stats.copied_bytes / (1024*1024)
     rate_mb_s = data_mb / duration
     rate_files_s = stats.copied_files / duration
@@ -361,21 +2129,49 @@ def status_loop(stats: Stats):
     else:
         print(final)
 
-def worker(sftp: Any, q: 'queue.Queue[FileTask]', stats: Stats, lock: threading.Lock):
+def record_failed(stats: Stats, tasks: List[FileTask], error: Any):
+    """Zählt endgültig fehlgeschlagene Tasks in stats und den Metriken."""
+    with STATS_LOCK:
+        stats.failed_files += len(tasks)
+    if METRICS is not None:
+        for task in tasks:
+            METRICS.count_failure(task.relative_path, error)
+
+
+def record_copied(stats: Stats, lock: threading.Lock, transferred_bytes: int):
+    """Zählt eine fertig kopierte Datei und gibt alle LOG_EVERY_N_FILES Dateien den Fortschritt aus."""
+    with lock:
+        stats.copied_files += 1
+        stats.copied_bytes += transferred_bytes
+        pct_files = (stats.copied_files / stats.potential_files * 100) if stats.potential_files else 0.0
+        pct_bytes = (stats.copied_bytes / stats.potential_bytes * 100) if stats.potential_bytes else 0.0
+        duration = max(time.time() - stats.start_time, 0.001)
+        current_rate_mb_s = (stats.copied_bytes / (1024 * 1024)) / duration
+        if stats.copied_files % LOG_EVERY_N_FILES == 0 or stats.copied_files == stats.potential_files:
+            print(
+                f"Fortschritt: {stats.copied_files}/{stats.potential_files} Dateien "
+                f"({pct_files:.2f}%) | Volumen: {stats.copied_bytes / (1024*1024):.2f}/"
+                f"{stats.potential_bytes / (1024*1024):.2f} MB ({pct_bytes:.2f}%) | Gesamt Rate: {current_rate_mb_s:.2f} MB/s | "
+                f"Übersprungen (vorhanden): {stats.skipped_existing_files}"
+            )
+
+
+def worker(sftp: Any, q: 'queue.Queue[FileTask]', stats: Stats, lock: threading.Lock,
+           scan_done: Optional[threading.Event] = None):
     while True:
         try:
             task = q.get(timeout=1)
         except queue.Empty:
-            return
+            # Solange der Scan noch läuft, kann weiterer Nachschub kommen
+            if scan_done is None or scan_done.is_set():
+                return
+            continue
         remote_path = task.remote_path
         local_path = os.path.join(LOCAL_BASE_DIR, task.relative_path.replace('/', os.sep))
         local_dir = os.path.dirname(local_path)
         ensure_local_dir(local_dir)
-        if not should_copy(local_path, task.size):
-            q.task_done()
-            continue
-        if file_in_use(sftp, remote_path, task.size):
-            debug(f"Übersprungen (in Benutzung): {remote_path}")
+        # Mit Manifest wurde die Entscheidung bereits im Scan getroffen, kein erneuter Dateisystem-Check
+        if MANIFEST is None and not task.changed and not should_copy(local_path, task.size):
             q.task_done()
             continue
         def do_transfer():
@@ -384,20 +2180,54 @@ def worker(sftp: Any, q: 'queue.Queue[FileTask]', stats: Stats, lock: threading.
             last_print = 0.0
             last_bytes = 0
             retry = 0
+            transferred_bytes = 0
             current_sftp = sftp
+            deferred = False
             global CURRENT_FILE
             CURRENT_FILE = remote_path
+            if MANIFEST is not None:
+                MANIFEST.mark(task, STATE_PENDING)
+
+            # task als Default binden: finish läuft bei der Schreib-Pipeline erst nach dem nächsten q.get
+            def finish(task: FileTask = task, nbytes: Optional[int] = None):
+                if MANIFEST is not None:
+                    MANIFEST.mark(task, STATE_DONE)
+                record_copied(stats, lock, transferred_bytes if nbytes is None else nbytes)
+
+            via = "sftp"
             while retry <= MAX_RETRIES_PER_FILE:
                 transferred_error = None
                 try:
+                    received = [0]
+
                     def progress_callback(transferred: int, total: int = task.size):
-                        # Einzeldatei Fortschritt ausgeblendet für Single-Line Status
-                        return
-                    current_sftp.get(remote_path, local_path, callback=progress_callback)
+                        # Einzeldatei Fortschritt ausgeblendet für Single-Line Status, nur Bandbreitenlimit
+                        BANDWIDTH.consume(transferred - received[0])
+                        received[0] = transferred
+                    # Auch nach einem abgebrochenen Versuch wird ab dem bereits geschriebenen Teil (.part) fortgesetzt
+                    appended = (resume_transfer(current_sftp, task, local_path, lambda n: finish(nbytes=n))
+                                if RESUME_PARTIAL and not task.changed else None)
+                    if appended is not None:
+                        transferred_bytes = appended
+                        via = "resume"
+                        deferred = DISK_WRITER is not None
+                    elif SEGMENTED_MIN_MB > 0 and task.size >= SEGMENTED_MIN_MB * 1024 * 1024:
+                        transferred_bytes = segmented_transfer(task, local_path)
+                        via = "segmented"
+                    elif DISK_WRITER is not None:
+                        # Zählen und Manifest erst, wenn der Writer die Datei umbenannt hat
+                        transferred_bytes = task.size
+                        pipelined_download(current_sftp, task, local_path, finish)
+                        deferred = True
+                    else:
+                        current_sftp.get(remote_path, local_path, callback=progress_callback)
+                        transferred_bytes = task.size
                     break
                 except Exception as e:
                     transferred_error = e
                     retry += 1
+                    if METRICS is not None:
+                        METRICS.count_retry()
                     debug(f"Fehler Transfer Versuch {retry} für {remote_path}: {e}")
                     if "Garbage packet" in str(e):
                         try:
@@ -414,99 +2244,681 @@ def worker(sftp: Any, q: 'queue.Queue[FileTask]', stats: Stats, lock: threading.
                 if transferred_error and retry > MAX_RETRIES_PER_FILE:
                     raise transferred_error
 
-            with lock:
-                stats.copied_files += 1
-                stats.copied_bytes += task.size
-                pct_files = (stats.copied_files / stats.potential_files * 100) if stats.potential_files else 0.0
-                pct_bytes = (stats.copied_bytes / stats.potential_bytes * 100) if stats.potential_bytes else 0.0
-                duration = max(time.time() - stats.start_time, 0.001)
-                current_rate_mb_s = (stats.copied_bytes / (1024 * 1024)) / duration
-                if stats.copied_files % LOG_EVERY_N_FILES == 0 or stats.copied_files == stats.potential_files:
-                    print(
-                        f"Fortschritt: {stats.copied_files}/{stats.potential_files} Dateien "
-                        f"({pct_files:.2f}%) | Volumen: {stats.copied_bytes / (1024*1024):.2f}/"
-                        f"{stats.potential_bytes / (1024*1024):.2f} MB ({pct_bytes:.2f}%) | Gesamt Rate: {current_rate_mb_s:.2f} MB/s | "
-                        f"Übersprungen (vorhanden): {stats.skipped_existing_files}"
-                    )
+            if METRICS is not None:
+                # bei der Schreib-Pipeline ohne Wartezeit auf fsync/Umbenennen
+                METRICS.observe_file(task.relative_path, transferred_bytes, time.time() - start_file, retry + 1, via)
+            if not deferred:
+                finish()
 
         try:
-            do_transfer()
+            if TRANSFER_SLOTS is not None:
+                with TRANSFER_SLOTS:
+                    do_transfer()
+            else:
+                do_transfer()
         except Exception as e:
             debug(f"Fehler beim Kopieren {remote_path}: {e}\n{traceback.format_exc()}")
+            record_failed(stats, [task], e)
         finally:
             q.task_done()
 
 
-def main():
-    stats = Stats()
-    start_wall = time.time()
+async def async_scan_find(conn: Any, stats: Stats, emit: Callable[[FileTask], None]) -> bool:
+    """Wie scan_remote_find, aber über asyncssh; Rückgabe False, wenn find remote nicht nutzbar ist.
+
+    Bricht find nach den ersten Datensätzen ab, folgt RuntimeError (Teilinventar).
+    """
+    cutoff = time.time() - DAYS_BACK * 86400
+    base = REMOTE_BASE_DIR.rstrip('/')
+    records = 0
+    async with conn.create_process(build_find_command(cutoff), encoding=None) as process:
+        pending = b""
+        while True:
+            data = await process.stdout.read(65536)
+            if not data:
+                break
+            pending += data
+            *complete, pending = pending.split(b"\0")
+            for rec in complete:
+                records += handle_find_record(rec, cutoff, base, stats, emit)
+        await process.wait()
+        status = process.exit_status
+    if status != 0:
+        if records == 0:
+            debug(f"Remote find nicht nutzbar (Exit {status})")
+            return False
+        raise RuntimeError(f"Exit {status}")
+    return True
+
+
+async def async_scan_sftp(sftp: Any, stats: Stats, emit: Callable[[FileTask], None]):
+    """Listing aller Verzeichnisse gleichzeitig auf einem SFTP-Kanal (begrenzt durch ASYNC_MAX_REQUESTS)."""
+    cutoff = time.time() - DAYS_BACK * 86400
+    limit = asyncio.Semaphore(max(1, ASYNC_MAX_REQUESTS))
+
+    async def walk(remote_dir: str, rel_prefix: str):
+        try:
+            async with limit:
+                entries = await sftp.readdir(remote_dir)
+        except (OSError, asyncssh.Error) as e:
+            debug(f"Kann Verzeichnis nicht lesen: {remote_dir} ({e})")
+            return
+        subdirs = []
+        for entry in entries:
+            name = entry.filename
+            if name in (".", "..") or is_excluded(name):
+                continue
+            mode = entry.attrs.permissions or 0
+            remote_path = f"{remote_dir}/{name}" if not remote_dir.endswith('/') else f"{remote_dir}{name}"
+            if stat.S_ISDIR(mode):
+                subdirs.append(walk(remote_path, f"{rel_prefix}{name}/"))
+            elif stat.S_ISREG(mode) and entry.attrs.mtime >= cutoff:
+                add_candidate(emit, stats, remote_path, f"{rel_prefix}{name}", entry.attrs.size, entry.attrs.mtime)
+        if subdirs:
+            await asyncio.gather(*subdirs)
+
+    await walk(REMOTE_BASE_DIR.rstrip('/'), "")
+
+
+async def async_restat(sftp: Any, tasks: List[FileTask]) -> Dict[str, Tuple[int, int]]:
+    """Gleichzeitige sftp.stat-Aufrufe für alle tasks (Gegenstück zu restat_remote)."""
+    limit = asyncio.Semaphore(max(1, ASYNC_MAX_REQUESTS))
+    result: Dict[str, Tuple[int, int]] = {}
+
+    async def restat(task: FileTask):
+        try:
+            async with limit:
+                attrs = await sftp.stat(task.remote_path)
+            result[task.relative_path] = (attrs.size, int(attrs.mtime))
+        except (OSError, asyncssh.Error):
+            pass
+
+    await asyncio.gather(*(restat(t) for t in tasks))
+    return result
+
+
+ASYNC_BLOCK_SIZE = 256 * 1024  # Größe eines SFTP-Requests der asyncio-Engine
+
+
+def async_read_block() -> int:
+    """Bytes je read der asyncio-Engine: alle parallelen Requests einmal, bei Limit höchstens ein Burst.
+
+    asyncssh teilt jeden read auf ASYNC_MAX_REQUESTS Requests auf, der Speicherbedarf
+    bleibt unabhängig von der Dateigröße.
+    """
+    block = ASYNC_BLOCK_SIZE * max(1, ASYNC_MAX_REQUESTS)
+    if BANDWIDTH.rate > 0:
+        block = max(ASYNC_BLOCK_SIZE, min(block, int(BANDWIDTH.capacity)))
+    return block
+
+
+async def async_throttled_get(sftp: Any, task: FileTask, local_path: str) -> int:
+    """Vollständiger Download mit Drosselung über BANDWIDTH (statt sftp.get); Rückgabe: Bytes."""
+    async with sftp.open(task.remote_path, 'rb', block_size=ASYNC_BLOCK_SIZE,
+                         max_requests=ASYNC_MAX_REQUESTS) as rf:
+        offset = 0
+        with open(local_path, 'wb') as out:
+            while True:
+                data = await rf.read(async_read_block(), offset)
+                if not data:
+                    break
+                await BANDWIDTH.consume_async(len(data))
+                out.write(data)
+                offset += len(data)
+    return offset
+
+
+async def async_resume(sftp: Any, task: FileTask, local_path: str) -> Optional[int]:
+    """Wie resume_transfer (ohne Schreib-Pipeline): an <name>.part anhängen, dann umbenennen."""
+    base = resume_base(task, local_path)
+    if base is None:
+        return None
+    base_path, local_size = base
+    window = min(RESUME_VERIFY_KB * 1024, local_size)
+    with open(base_path, 'rb') as f:
+        f.seek(local_size - window)
+        local_tail = f.read(window)
+    temp_path = local_path + ".part"
+    async with sftp.open(task.remote_path, 'rb', block_size=ASYNC_BLOCK_SIZE,
+                         max_requests=ASYNC_MAX_REQUESTS) as rf:
+        if await rf.read(window, local_size - window) != local_tail:
+            debug(f"Fortsetzen nicht möglich (Inhalt abweichend), vollständiger Transfer: {task.remote_path}")
+            return None
+        if base_path != temp_path:
+            os.replace(base_path, temp_path)
+        block = async_read_block()
+        offset = local_size
+        with open(temp_path, 'ab') as out:
+            while True:
+                data = await rf.read(block, offset)
+                if not data:
+                    break
+                await BANDWIDTH.consume_async(len(data))
+                out.write(data)
+                offset += len(data)
+    os.replace(temp_path, local_path)
+    appended = offset - local_size
+    debug(f"Fortgesetzt ab {local_size} Bytes: {task.remote_path} (+{appended} Bytes)")
+    return appended
+
+
+async def async_transfer(sftp: Any, task: FileTask, stats: Stats):
+    """Ein Dateitransfer der asyncio-Engine (Wiederholungen, Fortsetzen, Manifest wie im Thread-Worker)."""
+    global CURRENT_FILE
+    local_path = os.path.join(LOCAL_BASE_DIR, task.relative_path.replace('/', os.sep))
+    ensure_local_dir(os.path.dirname(local_path))
+    if MANIFEST is None and not task.changed and not should_copy(local_path, task.size):
+        return
+    CURRENT_FILE = task.remote_path
+    if MANIFEST is not None:
+        MANIFEST.mark(task, STATE_PENDING)
+    start_file = time.time()
+    retry = 0
+    while True:
+        try:
+            appended = await async_resume(sftp, task, local_path) if RESUME_PARTIAL and not task.changed else None
+            if appended is None and (BANDWIDTH.rate > 0 or BANDWIDTH_CONTROL_FILE):
+                # Limit aktiv oder zur Laufzeit änderbar: blockweise lesen und vor dem Schreiben warten
+                transferred_bytes = await async_throttled_get(sftp, task, local_path)
+            elif appended is None:
+                received = [0]
+
+                def progress_handler(src: bytes, dst: bytes, copied: int, total: int):
+                    # ohne Limit nur für die Raten-Zeitreihe gezählt
+                    BANDWIDTH.note(copied - received[0])
+                    received[0] = copied
+
+                await sftp.get(task.remote_path, local_path, max_requests=ASYNC_MAX_REQUESTS,
+                               progress_handler=progress_handler)
+                transferred_bytes = task.size
+            else:
+                transferred_bytes = appended
+            break
+        except (OSError, asyncssh.Error) as e:
+            retry += 1
+            if METRICS is not None:
+                METRICS.count_retry()
+            debug(f"Fehler Transfer Versuch {retry} für {task.remote_path}: {e}")
+            if retry > MAX_RETRIES_PER_FILE:
+                raise
+            await asyncio.sleep(2 * retry)
+    if MANIFEST is not None:
+        MANIFEST.mark(task, STATE_DONE)
+    record_copied(stats, STATS_LOCK, transferred_bytes)
+    if METRICS is not None:
+        METRICS.observe_file(task.relative_path, transferred_bytes, time.time() - start_file, retry + 1,
+                             "resume" if appended is not None else "sftp")
+
+
+async def async_verify_checksums(conn: Any, stats: Stats, emit: Callable[[FileTask], None]):
+    """Wie verify_checksums über asyncssh; lokale Prüfsummen laufen in einem Executor-Thread."""
+    held = VERIFIER.take()
+    if not held:
+        return
+    start = time.time()
+    local_future = asyncio.get_running_loop().run_in_executor(None, VERIFIER.local_digests, held)
+    need = VERIFIER.needs_remote(held)
+    remote: Dict[str, str] = {}
+    if need:
+        cmd, file_list = VERIFIER.remote_command(need)
+        try:
+            result = await conn.run(cmd, input=file_list, encoding=None)
+            remote = VERIFIER.parse(result.stdout)
+        except (OSError, asyncssh.Error) as e:
+            debug(f"Remote-Prüfsummen fehlgeschlagen: {e}")
+    local = await local_future
+    for task in VERIFIER.resolve(stats, held, remote, local, len(need), start):
+        emit(task)
+
 
+async def async_backup(stats: Stats):
+    """asyncio-Engine: Scan, Stabilitätsprüfung und Transfers laufen auf einer Event-Loop.
+
+    Alle Transfers teilen eine asyncssh-Verbindung; jede Datei hält bis zu
+    ASYNC_MAX_REQUESTS SFTP-Requests gleichzeitig offen, ASYNC_MAX_TRANSFERS Dateien
+    laufen parallel. Statistik und Manifest entsprechen der Thread-Engine.
+    """
+    global SCAN_SEEN
+    try:
+        conn = await asyncssh.connect(
+            SSH_HOST, port=SSH_PORT, username=SSH_USER, password=resolve_password(),
+            client_keys=[PRIVATE_KEY_PATH] if PRIVATE_KEY_PATH else None, known_hosts=None,
+            keepalive_interval=KEEPALIVE_INTERVAL or None)
+    except (OSError, asyncssh.Error) as e:
+        raise RuntimeError(f"SSH Verbindung fehlgeschlagen: {e}")
+    loop = asyncio.get_running_loop()
+    async with conn, conn.start_sftp_client() as sftp:
+        # Scan und Transfers teilen sich den Thread der Loop, die Queue ist daher unbegrenzt (put_nowait)
+        q: 'asyncio.PriorityQueue[Tuple[tuple, int, Optional[FileTask]]]' = asyncio.PriorityQueue()
+        seq = itertools.count()
+
+        def enqueue(task: Optional[FileTask]):
+            # None (Ende) sortiert hinter alle Tasks
+            key = transfer_sort_key(task) if task is not None else (float("inf"),)
+            q.put_nowait((key, next(seq), task))
+
+        offset = 0.0
+        try:
+            result = await conn.run("date +%s", check=True)
+            offset = float(result.stdout.strip()) - time.time()
+        except (OSError, asyncssh.Error, ValueError) as e:
+            debug(f"Remote-Uhrzeit nicht ermittelbar, nutze lokale Uhr: {e}")
+        # wie im Thread-Modus: mit TRANSFER_ORDER alle Kandidaten sammeln und erst nach dem Scan verteilen
+        collected: List[FileTask] = []
+        gate = StabilityGate(enqueue if TRANSFER_ORDER == "scan" else collected.append, stats, offset)
+
+        async def transfer_loop():
+            while True:
+                _, _, task = await q.get()
+                if task is None:
+                    return
+                try:
+                    if TRANSFER_SLOTS is not None:
+                        await loop.run_in_executor(None, TRANSFER_SLOTS.acquire)
+                        try:
+                            await async_transfer(sftp, task, stats)
+                        finally:
+                            TRANSFER_SLOTS.release()
+                    else:
+                        await async_transfer(sftp, task, stats)
+                except Exception as e:
+                    debug(f"Fehler beim Kopieren {task.remote_path}: {e}")
+                    record_failed(stats, [task], e)
+
+        transfers = [asyncio.create_task(transfer_loop()) for _ in range(max(1, ASYNC_MAX_TRANSFERS))]
+        start = time.time()
+        mode = "sftp"
+        done = False
+        partial = False
+        try:
+            if SCAN_MODE in ("auto", "find"):
+                SCAN_SEEN = set()
+                try:
+                    done = await async_scan_find(conn, stats, gate.offer)
+                except (OSError, asyncssh.Error, RuntimeError) as e:
+                    print(f"Remote find abgebrochen nach {len(SCAN_SEEN)} Dateien: {e}")
+                    # wie scan_remote: SFTP-Scan ergänzt nur die noch nicht gemeldeten Pfade
+                    partial = bool(SCAN_SEEN)
+                if done:
+                    mode = "find"
+                elif partial:
+                    mode = "find+sftp"
+                elif SCAN_MODE == "find":
+                    raise RuntimeError("SCAN_MODE 'find' angefordert, Remote-Befehl aber nicht nutzbar.")
+                if not partial:
+                    SCAN_SEEN = None
+            if not done:
+                await async_scan_sftp(sftp, stats, gate.offer)
+        finally:
+            SCAN_SEEN = None
+        if VERIFIER is not None:
+            await async_verify_checksums(conn, stats, gate.offer)
+        print(f"Scan ({mode}, asyncio): {stats.potential_files} Kandidaten, {stats.skipped_existing_files} bereits vorhanden, "
+              f"Dauer {time.time() - start:.2f} s")
+        if METRICS is not None:
+            METRICS.add_phase("scan", time.time() - start)
+        held, wait = gate.take_held()
+        if held:
+            settle_start = time.time()
+            await asyncio.sleep(wait)
+            gate.apply_restat(held, await async_restat(sftp, held))
+            if METRICS is not None:
+                METRICS.add_phase("stability", time.time() - settle_start)
+        for task in collected:
+            enqueue(task)
+        for _ in transfers:
+            enqueue(None)
+        await asyncio.gather(*transfers)
+        if METRICS is not None:
+            METRICS.add_phase("transfer", time.time() - start)
+
+
+def run_backup_async(stats: Stats, show_status: bool = True):
+    """SFTP-Modus mit der asyncio-Engine (asyncssh); Ausgabe wie bei run_backup."""
+    if asyncssh is None:
+        raise RuntimeError("TRANSFER_ENGINE 'asyncio' benötigt asyncssh (pip install asyncssh).")
+    global MANIFEST, _STOP_STATUS
+    if USE_MANIFEST:
+        try:
+            MANIFEST = Manifest(default_manifest_path())
+        except sqlite3.Error as e:
+            print(f"Manifest nicht nutzbar, prüfe Dateisystem pro Datei: {e}")
+            MANIFEST = None
+    start_bandwidth_control()
+    status_thread = start_status(stats, show_status)
+    try:
+        asyncio.run(async_backup(stats))
+        remove_stale_parts()
+    finally:
+        if MANIFEST is not None:
+            MANIFEST.close()
+        _STOP_STATUS = True
+        if status_thread is not None:
+            status_thread.join(timeout=2)
+
+
+def start_sftp_workers(sftp: Any, q: 'queue.Queue[FileTask]', stats: Stats,
+                       scan_done: threading.Event) -> List[threading.Thread]:
+    """Startet MAX_PARALLEL_TRANSFERS SFTP-Worker (der erste nutzt sftp, die übrigen eigene Sessions)."""
+    threads = []
+    for _ in range(max(1, MAX_PARALLEL_TRANSFERS)):
+        thread_sftp = sftp if _ == 0 else create_sftp_session()
+        th = threading.Thread(target=worker, args=(thread_sftp, q, stats, STATS_LOCK, scan_done), daemon=True)
+        th.start()
+        threads.append(th)
+    return threads
+
+
+def start_status(stats: Stats, show_status: bool) -> Optional[threading.Thread]:
+    if not show_status:
+        return None
+    status_thread = threading.Thread(target=status_loop, args=(stats,), daemon=True)
+    status_thread.start()
+    return status_thread
+
+
+def run_backup(stats: Stats, show_status: bool = True):
+    """Sichert SSH_HOST nach LOCAL_BASE_DIR im konfigurierten Modus und schreibt ggf. die Metriken.
+
+    Wirft RuntimeError, wenn keine Verbindung aufgebaut werden kann.
+    """
+    global METRICS, VERIFIER
+    METRICS = open_metrics(stats)
+    VERIFIER = ChecksumVerifier(CHECKSUM_MODE) if CHECKSUM_MODE else None
+    error = None
+    try:
+        if TRANSFER_ENGINE == "asyncio" and not (USE_RSYNC or HYBRID_TRANSFER or USE_TAR_STREAM):
+            run_backup_async(stats, show_status)
+        else:
+            run_backup_paramiko(stats, show_status)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        VERIFIER = None
+        if METRICS is not None:
+            METRICS.close(error)
+            METRICS = None
+
+
+def run_backup_paramiko(stats: Stats, show_status: bool = True):
+    """run_backup mit paramiko: alle Scan-, SFTP- und tar-Kanäle laufen über die eine Verbindung aus connect_ssh."""
     try:
+        start = time.time()
         client, sftp = connect_ssh()
+        if METRICS is not None:
+            METRICS.add_phase("connect", time.time() - start)
         # Globale Referenz für neue SFTP Sessions in Threads
         global _GLOBAL_SSH_CLIENT
         _GLOBAL_SSH_CLIENT = client
     except Exception as e:
-        print(f"SSH Verbindung fehlgeschlagen: {e}")
-        sys.exit(1)
+        raise RuntimeError(f"SSH Verbindung fehlgeschlagen: {e}")
 
-    # Modusabhängige Vorbereitung
-    if USE_RSYNC:
-        # Einmaliges Listing nur für Anzeige
-        _, temp_sftp = connect_ssh()
-        scan_remote(temp_sftp, stats)
-        temp_sftp.close()
-        status_thread = threading.Thread(target=status_loop, args=(stats,), daemon=True)
-        status_thread.start()
-        print("Nutze rsync für Transfer ...")
-        run_rsync(stats)
-    elif USE_TAR_STREAM:
-        # Listing einmal für tasks + Anzeige
-        tasks = scan_remote(sftp, stats)
-        print(f"Gefundene potentielle Dateien (tar): {stats.potential_files}")
-        status_thread = threading.Thread(target=status_loop, args=(stats,), daemon=True)
-        status_thread.start()
-        print("Nutze tar Stream für Transfer ...")
-        run_tar_stream(client, stats, tasks)
-    else:
-        # SFTP Standard
-        tasks = scan_remote(sftp, stats)
-        print(f"Gefundene potentielle Dateien: {stats.potential_files}")
-        status_thread = threading.Thread(target=status_loop, args=(stats,), daemon=True)
-        status_thread.start()
-        q: 'queue.Queue[FileTask]' = queue.Queue()
-        for t in tasks:
-            q.put(t)
-        lock = threading.Lock()
-        threads = []
-        for _ in range(max(1, MAX_PARALLEL_TRANSFERS)):
-            thread_sftp = sftp if _ == 0 else create_sftp_session()
-            th = threading.Thread(target=worker, args=(thread_sftp, q, stats, lock), daemon=True)
-            th.start()
-            threads.append(th)
-        q.join()
-        for th in threads:
-            th.join(timeout=0.1)
+    global MANIFEST, DISK_WRITER, _STOP_STATUS
+    if USE_MANIFEST:
+        try:
+            MANIFEST = Manifest(default_manifest_path())
+        except sqlite3.Error as e:
+            print(f"Manifest nicht nutzbar, prüfe Dateisystem pro Datei: {e}")
+            MANIFEST = None
+    DISK_WRITER = DiskWriter() if WRITE_PIPELINE and not USE_RSYNC else None
+    start_bandwidth_control()
 
+    status_thread = None
     try:
-        sftp.close()
-        client.close()
-    except Exception:
-        pass
+        # Modusabhängige Vorbereitung
+        if USE_RSYNC:
+            # Listing einmal, rsync überträgt genau diese Liste
+            tasks = scan_remote(sftp, stats, client)
+            print(f"Gefundene potentielle Dateien (rsync): {stats.potential_files}")
+            status_thread = start_status(stats, show_status)
+            ready: List[FileTask] = []
+            gate = StabilityGate(ready.append, stats, remote_time_offset(client))
+            for t in tasks:
+                gate.offer(t)
+            gate.settle(client, sftp)
+            print("Nutze rsync für Transfer ...")
+            transfer_start = time.time()
+            if TRANSFER_SLOTS is not None:
+                with TRANSFER_SLOTS:
+                    run_rsync(stats, ready)
+            else:
+                run_rsync(stats, ready)
+        elif HYBRID_TRANSFER:
+            # Ein Listing, dann nach Größe aufgeteilt: tar Stream und SFTP-Worker laufen gleichzeitig
+            tasks = scan_remote(sftp, stats, client)
+            status_thread = start_status(stats, show_status)
+            ready: List[FileTask] = []
+            gate = StabilityGate(ready.append, stats, remote_time_offset(client))
+            for t in tasks:
+                gate.offer(t)
+            gate.settle(client, sftp)
+            threshold = HYBRID_SIZE_THRESHOLD_MB * 1024 * 1024
+            small = [t for t in ready if t.size < threshold]
+            large = [t for t in ready if t.size >= threshold]
+            print(f"Hybrid: {len(small)} kleine Dateien per tar Stream, {len(large)} große per SFTP "
+                  f"({sum(t.size for t in large) / (1024 * 1024):.1f} MB)")
+            transfer_start = time.time()
+            q: 'queue.Queue[FileTask]' = TaskQueue()
+            for t in large:
+                q.put(t)
+            scan_done = threading.Event()
+            scan_done.set()
+            threads = start_sftp_workers(sftp, q, stats, scan_done)
+            run_tar_stream(client, stats, small)
+            q.join()
+            for th in threads:
+                th.join(timeout=0.1)
+        elif USE_TAR_STREAM:
+            # Listing einmal für tasks + Anzeige
+            tasks = scan_remote(sftp, stats, client)
+            print(f"Gefundene potentielle Dateien (tar): {stats.potential_files}")
+            status_thread = start_status(stats, show_status)
+            print("Nutze tar Stream für Transfer ...")
+            # Stabile Dateien (mtime laut Inventar alt genug) sofort, junge erst nach gesammelter Prüfung
+            stable: List[FileTask] = []
+            gate = StabilityGate(stable.append, stats, remote_time_offset(client))
+            for t in tasks:
+                gate.offer(t)
+            transfer_start = time.time()
+            codec = run_tar_stream(client, stats, stable)
+            transfer_time = time.time() - transfer_start
+            settled: List[FileTask] = []
+            gate.emit = settled.append
+            gate.settle(client, sftp)
+            # Wartezeit der Stabilitätsprüfung zählt nicht zum Transfer
+            transfer_start = time.time() - transfer_time
+            run_tar_stream(client, stats, settled, codec)
+        else:
+            # SFTP Standard: Worker starten sofort, der Scan füllt die begrenzte Queue laufend nach
+            status_thread = start_status(stats, show_status)
+            q: 'queue.Queue[FileTask]' = TaskQueue(maxsize=max(1, TRANSFER_QUEUE_MAX))
+            transfer_start = time.time()
+            scan_done = threading.Event()
+            threads = start_sftp_workers(sftp, q, stats, scan_done)
+            scan_sftp = create_sftp_session()
+            # mit TRANSFER_ORDER erst nach dem Scan verteilen, sonst wird nur der Queue-Inhalt sortiert
+            collected: List[FileTask] = []
+            gate = StabilityGate(q.put if TRANSFER_ORDER == "scan" else collected.append, stats,
+                                 remote_time_offset(client))
+            try:
+                scan_remote(scan_sftp, stats, client, emit=gate.offer)
+                gate.settle(client, scan_sftp)
+                for t in sorted(collected, key=transfer_sort_key):
+                    q.put(t)
+            finally:
+                scan_done.set()
+                scan_sftp.close()
+            print(f"Gefundene potentielle Dateien: {stats.potential_files}")
+            q.join()
+            for th in threads:
+                th.join(timeout=0.1)
+        if METRICS is not None:
+            METRICS.add_phase("transfer", time.time() - transfer_start)
+        remove_stale_parts()
+    finally:
+        try:
+            sftp.close()
+            client.close()
+        except Exception:
+            pass
+        # auch nach Fehlern: fertige .part-Dateien synct und benennt der Writer noch um
+        if DISK_WRITER is not None:
+            start = time.time()
+            DISK_WRITER.close()
+            print(DISK_WRITER.report())
+            if METRICS is not None:
+                METRICS.add_phase("write_flush", time.time() - start)
+                METRICS.record_pipeline(DISK_WRITER)
+            DISK_WRITER = None
+        if MANIFEST is not None:
+            MANIFEST.close()
 
-    # Status Loop stoppen
-    global _STOP_STATUS
-    _STOP_STATUS = True
-    status_thread.join(timeout=2)
+        # Status Loop stoppen
+        _STOP_STATUS = True
+        if status_thread is not None:
+            status_thread.join(timeout=2)
 
-    results = stats.finalize()
-    print("\nBackup abgeschlossen.")
+
+def print_results(results: dict):
     print(f"Dateien kopiert: {results['copied_files']} / {results['potential_files']} ({results['percent_of_potential']}%)")
     print(f"Volumen kopiert: {results['copied_mb']} MB von {results['potential_mb']} MB")
+    if results['failed_files']:
+        print(f"Fehlgeschlagen: {results['failed_files']} Dateien")
     print(f"Dauer: {results['duration_s']} s")
     print(f"Dateirate: {results['file_rate_per_s']} Dateien/s")
     print(f"Datenrate: {results['data_rate_mb_per_s']} MB/s")
 
 
+def load_fleet_hosts() -> List[str]:
+    """Hostliste aus FLEET_HOSTS (Liste oder Textdatei, # leitet Kommentare ein)."""
+    if isinstance(FLEET_HOSTS, str):
+        with open(FLEET_HOSTS, "r", encoding="utf-8") as f:
+            lines = [line.split("#", 1)[0].strip() for line in f]
+        return [line for line in lines if line]
+    return list(FLEET_HOSTS or [])
+
+
+def parse_host_spec(spec: str) -> Tuple[str, str, int]:
+    """"[user@]host[:port]" -> (user, host, port) mit SSH_USER/SSH_PORT als Vorgabe."""
+    user = SSH_USER
+    port = SSH_PORT
+    if "@" in spec:
+        user, spec = spec.split("@", 1)
+    if ":" in spec:
+        spec, port_str = spec.rsplit(":", 1)
+        port = int(port_str)
+    return user, spec, port
+
+
+def fleet_host_label(user: str, host: str, port: int) -> str:
+    """Name des Hosts für Unterordner und Ausgaben; abweichender User/Port wird angehängt.
+
+    Sonst landen z.B. host:22 und host:2222 im selben Ordner und Manifest.
+    """
+    label = host if user == SSH_USER else f"{user}@{host}"
+    return label if port == SSH_PORT else f"{label}_{port}"
+
+
+def init_fleet_process(slots: Any):
+    global TRANSFER_SLOTS
+    TRANSFER_SLOTS = slots
+
+
+FLEET_HOST_GLOBALS = ("SSH_USER", "SSH_HOST", "SSH_PORT", "SSH_PASSWORD", "LOCAL_BASE_DIR", "MANIFEST_PATH",
+                      "PRINT_DEBUG", "METRICS_PROM_PATH")
+
+
+def backup_fleet_host(label: str, user: str, host: str, port: int, password: Optional[str],
+                      local_root: str) -> Tuple[str, Stats, Optional[str]]:
+    """Prozess eines Hosts im Flotten-Modus; Rückgabe: (Host, Stats, Fehlertext oder None).
+
+    Der Pool verwendet Prozesse für weitere Hosts wieder, daher werden die überschriebenen
+    Vorgaben am Ende zurückgesetzt; label kommt aus dem Hauptprozess.
+    """
+    global SSH_USER, SSH_HOST, SSH_PORT, SSH_PASSWORD, LOCAL_BASE_DIR, MANIFEST_PATH, PRINT_DEBUG, METRICS_PROM_PATH
+    saved = {name: globals()[name] for name in FLEET_HOST_GLOBALS}
+    SSH_USER, SSH_HOST, SSH_PORT = user, host, port
+    SSH_PASSWORD = password
+    LOCAL_BASE_DIR = os.path.join(local_root, label)
+    MANIFEST_PATH = None  # Manifest liegt im Host-Unterordner
+    PRINT_DEBUG = False  # Ausgaben mehrerer Hosts würden sich vermischen
+    if saved["METRICS_PROM_PATH"]:
+        # der textfile collector liest alle *.prom, je Host eine Datei (JSON-Zeilen tragen den Host selbst);
+        # immer vom konfigurierten Pfad aus, nie vom Suffix eines vorigen Hosts im selben Prozess
+        root, ext = os.path.splitext(saved["METRICS_PROM_PATH"])
+        METRICS_PROM_PATH = f"{root}_{label}{ext}"
+    stats = Stats()
+    stats.start_time = time.time()
+    try:
+        run_backup(stats, show_status=False)
+    except Exception as e:
+        return label, stats, str(e)
+    finally:
+        globals().update(saved)
+    if stats.failed_files:
+        return label, stats, f"{stats.failed_files} Dateien nicht übertragen"
+    return label, stats, None
+
+
+def run_fleet():
+    """Sichert alle Hosts aus FLEET_HOSTS, bis zu FLEET_MAX_HOSTS gleichzeitig."""
+    import multiprocessing
+    hosts = load_fleet_hosts()
+    if not hosts:
+        print("FLEET_HOSTS enthält keine Hosts.")
+        sys.exit(1)
+    # einmal fragen statt je Host-Prozess
+    password = resolve_password(f"SSH Passwort (für alle {len(hosts)} Hosts): ")
+    total = Stats()
+    total.start_time = time.time()
+    rows = []
+    slots = multiprocessing.Manager().BoundedSemaphore(max(1, FLEET_MAX_TRANSFERS))
+    print(f"Flotten-Modus: {len(hosts)} Hosts, {FLEET_MAX_HOSTS} gleichzeitig, max. {FLEET_MAX_TRANSFERS} Transfers")
+    with ProcessPoolExecutor(max_workers=max(1, min(FLEET_MAX_HOSTS, len(hosts))),
+                             initializer=init_fleet_process, initargs=(slots,)) as pool:
+        futures = []
+        for spec in hosts:
+            user, host, port = parse_host_spec(spec)
+            futures.append(pool.submit(backup_fleet_host, fleet_host_label(user, host, port), user, host, port,
+                                       password, LOCAL_BASE_DIR))
+        for future in as_completed(futures):
+            host, stats, error = future.result()
+            for field in fields(Stats):
+                if field.name != "start_time":
+                    setattr(total, field.name, getattr(total, field.name) + getattr(stats, field.name))
+            results = stats.finalize()
+            rows.append((host, results, error))
+            state = f"FEHLER: {error}" if error else "ok"
+            print(f"Host {host} fertig: {results['copied_files']} Dateien, {results['copied_mb']} MB ({state})")
+
+    print("\nBackup abgeschlossen (Flotte).")
+    print(f"{'Host':<22} {'Dateien':>12} {'MB':>12} {'MB/s':>8} {'Dauer s':>9}  Status")
+    for host, results, error in sorted(rows, key=lambda r: r[0]):
+        print(f"{host:<22} {results['copied_files']:>5}/{results['potential_files']:<6} {results['copied_mb']:>12} "
+              f"{results['data_rate_mb_per_s']:>8} {results['duration_s']:>9}  {'FEHLER: ' + error if error else 'ok'}")
+    print_results(total.finalize())
+    if any(error for _, _, error in rows):
+        sys.exit(1)
+
+
+def main():
+    if FLEET_HOSTS:
+        run_fleet()
+        return
+    stats = Stats()
+    try:
+        run_backup(stats)
+    except RuntimeError as e:
+        print(str(e))
+        sys.exit(1)
+
+    results = stats.finalize()
+    print("\nBackup abgeschlossen.")
+    print_results(results)
+    if stats.failed_files:
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
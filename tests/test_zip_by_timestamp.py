@@ -0,0 +1,163 @@
+"""Tests für die rohen ZIP-Einträge von zip_by_timestamp (parallel, inkrementell, Teilarchive).
+
+begin_raw_entry / end_raw_entry / copy_raw_entry greifen auf interne Attribute von
+ZipFile zu; diese Tests prüfen die erzeugten Archive gegen den normalen Schreibweg.
+Ausführen: python -m pytest tests  (oder python -m unittest discover tests)
+"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+from zipfile import ZipFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import zip_by_timestamp as zbt  # noqa: E402
+
+DT_FROM = datetime(2026, 2, 5, 0, 0, 0)
+DT_TO = datetime(2026, 2, 5, 23, 59, 59)
+
+
+class ZipTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base = os.path.join(tmp.name, "NGPS")
+        self.dest = os.path.join(tmp.name, "NGPS_ZIP")
+        patcher = mock.patch.multiple(zbt, SHOW_PROGRESS=False, COMPRESSION_POLICY="default", INCREMENTAL=False,
+                                      STREAM_OUTPUT=None, SPLIT_SIZE_MB=0, SPLIT_PART_COMMAND=None,
+                                      SKIP_DATE_DIRS=False, PARALLEL_MAX_FILE_MB=64)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rng = random.Random(1234)
+        for i in range(12):
+            self.write(f"dev{i % 3}/log_2026-02-05_{i:02d}-00-00.csv", self.text(2000 + 500 * i))
+        self.write("dev0/binary_2026-02-05_12-30-00.dat", bytes(self.rng.getrandbits(8) for _ in range(5000)))
+        self.write("dev1/empty_2026-02-05_13-00-00.csv", b"")
+        self.write("dev2/other_2026-02-06_01-00-00.csv", self.text(100))  # außerhalb des Zeitraums
+
+    def text(self, size: int) -> bytes:
+        words = [b"alpha", b"beta", b"gamma", b"delta", b"12345", b"\n"]
+        out = bytearray()
+        while len(out) < size:
+            out += self.rng.choice(words) + b";"
+        return bytes(out[:size])
+
+    def write(self, rel: str, data: bytes) -> str:
+        path = os.path.join(self.base, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def build(self, name: str, workers: int) -> str:
+        files = zbt.find_matching_files(self.base, DT_FROM, DT_TO)
+        return zbt.create_zip(self.base, self.dest, files, name, workers=workers)
+
+    def expected(self) -> dict:
+        result = {}
+        for fe in zbt.find_matching_files(self.base, DT_FROM, DT_TO):
+            with open(fe.path, "rb") as f:
+                result[os.path.relpath(fe.path, self.base).replace(os.sep, "/")] = f.read()
+        return result
+
+    def assertArchive(self, zip_path: str) -> None:
+        """Archiv ist fehlerfrei lesbar und enthält genau die aktuellen Treffer ohne Duplikate."""
+        with ZipFile(zip_path) as zf:
+            self.assertIsNone(zf.testzip())
+            names = zf.namelist()
+            self.assertEqual(len(names), len(set(names)))
+            self.assertEqual({name: zf.read(name) for name in names}, self.expected())
+
+
+class ParallelTest(ZipTestCase):
+    def test_parallel_matches_sequential(self):
+        seq = self.build("seq.zip", workers=1)
+        par = self.build("par.zip", workers=3)
+        self.assertArchive(seq)
+        self.assertArchive(par)
+        with ZipFile(seq) as a, ZipFile(par) as b:
+            fields = lambda zf: [(i.filename, i.CRC, i.file_size, i.compress_type, i.date_time, i.external_attr)
+                                 for i in zf.infolist()]
+            self.assertEqual(fields(a), fields(b))
+
+    def test_large_files_streamed_between_parallel_entries(self):
+        with mock.patch.object(zbt, "PARALLEL_MAX_FILE_MB", 0.003):
+            self.assertArchive(self.build("mixed.zip", workers=2))
+
+
+class IncrementalTest(ZipTestCase):
+    def run_incremental(self, workers: int) -> None:
+        with mock.patch.object(zbt, "INCREMENTAL", True):
+            zip_path = self.build("inc.zip", workers)
+            self.assertArchive(zip_path)
+            with ZipFile(zip_path) as zf:
+                before = {i.filename: i.CRC for i in zf.infolist()}
+            self.write("dev0/new_2026-02-05_20-00-00.csv", self.text(1234))
+            self.write("dev1/log_2026-02-05_01-00-00.csv", self.text(999))  # andere Größe
+            same = os.path.join(self.base, "dev2/log_2026-02-05_02-00-00.csv")
+            size = os.path.getsize(same)
+            self.write("dev2/log_2026-02-05_02-00-00.csv", b"x" * size)  # gleiche Größe, anderer Inhalt
+            self.assertEqual(self.build("inc.zip", workers), zip_path)
+            self.assertArchive(zip_path)
+            with ZipFile(zip_path) as zf:
+                after = {i.filename: i.CRC for i in zf.infolist()}
+            changed = {name for name in after if before.get(name) != after[name]}
+            self.assertEqual(changed, {"dev0/new_2026-02-05_20-00-00.csv", "dev1/log_2026-02-05_01-00-00.csv",
+                                       "dev2/log_2026-02-05_02-00-00.csv"})
+            self.assertFalse(os.path.exists(zip_path + ".tmp"))
+
+    def test_incremental_sequential(self):
+        self.run_incremental(workers=1)
+
+    def test_incremental_parallel(self):
+        self.run_incremental(workers=2)
+
+    def test_incremental_on_streamed_archive(self):
+        # Nicht seekbar geschriebene Einträge haben Data Descriptors; die Rohkopie muss sie entfernen
+        with mock.patch.object(zbt, "SPLIT_SIZE_MB", 64):
+            self.build("inc.zip", 1)
+        zip_path = os.path.join(self.dest, "inc.zip")
+        os.replace(zip_path + ".001", zip_path)
+        with ZipFile(zip_path) as zf:
+            self.assertTrue(all(i.flag_bits & 0x08 for i in zf.infolist()))
+        self.write("dev1/log_2026-02-05_01-00-00.csv", self.text(999))
+        with mock.patch.object(zbt, "INCREMENTAL", True):
+            self.build("inc.zip", 1)
+        self.assertArchive(zip_path)
+        with ZipFile(zip_path) as zf:
+            self.assertFalse(any(i.flag_bits & 0x08 for i in zf.infolist() if i.filename.startswith("dev0/")))
+
+    def test_unchanged_run_keeps_archive(self):
+        with mock.patch.object(zbt, "INCREMENTAL", True):
+            zip_path = self.build("inc.zip", 1)
+            with open(zip_path, "rb") as f:
+                first = f.read()
+            self.build("inc.zip", 1)
+            with open(zip_path, "rb") as f:
+                self.assertEqual(f.read(), first)
+
+
+class SplitTest(ZipTestCase):
+    def test_parts_join_to_valid_archive(self):
+        with mock.patch.object(zbt, "SPLIT_SIZE_MB", 4096 / (1024 * 1024)):
+            for workers in (1, 2):
+                with self.subTest(workers=workers):
+                    zip_path = self.build("split.zip", workers)
+                    parts = sorted(p for p in os.listdir(self.dest) if p.startswith("split.zip."))
+                    self.assertGreater(len(parts), 1)
+                    for part in parts[:-1]:
+                        self.assertEqual(os.path.getsize(os.path.join(self.dest, part)), 4096)
+                    joined = os.path.join(self.dest, "joined.zip")
+                    with open(joined, "wb") as out:
+                        for part in parts:
+                            with open(os.path.join(self.dest, part), "rb") as f:
+                                out.write(f.read())
+                    self.assertFalse(os.path.exists(zip_path))
+                    self.assertArchive(joined)
+
+
+if __name__ == "__main__":
+    unittest.main()
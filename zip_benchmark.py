@@ -0,0 +1,301 @@
+"""Benchmark für zip_by_timestamp
+
+Erzeugt (einmalig) einen synthetischen, NGPS-ähnlichen Verzeichnisbaum und misst
+die einzelnen Stufen von zip_by_timestamp getrennt:
+    scan          - Verzeichnisbaum durchlaufen (scan_files, wie find_matching_files)
+    filter        - Zeitstempel der Namen auf FROM/TO prüfen, stat je Treffer (filter_stamped)
+    index_build   - refresh_index auf einem leeren Index (erster Lauf mit USE_INDEX)
+    index_refresh - refresh_index auf dem aktuellen Index (nur stat je Verzeichnis)
+    index_search  - find_matching_files_indexed mit warmem Index (Abgleich + Abfrage)
+    compress      - Archiv der gefundenen Dateien erstellen (create_archive)
+Für jede Stufe werden Dauer, Dateien/s und MB/s als JSON ausgegeben und in
+RESULT_PATH gespeichert. Mit COMPARE_WITH wird ein früheres Ergebnis
+gegenübergestellt.
+
+Dateinamen folgen dem Muster <prefix>_YYYY-MM-DD_HH-MM-SS.csv, z.B.
+    cabdir_changes_2025-11-04_13-00-03.csv
+
+Konfiguration oben im Skript anpassen und einfach ausführen:
+    python zip_benchmark.py
+"""
+from __future__ import annotations
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Tuple, Dict
+
+import zip_by_timestamp as zbt
+
+# ===================== CONFIG =====================
+TREE_DIR = "bench_NGPS"      # Zielordner des synthetischen Baums (wird bei geänderter Konfiguration neu erzeugt)
+FILE_COUNT = 20000           # Anzahl Dateien mit Zeitstempel
+UNSTAMPED_FRACTION = 0.05    # Zusätzlicher Anteil Dateien ohne Zeitstempel im Namen
+DEPTH = 3                    # Verzeichnistiefe unterhalb der Tagesordner
+FANOUT = 4                   # Unterverzeichnisse pro Ebene
+DATE_DIRS = True             # Oberste Ebene als Tagesordner YYYY-MM-DD anlegen
+START = "2026-02-01 00:00:00"  # Zeitstempel des ersten generierten Tages
+DAYS = 7                     # Über wie viele Tage die Zeitstempel verteilt werden
+# Größenverteilung: (mittlere Größe in Bytes, Gewicht); tatsächliche Größe +-50 %
+SIZE_DISTRIBUTION = [(2 * 1024, 0.6), (64 * 1024, 0.3), (2 * 1024 * 1024, 0.1)]
+BINARY_FRACTION = 0.05       # Anteil Dateien mit zufälligem (nicht komprimierbarem) Inhalt (.raw)
+PREFIXES = ["cabdir_changes", "linpos", "sensor_status", "gps_track"]
+SEED = 42
+# Messung
+FROM_STR = "2026-02-02 00:00:00"  # Zeitfenster für filter/index_search/compress
+TO_STR = "2026-02-02 23:59:59"
+REPEAT = 3                   # Wiederholungen je Stufe, bestes Ergebnis zählt
+SKIP_COMPRESS = False        # True: nur die Such- und Index-Stufen messen
+RESULT_PATH = "bench_results.json"
+COMPARE_WITH = None          # Pfad zu einem früheren Ergebnis-JSON oder None
+# ==================================================
+
+MARKER_FILE = ".bench_tree.json"
+CSV_POOL_SIZE = 1024 * 1024
+
+
+def tree_config() -> dict:
+    return {
+        "file_count": FILE_COUNT,
+        "unstamped_fraction": UNSTAMPED_FRACTION,
+        "depth": DEPTH,
+        "fanout": FANOUT,
+        "date_dirs": DATE_DIRS,
+        "start": START,
+        "days": DAYS,
+        "size_distribution": SIZE_DISTRIBUTION,
+        "binary_fraction": BINARY_FRACTION,
+        "prefixes": PREFIXES,
+        "seed": SEED,
+    }
+
+
+def build_csv_pool(rng: random.Random) -> bytes:
+    """Erzeugt einen Block CSV-ähnlicher Sensordaten, aus dem Dateiinhalte geschnitten werden."""
+    lines = ["timestamp;distance;speed;sensor_a;sensor_b;status"]
+    size = len(lines[0]) + 1
+    t = 0.0
+    dist = 0.0
+    while size < CSV_POOL_SIZE:
+        t += 0.1
+        speed = 20 + rng.random() * 5
+        dist += speed * 0.1
+        line = f"{t:.1f};{dist:.2f};{speed:.3f};{rng.gauss(0, 1):.4f};{rng.randint(0, 4095)};OK"
+        lines.append(line)
+        size += len(line) + 1
+    return ("\n".join(lines) + "\n").encode()
+
+
+def pick_size(rng: random.Random) -> int:
+    sizes, weights = zip(*SIZE_DISTRIBUTION)
+    mean = rng.choices(sizes, weights=weights)[0]
+    return max(1, int(mean * rng.uniform(0.5, 1.5)))
+
+
+def subdir_for(rng: random.Random, day: datetime) -> str:
+    parts = [day.strftime("%Y-%m-%d")] if DATE_DIRS else []
+    for level in range(DEPTH):
+        parts.append(f"d{level}_{rng.randrange(FANOUT):02d}")
+    return os.path.join(*parts) if parts else ""
+
+
+def generate_tree(tree_dir: str) -> Tuple[int, int]:
+    """Erzeugt den synthetischen Baum, sofern er nicht mit gleicher Konfiguration existiert.
+
+    Rückgabe: (Anzahl Dateien, Gesamtbytes)
+    """
+    marker = os.path.join(tree_dir, MARKER_FILE)
+    cfg = tree_config()
+    if os.path.exists(marker):
+        try:
+            with open(marker, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if info.get("config") == cfg:
+                return info["files"], info["bytes"]
+        except (OSError, ValueError):
+            pass
+        shutil.rmtree(tree_dir)
+    elif os.path.exists(tree_dir):
+        raise RuntimeError(f"{tree_dir} existiert und ist kein Benchmark-Baum, bitte TREE_DIR ändern.")
+    print(f"Erzeuge synthetischen Baum in '{tree_dir}' ({FILE_COUNT} Dateien) ...")
+    rng = random.Random(SEED)
+    pool = build_csv_pool(rng)
+    start = zbt.parse_config_dt(START)
+    span = DAYS * 86400
+    total_files = 0
+    total_bytes = 0
+    unstamped = int(FILE_COUNT * UNSTAMPED_FRACTION)
+    for i in range(FILE_COUNT + unstamped):
+        ts = start + timedelta(seconds=rng.randrange(span))
+        directory = os.path.join(tree_dir, subdir_for(rng, ts))
+        os.makedirs(directory, exist_ok=True)
+        prefix = rng.choice(PREFIXES)
+        binary = rng.random() < BINARY_FRACTION
+        ext = ".raw" if binary else ".csv"
+        if i < FILE_COUNT:
+            name = f"{prefix}_{ts.strftime(zbt.TIMESTAMP_FORMAT)}_{i}{ext}"
+        else:
+            name = f"{prefix}_{i}{ext}"
+        size = pick_size(rng)
+        if binary:
+            data = rng.randbytes(size)
+        else:
+            offset = rng.randrange(len(pool))
+            data = (pool[offset:] + pool) * (size // len(pool) + 1)
+            data = data[:size]
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        total_files += 1
+        total_bytes += size
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"config": cfg, "files": total_files, "bytes": total_bytes}, f)
+    # frisch geschriebene Verzeichnisse liest refresh_index sonst bei jedem Lauf neu
+    time.sleep(zbt.INDEX_MTIME_GRANULARITY_NS / 1e9)
+    return total_files, total_bytes
+
+
+def build_index(base_dir: str, index_path: str) -> Tuple[int, int]:
+    """Stufe index_build: refresh_index auf einem neu angelegten Index."""
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    return refresh_existing_index(base_dir, index_path)
+
+
+def refresh_existing_index(base_dir: str, index_path: str) -> Tuple[int, int]:
+    """Stufe index_refresh: refresh_index auf dem vorhandenen Index."""
+    conn = zbt.open_index(index_path, base_dir)
+    try:
+        return zbt.refresh_index(conn, base_dir)
+    finally:
+        conn.close()
+
+
+def measure(func, repeat: int, setup=None):
+    """Führt func repeat-mal aus; Rückgabe: (beste Dauer in s, Ergebnis des letzten Laufs).
+
+    Mit setup wird vor jedem Lauf ungemessen setup() aufgerufen und das Ergebnis an func übergeben.
+    """
+    best = None
+    result = None
+    for _ in range(max(1, repeat)):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        result = func(*args)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def stage_result(duration: float, files: int, total_bytes: int) -> dict:
+    duration = max(duration, 1e-9)
+    return {
+        "seconds": round(duration, 4),
+        "files": files,
+        "mb": round(total_bytes / (1024 * 1024), 2),
+        "files_per_s": round(files / duration, 1),
+        "mb_per_s": round(total_bytes / (1024 * 1024) / duration, 2),
+    }
+
+
+def run_benchmark() -> dict:
+    tree_files, tree_bytes = generate_tree(TREE_DIR)
+    dt_from = zbt.parse_config_dt(FROM_STR)
+    dt_to = zbt.parse_config_dt(TO_STR)
+    # Archivierung ohne Nebenwirkungen auf echte Exporte
+    zbt.INCREMENTAL = False
+    zbt.STREAM_OUTPUT = None
+    zbt.SPLIT_SIZE_MB = 0
+    stages: Dict[str, dict] = {}
+
+    dir_range = zbt.date_dir_range(dt_from, dt_to)
+    duration, entries = measure(lambda: list(zbt.scan_files(TREE_DIR, dir_range)), REPEAT)
+    stages["scan"] = stage_result(duration, len(entries), 0)
+
+    # frische Einträge je Lauf, DirEntry.stat speichert sein Ergebnis
+    duration, files = measure(lambda fresh: zbt.filter_stamped(fresh, dt_from, dt_to), REPEAT,
+                              setup=lambda: list(zbt.scan_files(TREE_DIR, dir_range)))
+    matched_bytes = sum(fe.size for fe in files)
+    stages["filter"] = stage_result(duration, len(entries), matched_bytes)
+
+    work_dir = tempfile.mkdtemp(prefix="zip_bench_")
+    try:
+        index_path = os.path.join(work_dir, "index.sqlite")
+        duration, (listed, _) = measure(lambda: build_index(TREE_DIR, index_path), REPEAT)
+        stages["index_build"] = {**stage_result(duration, tree_files, tree_bytes), "dirs": listed}
+        duration, (listed, unchanged) = measure(lambda: refresh_existing_index(TREE_DIR, index_path), REPEAT)
+        stages["index_refresh"] = {**stage_result(duration, tree_files, tree_bytes),
+                                   "dirs": listed + unchanged, "dirs_listed": listed}
+        duration, indexed = measure(
+            lambda: zbt.find_matching_files_indexed(TREE_DIR, dt_from, dt_to, index_path), REPEAT)
+        stages["index_search"] = stage_result(duration, len(indexed), sum(fe.size for fe in indexed))
+        if not SKIP_COMPRESS:
+            dest_dir = os.path.join(work_dir, "out")
+            name = zbt.build_output_name(dt_from, dt_to)
+            duration, archive = measure(
+                lambda: zbt.create_archive(TREE_DIR, dest_dir, files, name, show_progress=False), REPEAT)
+            result = stage_result(duration, len(files), matched_bytes)
+            result["archive_mb"] = round(os.path.getsize(archive) / (1024 * 1024), 2)
+            result["ratio"] = round(matched_bytes / os.path.getsize(archive), 2) if os.path.getsize(archive) else 0.0
+            stages["compress"] = result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tree": {"files": tree_files, "mb": round(tree_bytes / (1024 * 1024), 2), **tree_config()},
+        "settings": {
+            "from": FROM_STR,
+            "to": TO_STR,
+            "repeat": REPEAT,
+            "zip_workers": zbt.resolve_workers(),
+            "output_format": zbt.OUTPUT_FORMAT,
+            "compression_policy": zbt.COMPRESSION_POLICY,
+        },
+        "stages": stages,
+    }
+
+
+def print_comparison(current: dict, previous: dict) -> None:
+    print("Vergleich mit früherem Ergebnis:")
+    print(f"  {'Stufe':<10} {'vorher s':>10} {'jetzt s':>10} {'Faktor':>8}")
+    for stage, now in current["stages"].items():
+        before = previous.get("stages", {}).get(stage)
+        if not before:
+            continue
+        factor = before["seconds"] / now["seconds"] if now["seconds"] else 0.0
+        print(f"  {stage:<10} {before['seconds']:>10.4f} {now['seconds']:>10.4f} {factor:>7.2f}x")
+
+
+def main():
+    try:
+        results = run_benchmark()
+    except Exception as e:
+        print(f"Benchmark fehlgeschlagen: {e}")
+        return 1
+    previous = None
+    if COMPARE_WITH:
+        # vor dem Speichern lesen, falls COMPARE_WITH == RESULT_PATH
+        try:
+            with open(COMPARE_WITH, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Vergleichsdatei nicht lesbar: {COMPARE_WITH}: {e}")
+    print(json.dumps(results["stages"], indent=2))
+    with open(RESULT_PATH, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Ergebnis gespeichert: {RESULT_PATH}")
+    if previous is not None:
+        print_comparison(results, previous)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
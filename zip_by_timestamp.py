@@ -14,15 +14,79 @@ Konfiguration oben im Skript anpassen und einfach ausführen:
 Akzeptierte Zeitformate für FROM_STR / TO_STR:
     "YYYY-MM-DD HH:MM:SS" oder "YYYY-MM-DD_HH-MM-SS"
 
+Mit ZIP_WORKERS > 1 werden die Dateien parallel in einem Prozesspool
+komprimiert; ein einzelner Schreiber fügt die fertigen Einträge in der
+ursprünglichen Reihenfolge in das ZIP ein.
+
+Mit USE_INDEX = True wird ein persistenter SQLite-Index (Zeitstempel -> Pfad,
+Größe) geführt, standardmäßig als <DEST_DIR>/.timestamp_index.sqlite. Pro Lauf werden nur Verzeichnisse neu gelesen, deren mtime
+sich geändert hat; die FROM/TO-Abfrage ist danach ein indizierter Lookup.
+Im DRY_RUN wird der Index nicht angelegt, dort sucht der normale Scanner.
+
+Batch-Modus: Mit BATCH_WINDOWS (Liste von (FROM, TO)-Paaren) oder BATCH_BUCKET
+(z.B. "1h", "1d": FROM_STR..TO_STR wird in gleich lange Fenster geteilt) wird
+der Baum nur einmal durchsucht, jede Datei ihrem Fenster zugeordnet und pro
+Fenster ein ZIP erzeugt. Die ZIPs werden parallel geschrieben.
+
+Kompression: COMPRESSION_POLICY = "auto" speichert bereits komprimierte Dateien
+(Endung oder Entropie einer Stichprobe) unkomprimiert und wählt die Deflate-Stufe
+pro Dateityp. Mit OUTPUT_FORMAT = "tar.zst" oder "tar.xz" wird statt eines ZIPs
+ein komprimiertes tar-Archiv erzeugt. COMPRESSION_REPORT = True misst Ratio und
+MB/s der verfügbaren Varianten an den gefundenen Dateien, ohne ein Archiv zu schreiben.
+
+Inkrementell: Mit INCREMENTAL = True wird ein bereits vorhandenes ZIP gleichen
+Namens nicht neu erstellt. Anhand des zentralen Verzeichnisses (Name, Größe, CRC)
+werden nur neue oder geänderte Dateien ergänzt; unveränderte Einträge bleiben
+unangetastet und werden nicht neu komprimiert.
+
+Streaming / Teilarchive: STREAM_OUTPUT = "-" schreibt das Archiv direkt nach
+stdout (Meldungen gehen dann nach stderr), z.B.
+    python zip_by_timestamp.py | ssh user@host "cat > export.zip"
+Mit SPLIT_SIZE_MB > 0 wird das Archiv in DEST_DIR als Teile <name>.001, .002, ...
+geschrieben; jedes volle Teil wird sofort geschlossen und kann (optional per
+SPLIT_PART_COMMAND) verschickt werden, während das nächste entsteht.
+Zusammensetzen: cat <name>.* > <name>
+
+Suche: Der Baum wird mit os.scandir durchlaufen; für jede Datei wird genau ein
+stat-Ergebnis (FileEntry) erhoben und durch die gesamte Verarbeitung gereicht.
+Zeitstempel werden als Strings fester Breite verglichen. Mit SKIP_DATE_DIRS werden
+Unterordner, deren Name ein Datum YYYY-MM-DD außerhalb des Zeitraums (zuzüglich
+DATE_DIR_TOLERANCE_DAYS) ist, komplett übersprungen; mit USE_INDEX gilt dieselbe
+Einschränkung für die Treffer aus dem Index.
+
 Hinweis: Originaldateien bleiben unverändert.
 """
 from __future__ import annotations
+import bisect
+import calendar
+import io
+import lzma
+import math
 import os
 import re
+import shlex
+import shutil
+import sqlite3
+import stat
+import struct
+import subprocess
 import sys
-from datetime import datetime
-from zipfile import ZipFile, ZIP_DEFLATED
-from typing import Optional, List
+import tarfile
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from copy import copy
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from zipfile import BadZipFile, ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT
+from typing import Optional, List, Tuple, Dict, BinaryIO, Iterable, Iterator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # tar.zst dann über das zstd-Kommandozeilenprogramm
 
 # ===================== CONFIG =====================
 BASE_DIR = "NGPS"          # Quellbasisordner
@@ -31,6 +95,32 @@ FROM_STR = "2026-02-05 0:00:00"  # Start-Zeit (inklusive)
 TO_STR = "2026-02-05 23:59:00"    # End-Zeit (inklusive)
 OUTPUT_NAME = None          # Optional fester ZIP-Dateiname, oder None für auto
 DRY_RUN = False             # True: nur anzeigen, nichts schreiben
+ZIP_WORKERS = 1             # Kompressions-Prozesse: 1 = sequentiell, 0 = alle CPU-Kerne
+PARALLEL_MAX_FILE_MB = 64   # größere Dateien komprimiert der Hauptprozess direkt in das ZIP (Worker halten ihr Ergebnis im Speicher)
+USE_INDEX = False           # True: persistenten Zeitstempel-Index (schreibt INDEX_PATH) statt vollständiger Suche nutzen
+INDEX_PATH = None           # Pfad der Index-Datenbank, None: <DEST_DIR>/.timestamp_index.sqlite
+SKIP_DATE_DIRS = False      # True: Ordner namens YYYY-MM-DD außerhalb des Zeitraums überspringen (Suche und Index)
+DATE_DIR_TOLERANCE_DAYS = 1 # Toleranz in Tagen für SKIP_DATE_DIRS (Aufnahmen über Mitternacht liegen im Ordner des Nachbartags)
+# Batch-Modus (mehrere Zeitfenster in einem Durchlauf, je ein ZIP pro Fenster)
+BATCH_WINDOWS = None        # z.B. [("2026-02-05 00:00:00", "2026-02-05 11:59:59"), ...] oder None
+BATCH_BUCKET = None         # z.B. "1h" oder "1d": FROM_STR..TO_STR in Fenster dieser Länge teilen, oder None
+# Kompression
+OUTPUT_FORMAT = "zip"       # "zip", "tar.zst" oder "tar.xz"
+COMPRESSION_POLICY = "default"  # "default": immer Deflate Standardstufe, "auto": nach Endung/Entropie
+DEFAULT_DEFLATE_LEVEL = 6   # Deflate-Stufe für Endungen ohne eigenen Eintrag
+DEFLATE_LEVELS = {".csv": 6, ".log": 6, ".txt": 6, ".json": 6, ".xml": 6, ".bin": 1, ".dat": 1}
+STORE_EXTENSIONS = {".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".lz4", ".7z", ".rar",
+                    ".jpg", ".jpeg", ".png", ".mp4", ".mkv", ".avi"}
+ENTROPY_SAMPLE_BYTES = 64 * 1024  # Stichprobe für Dateien ohne bekannte Endung
+ENTROPY_STORE_THRESHOLD = 7.5     # Bits/Byte, ab denen unkomprimiert gespeichert wird
+TAR_COMPRESS_LEVEL = 3      # zstd-Stufe (1-19) bzw. xz-Preset (0-9) für tar-Ausgabe
+COMPRESSION_REPORT = False  # True: nur Kompressionsbericht ausgeben, kein Archiv schreiben
+REPORT_SAMPLE_MB = 32       # Datenmenge (aus den gefundenen Dateien) für den Bericht
+INCREMENTAL = False         # True: vorhandenes ZIP nur um neue/geänderte Dateien ergänzen
+# Ausgabeziel
+STREAM_OUTPUT = None        # None: Datei in DEST_DIR, "-": stdout, sonst Pfad einer Pipe/FIFO/eines Geräts
+SPLIT_SIZE_MB = 0           # >0: Archiv in Teile dieser Maximalgröße aufteilen (<name>.001, .002, ...)
+SPLIT_PART_COMMAND = None   # Optional pro fertigem Teil im Hintergrund, {path} = Teildatei, z.B. "scp {path} host:/ziel/"
 # Fortschritt
 SHOW_PROGRESS = True
 SINGLE_LINE_PROGRESS = True
@@ -39,6 +129,17 @@ PROGRESS_EVERY_N = 5  # bei mehrzeiliger Ausgabe: alle N Dateien
 
 TIMESTAMP_REGEX = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})")
 TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+DATE_DIR_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}")
+READ_CHUNK_SIZE = 1024 * 1024  # Lesepuffer pro Datei beim Komprimieren
+
+
+@dataclass
+class FileEntry:
+    path: str
+    size: int
+    mtime: float
+    mode: int
+    stamp: str  # eingebetteter Zeitstempel, Format TIMESTAMP_FORMAT
 
 
 def parse_config_dt(value: str) -> datetime:
@@ -78,69 +179,969 @@ def extract_timestamp(filename: str) -> Optional[datetime]:
         return None
 
 
-def find_matching_files(base_dir: str, dt_from: datetime, dt_to: datetime) -> List[str]:
-    matches: List[str] = []
-    for root, dirs, files in os.walk(base_dir):
-        for fn in files:
-            ts = extract_timestamp(fn)
-            if ts is None:
-                continue
-            if dt_from <= ts <= dt_to:
-                full_path = os.path.join(root, fn)
-                matches.append(full_path)
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def is_valid_stamp(stamp: str) -> bool:
+    """Prüft einen Treffer von TIMESTAMP_REGEX (feste Breite, nur Ziffern) ohne strptime auf gültige Werte."""
+    year, month, day = int(stamp[0:4]), int(stamp[5:7]), int(stamp[8:10])
+    if year < 1 or not 1 <= month <= 12 or day < 1:
+        return False
+    if day > DAYS_IN_MONTH[month - 1] and not (month == 2 and day == 29 and calendar.isleap(year)):
+        return False
+    return int(stamp[11:13]) < 24 and int(stamp[14:16]) < 60 and int(stamp[17:19]) < 60
+
+
+def common_prefix(a: str, b: str) -> str:
+    n = 0
+    for ca, cb in zip(a, b):
+        if ca != cb:
+            break
+        n += 1
+    return a[:n]
+
+
+def date_dir_range(dt_from: datetime, dt_to: datetime) -> Optional[Tuple[str, str]]:
+    """Erlaubte Datumsordner (YYYY-MM-DD, inklusive) für SKIP_DATE_DIRS, None wenn aus."""
+    if not SKIP_DATE_DIRS:
+        return None
+    tolerance = timedelta(days=DATE_DIR_TOLERANCE_DAYS)
+    return (dt_from - tolerance).strftime("%Y-%m-%d"), (dt_to + tolerance).strftime("%Y-%m-%d")
+
+
+def in_skipped_date_dir(path: str, base_dir: str, dir_range: Tuple[str, str]) -> bool:
+    """True, wenn ein Ordner zwischen base_dir und der Datei ein Datum außerhalb von dir_range trägt."""
+    parts = os.path.relpath(os.path.dirname(path), base_dir).split(os.sep)
+    return any(DATE_DIR_REGEX.fullmatch(p) and not dir_range[0] <= p <= dir_range[1] for p in parts)
+
+
+def find_matching_files(base_dir: str, dt_from: datetime, dt_to: datetime) -> List[FileEntry]:
+    """Durchsucht base_dir mit os.scandir nach Dateien mit Zeitstempel in [dt_from, dt_to].
+
+    Zwei Schritte: scan_files listet die Dateien, filter_stamped prüft die Namen.
+    """
+    return filter_stamped(scan_files(base_dir, date_dir_range(dt_from, dt_to)), dt_from, dt_to)
+
+
+def scan_files(base_dir: str, dir_range: Optional[Tuple[str, str]] = None) -> Iterator[os.DirEntry]:
+    """Liefert alle Dateien unter base_dir (os.scandir, ohne stat).
+
+    Ordner namens YYYY-MM-DD außerhalb von dir_range werden übersprungen.
+    """
+    stack = [base_dir]
+    while stack:
+        dir_path = stack.pop()
+        subdirs: List[str] = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    name = entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if dir_range and DATE_DIR_REGEX.fullmatch(name) and not dir_range[0] <= name <= dir_range[1]:
+                                continue
+                            subdirs.append(entry.path)
+                            continue
+                    except OSError:
+                        continue
+                    yield entry
+        except OSError as e:
+            print(f"Verzeichnis nicht lesbar: {dir_path}: {e}")
+            continue
+        # umgekehrt auf den Stapel, damit die Reihenfolge der von os.walk entspricht
+        stack.extend(reversed(subdirs))
+
+
+def filter_stamped(entries: Iterable[os.DirEntry], dt_from: datetime, dt_to: datetime) -> List[FileEntry]:
+    """Behält die Einträge mit Zeitstempel im Namen in [dt_from, dt_to].
+
+    Zeitstempel werden als Strings fester Breite verglichen; nur Treffer werden
+    zusätzlich auf ein gültiges Datum geprüft. Namen, die das gemeinsame Präfix
+    von Start und Ende nicht enthalten, werden ohne Regex verworfen. Für jeden
+    Treffer wird genau einmal stat aufgerufen.
+    """
+    from_s = dt_from.strftime(TIMESTAMP_FORMAT)
+    to_s = dt_to.strftime(TIMESTAMP_FORMAT)
+    prefix = common_prefix(from_s, to_s)
+    search = TIMESTAMP_REGEX.search
+    matches: List[FileEntry] = []
+    for entry in entries:
+        name = entry.name
+        if prefix not in name:
+            continue
+        m = search(name)
+        if not m:
+            continue
+        stamp = m.group(1)
+        if not from_s <= stamp <= to_s or not is_valid_stamp(stamp):
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        matches.append(FileEntry(entry.path, st.st_size, st.st_mtime, st.st_mode, stamp))
     return matches
 
 
+INDEX_SCHEMA_VERSION = "2"
+INDEX_MTIME_GRANULARITY_NS = 2 * 10**9  # gröbste mtime-Auflösung (FAT: 2 s)
+
+
+def default_index_path() -> str:
+    return INDEX_PATH or os.path.join(DEST_DIR, ".timestamp_index.sqlite")
+
+
+def open_index(index_path: str, base_dir: str) -> sqlite3.Connection:
+    """Öffnet (bzw. erzeugt) die Index-Datenbank.
+
+    Gehört ein vorhandener Index zu einem anderen Basisordner, wird er geleert.
+    """
+    parent = os.path.dirname(index_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    row = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+    if row is None or row[0] != INDEX_SCHEMA_VERSION:
+        conn.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS files; DELETE FROM meta;")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+        CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT NOT NULL, stamp TEXT NOT NULL,
+                                          size INTEGER, mtime REAL, mode INTEGER);
+        CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs(parent);
+        CREATE INDEX IF NOT EXISTS idx_files_dir ON files(dir);
+        CREATE INDEX IF NOT EXISTS idx_files_stamp ON files(stamp);
+    """)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'base_dir'").fetchone()
+    if row is None or row[0] != base_dir:
+        with conn:
+            conn.execute("DELETE FROM dirs")
+            conn.execute("DELETE FROM files")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('base_dir', ?)", (base_dir,))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)", (INDEX_SCHEMA_VERSION,))
+    return conn
+
+
+def _forget_dir(conn: sqlite3.Connection, dir_path: str) -> None:
+    """Entfernt ein Verzeichnis samt aller Unterverzeichnisse und Dateien aus dem Index."""
+    stack = [dir_path]
+    while stack:
+        d = stack.pop()
+        stack.extend(r[0] for r in conn.execute("SELECT path FROM dirs WHERE parent = ?", (d,)))
+        conn.execute("DELETE FROM files WHERE dir = ?", (d,))
+        conn.execute("DELETE FROM dirs WHERE path = ?", (d,))
+
+
+def refresh_index(conn: sqlite3.Connection, base_dir: str) -> Tuple[int, int]:
+    """Gleicht den Index mit dem Dateisystem ab.
+
+    Jedes bekannte Verzeichnis wird nur per stat geprüft; neu gelesen werden nur
+    Verzeichnisse, deren mtime sich geändert hat (Dateien angelegt, gelöscht oder
+    umbenannt) oder beim letzten Lesen jünger als INDEX_MTIME_GRANULARITY_NS war.
+    Größe und mtime werden dabei nicht für wachsende Dateien in unveränderten
+    Verzeichnissen nachgeführt; die Archiv-Einträge nehmen sie daher per fstat.
+    Rückgabe: (Anzahl neu gelesener Verzeichnisse, Anzahl unveränderter Verzeichnisse)
+    """
+    listed = 0
+    unchanged = 0
+    known = {path: mtime for path, mtime in conn.execute("SELECT path, mtime_ns FROM dirs")}
+    with conn:
+        queue = deque([(base_dir, None)])
+        while queue:
+            dir_path, parent = queue.popleft()
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                _forget_dir(conn, dir_path)
+                continue
+            if known.get(dir_path) == mtime_ns:
+                unchanged += 1
+                queue.extend((r[0], dir_path) for r in conn.execute("SELECT path FROM dirs WHERE parent = ?", (dir_path,)))
+                continue
+            listed += 1
+            listed_at_ns = time.time_ns()
+            subdirs: List[str] = []
+            rows = []
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                                continue
+                        except OSError:
+                            continue
+                        m = TIMESTAMP_REGEX.search(entry.name)
+                        if not m or not is_valid_stamp(m.group(1)):
+                            continue
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        rows.append((entry.path, dir_path, m.group(1), st.st_size, st.st_mtime, st.st_mode))
+            except OSError as e:
+                print(f"Verzeichnis nicht lesbar: {dir_path}: {e}")
+                continue
+            conn.execute("DELETE FROM files WHERE dir = ?", (dir_path,))
+            conn.executemany("INSERT OR REPLACE INTO files (path, dir, stamp, size, mtime, mode) VALUES (?, ?, ?, ?, ?, ?)",
+                             rows)
+            current = set(subdirs)
+            for (old,) in conn.execute("SELECT path FROM dirs WHERE parent = ?", (dir_path,)).fetchall():
+                if old not in current:
+                    _forget_dir(conn, old)
+            # Änderungen im selben mtime-Takt wie das Lesen wären später unsichtbar:
+            # solche Verzeichnisse ohne mtime speichern, damit der nächste Lauf sie erneut liest
+            recorded = mtime_ns if listed_at_ns - mtime_ns >= INDEX_MTIME_GRANULARITY_NS else None
+            conn.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                         (dir_path, parent, recorded))
+            for sub in subdirs:
+                if sub not in known:
+                    conn.execute("INSERT OR IGNORE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, NULL)",
+                                 (sub, dir_path))
+                queue.append((sub, dir_path))
+    return listed, unchanged
+
+
+def query_index(conn: sqlite3.Connection, dt_from: datetime, dt_to: datetime) -> List[FileEntry]:
+    """Liefert alle indizierten Dateien mit Zeitstempel in [dt_from, dt_to].
+
+    Die Zeitstempel liegen als feste Breite YYYY-MM-DD_HH-MM-SS vor, daher
+    entspricht der String-Vergleich dem zeitlichen Vergleich.
+    """
+    cur = conn.execute(
+        "SELECT path, size, mtime, mode, stamp FROM files WHERE stamp BETWEEN ? AND ? ORDER BY path",
+        (dt_from.strftime(TIMESTAMP_FORMAT), dt_to.strftime(TIMESTAMP_FORMAT)),
+    )
+    return [FileEntry(*row) for row in cur]
+
+
+def find_matching_files_indexed(base_dir: str, dt_from: datetime, dt_to: datetime,
+                                index_path: Optional[str] = None) -> List[FileEntry]:
+    """Wie find_matching_files, aber über den persistenten Zeitstempel-Index (gleiche SKIP_DATE_DIRS-Regel)."""
+    conn = open_index(index_path or default_index_path(), base_dir)
+    try:
+        listed, unchanged = refresh_index(conn, base_dir)
+        print(f"Index aktualisiert: {listed} Verzeichnisse gelesen, {unchanged} unverändert")
+        files = query_index(conn, dt_from, dt_to)
+    finally:
+        conn.close()
+    dir_range = date_dir_range(dt_from, dt_to)
+    if dir_range:
+        files = [fe for fe in files if not in_skipped_date_dir(fe.path, base_dir, dir_range)]
+    return files
+
+
+def search_files(base_dir: str, dt_from: datetime, dt_to: datetime) -> List[FileEntry]:
+    """find_matching_files_indexed bei USE_INDEX, sonst find_matching_files.
+
+    Im DRY_RUN wird der Index weder angelegt noch aktualisiert (nichts schreiben).
+    """
+    if USE_INDEX and not DRY_RUN:
+        return find_matching_files_indexed(base_dir, dt_from, dt_to)
+    return find_matching_files(base_dir, dt_from, dt_to)
+
+
 def build_output_name(dt_from: datetime, dt_to: datetime) -> str:
-    return f"export_{dt_from.strftime(TIMESTAMP_FORMAT)}_to_{dt_to.strftime(TIMESTAMP_FORMAT)}.zip"
+    return f"export_{dt_from.strftime(TIMESTAMP_FORMAT)}_to_{dt_to.strftime(TIMESTAMP_FORMAT)}.{OUTPUT_FORMAT}"
 
 
-def create_zip(base_dir: str, dest_dir: str, files: List[str], output_name: str) -> str:
-    os.makedirs(dest_dir, exist_ok=True)
-    zip_path = os.path.join(dest_dir, output_name)
-    total_bytes = 0
-    sizes: List[int] = []
-    for fp in files:
+def parse_bucket(spec: str) -> timedelta:
+    """Parst eine Fensterlänge wie "30m", "1h" oder "1d"."""
+    units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+    raw = spec.strip().lower()
+    if len(raw) < 2 or raw[-1] not in units or not raw[:-1].isdigit() or int(raw[:-1]) <= 0:
+        raise ValueError(f"Ungültige Fensterlänge: {spec}")
+    return timedelta(**{units[raw[-1]]: int(raw[:-1])})
+
+
+def build_windows(dt_from: datetime, dt_to: datetime) -> List[Tuple[datetime, datetime]]:
+    """Liefert die Zeitfenster des Batch-Modus (jeweils inklusive Start und Ende).
+
+    BATCH_WINDOWS hat Vorrang; sonst wird dt_from..dt_to in BATCH_BUCKET lange
+    Fenster geteilt, die jeweils eine Sekunde vor dem nächsten Fenster enden.
+    """
+    if BATCH_WINDOWS:
+        windows = [(parse_config_dt(a), parse_config_dt(b)) for a, b in BATCH_WINDOWS]
+        for a, b in windows:
+            if a > b:
+                raise ValueError(f"Fensterstart liegt nach Fensterende: {a} > {b}")
+        return windows
+    step = parse_bucket(BATCH_BUCKET)
+    windows = []
+    start = dt_from
+    while start <= dt_to:
+        end = min(start + step - timedelta(seconds=1), dt_to)
+        windows.append((start, end))
+        start += step
+    return windows
+
+
+def route_files(files: List[FileEntry], windows: List[Tuple[datetime, datetime]]) -> List[List[FileEntry]]:
+    """Ordnet jede Datei allen Fenstern zu, in deren Zeitraum ihr Zeitstempel liegt.
+
+    Überlappen sich die Fenster nicht (immer bei BATCH_BUCKET), genügt pro Datei eine
+    binäre Suche über die sortierten Fensteranfänge; sonst wird jedes Fenster geprüft.
+    """
+    bounds = [(w_from.strftime(TIMESTAMP_FORMAT), w_to.strftime(TIMESTAMP_FORMAT)) for w_from, w_to in windows]
+    buckets: List[List[FileEntry]] = [[] for _ in windows]
+    order = sorted(range(len(bounds)), key=lambda i: bounds[i][0])
+    if all(bounds[a][1] < bounds[b][0] for a, b in zip(order, order[1:])):
+        starts = [bounds[i][0] for i in order]
+        for fe in files:
+            pos = bisect.bisect_right(starts, fe.stamp) - 1
+            if pos >= 0 and fe.stamp <= bounds[order[pos]][1]:
+                buckets[order[pos]].append(fe)
+        return buckets
+    for fe in files:
+        for i, (w_from, w_to) in enumerate(bounds):
+            if w_from <= fe.stamp <= w_to:
+                buckets[i].append(fe)
+    return buckets
+
+
+def resolve_workers() -> int:
+    """Effektive Anzahl Kompressions-Prozesse (ZIP_WORKERS <= 0: alle CPU-Kerne)."""
+    if ZIP_WORKERS and ZIP_WORKERS > 0:
+        return ZIP_WORKERS
+    return os.cpu_count() or 1
+
+
+def sample_entropy(data: bytes) -> float:
+    """Shannon-Entropie in Bits pro Byte (0 = konstant, 8 = zufällig)."""
+    if not data:
+        return 0.0
+    n = len(data)
+    return -sum(c / n * math.log2(c / n) for c in Counter(data).values())
+
+
+def choose_compression(path: str, sample: Optional[bytes] = None) -> Tuple[int, int]:
+    """Wählt (compress_type, Stufe) für eine Datei gemäß COMPRESSION_POLICY.
+
+    Bekannte komprimierte Formate werden gespeichert, bekannte Textformate mit der
+    Stufe aus DEFLATE_LEVELS komprimiert. Für unbekannte Endungen entscheidet die
+    Entropie der ersten ENTROPY_SAMPLE_BYTES.
+    """
+    if COMPRESSION_POLICY != "auto":
+        return ZIP_DEFLATED, zlib.Z_DEFAULT_COMPRESSION
+    ext = os.path.splitext(path)[1].lower()
+    if ext in STORE_EXTENSIONS:
+        return ZIP_STORED, 0
+    if ext in DEFLATE_LEVELS:
+        return ZIP_DEFLATED, DEFLATE_LEVELS[ext]
+    if sample is None:
         try:
-            sz = os.path.getsize(fp)
+            with open(path, "rb") as f:
+                sample = f.read(ENTROPY_SAMPLE_BYTES)
         except OSError:
-            sz = 0
-        sizes.append(sz)
-        total_bytes += sz
-    start_time = datetime.now()
-    processed_bytes = 0
-    processed_files = 0
-    last_line_len = 0
-    with ZipFile(zip_path, "w", compression=ZIP_DEFLATED) as zf:
-        for idx, fp in enumerate(files):
-            arcname = os.path.relpath(fp, base_dir)
+            sample = b""
+    if sample_entropy(sample[:ENTROPY_SAMPLE_BYTES]) >= ENTROPY_STORE_THRESHOLD:
+        return ZIP_STORED, 0
+    return ZIP_DEFLATED, DEFAULT_DEFLATE_LEVEL
+
+
+def compress_member(path: str, compress_type: int, level: int) -> Tuple[int, int, int, os.stat_result, bytes]:
+    """Komprimiert eine Datei für einen ZIP-Eintrag (läuft im Worker-Prozess).
+
+    Deflate wird als roher Strom erzeugt (gespeicherte Dateien schreibt der Hauptprozess direkt).
+    Das Ergebnis liegt vollständig im Speicher, daher nur für Dateien bis PARALLEL_MAX_FILE_MB.
+    Rückgabe: (compress_type, CRC32, unkomprimierte Größe, fstat der Datei, Eintragsdaten)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if compress_type == ZIP_DEFLATED else None
+    crc = 0
+    size = 0
+    parts: List[bytes] = []
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        while True:
+            buf = f.read(READ_CHUNK_SIZE)
+            if not buf:
+                break
+            crc = zlib.crc32(buf, crc)
+            size += len(buf)
+            parts.append(compressor.compress(buf) if compressor else buf)
+    if compressor:
+        parts.append(compressor.flush())
+    return compress_type, crc, size, st, b"".join(parts)
+
+
+# Rohe Einträge: einzige Stelle, die interne Attribute von ZipFile nutzt
+# (_writecheck, _didModify, NameToInfo, start_dir). Alles andere geht über ZipFile.open.
+
+def begin_raw_entry(zf: ZipFile, zinfo: ZipInfo) -> None:
+    """Schreibt den lokalen Header eines bereits komprimierten Eintrags.
+
+    CRC, file_size und compress_size müssen in zinfo bereits gesetzt sein; danach
+    folgen genau compress_size Bytes Eintragsdaten und end_raw_entry.
+    """
+    zf._writecheck(zinfo)
+    zf._didModify = True
+    zinfo.header_offset = zf.fp.tell()
+    zip64 = zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT
+    zf.fp.write(zinfo.FileHeader(zip64))
+
+
+def end_raw_entry(zf: ZipFile, zinfo: ZipInfo) -> None:
+    """Registriert den Eintrag; das zentrale Verzeichnis wird wie bei ZipFile.write beim Schließen geschrieben."""
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+    zf.start_dir = zf.fp.tell()
+
+
+def write_precompressed(zf: ZipFile, zinfo: ZipInfo, data: bytes) -> None:
+    """Hängt einen bereits komprimierten Eintrag an ein zum Schreiben geöffnetes ZipFile an."""
+    begin_raw_entry(zf, zinfo)
+    zf.fp.write(data)
+    end_raw_entry(zf, zinfo)
+
+
+def copy_raw_entry(src, info: ZipInfo, zf: ZipFile) -> None:
+    """Kopiert einen Eintrag aus einem anderen ZIP (geöffnete Binärdatei src) ohne Neukomprimierung."""
+    src.seek(info.header_offset)
+    header = src.read(30)
+    if len(header) != 30 or header[:4] != b"PK\x03\x04":
+        raise ValueError(f"Ungültiger lokaler Header: {info.filename}")
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    src.seek(info.header_offset + 30 + name_len + extra_len)
+    zinfo = copy(info)
+    zinfo.flag_bits &= ~0x08  # Größen stehen im neuen lokalen Header, kein Data Descriptor
+    begin_raw_entry(zf, zinfo)
+    remaining = info.compress_size
+    while remaining > 0:
+        buf = src.read(min(READ_CHUNK_SIZE, remaining))
+        if not buf:
+            raise ValueError(f"Eintrag unvollständig: {info.filename}")
+        zf.fp.write(buf)
+        remaining -= len(buf)
+    end_raw_entry(zf, zinfo)
+
+
+def make_zipinfo(arcname: str, st: os.stat_result) -> ZipInfo:
+    """Wie ZipInfo.from_file, aber aus dem fstat der geöffneten Datei.
+
+    Größe und mtime aus Suche/Index können veraltet sein (durch Anhängen wachsende
+    Dateien ändern die mtime ihres Verzeichnisses nicht), siehe make_tarinfo.
+    """
+    date_time = time.localtime(st.st_mtime)[:6]
+    if date_time[0] < 1980:
+        date_time = (1980, 1, 1, 0, 0, 0)
+    zinfo = ZipInfo(arcname.replace(os.sep, "/"), date_time)
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    return zinfo
+
+
+def make_tarinfo(fe: FileEntry, arcname: str, src: BinaryIO) -> tarfile.TarInfo:
+    """TarInfo einer regulären Datei; Größe und mtime per fstat der geöffneten Datei src.
+
+    Die Größe aus Suche/Index kann veraltet sein (wachsende Dateien in unveränderten
+    Verzeichnissen), tar.addfile kopiert aber genau tinfo.size Bytes.
+    """
+    st = os.fstat(src.fileno())
+    tinfo = tarfile.TarInfo(arcname.replace(os.sep, "/"))
+    tinfo.size = st.st_size
+    tinfo.mtime = st.st_mtime
+    tinfo.mode = stat.S_IMODE(fe.mode)
+    return tinfo
+
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(READ_CHUNK_SIZE)
+            if not buf:
+                return crc
+            crc = zlib.crc32(buf, crc)
+
+
+def prepare_incremental(zip_path: str, base_dir: str, files: List[FileEntry], workers: int) -> List[FileEntry]:
+    """Gleicht die Dateiliste mit dem zentralen Verzeichnis eines vorhandenen ZIPs ab.
+
+    Unveränderte Dateien (gleicher Name, gleiche Größe, gleiche CRC) entfallen.
+    Gibt es geänderte Dateien, wird das ZIP ohne deren alte Einträge neu
+    zusammengesetzt (Rohkopie der übrigen Einträge). Rückgabe: die Dateien, die
+    anschließend im Modus "a" angehängt werden müssen.
+    """
+    with ZipFile(zip_path, "r") as zf:
+        existing = {info.filename: info for info in zf.infolist()}
+    new: List[FileEntry] = []
+    same_size: List[Tuple[FileEntry, ZipInfo]] = []
+    for fe in files:
+        arcname = os.path.relpath(fe.path, base_dir).replace(os.sep, "/")
+        info = existing.get(arcname)
+        if info is None or info.file_size != fe.size:
+            new.append(fe)
+        else:
+            same_size.append((fe, info))
+    paths = [fe.path for fe, _ in same_size]
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            crcs = list(pool.map(file_crc32, paths, chunksize=16))
+    else:
+        crcs = [file_crc32(fp) for fp in paths]
+    changed = [fe for (fe, info), crc in zip(same_size, crcs) if crc != info.CRC]
+    replaced = {os.path.relpath(fe.path, base_dir).replace(os.sep, "/") for fe in new + changed} & existing.keys()
+    print(f"Inkrementell: {len(files) - len(new) - len(changed)} unverändert, "
+          f"{len(new) + len(changed) - len(replaced)} neu, {len(replaced)} geändert")
+    if replaced:
+        tmp_path = zip_path + ".tmp"
+        try:
+            with open(zip_path, "rb") as src, ZipFile(tmp_path, "w", compression=ZIP_DEFLATED) as out:
+                for name, info in existing.items():
+                    if name not in replaced:
+                        copy_raw_entry(src, info, out)
+            os.replace(tmp_path, zip_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    keep = {fe.path for fe in new + changed}
+    return [fe for fe in files if fe.path in keep]
+
+
+def print_progress(fp: str, processed_files: int, n_files: int, processed_bytes: int,
+                   total_bytes: int, start_time: datetime) -> None:
+    pct = (processed_bytes / total_bytes * 100) if total_bytes else 100.0
+    mb_done = processed_bytes / (1024*1024)
+    mb_total = total_bytes / (1024*1024)
+    elapsed = (datetime.now() - start_time).total_seconds()
+    rate_mb_s = (processed_bytes / (1024*1024) / elapsed) if elapsed > 0 else 0.0
+    remaining_files = n_files - processed_files
+    if SINGLE_LINE_PROGRESS:
+        line = (f"Datei: {os.path.basename(fp)} | {processed_files}/{n_files} ({pct:.2f}%) | "
+                f"Daten: {mb_done:.2f}/{mb_total:.2f} MB | Rate: {rate_mb_s:.2f} MB/s | Verbleibend: {remaining_files}")
+        print("\r" + line.ljust(140), end="", flush=True)
+    else:
+        if processed_files % PROGRESS_EVERY_N == 0 or processed_files == n_files:
+            print(f"Fortschritt: {processed_files}/{n_files} Dateien ({pct:.2f}%) | Daten: {mb_done:.2f}/{mb_total:.2f} MB")
+
+
+def write_member_streaming(zf: ZipFile, fe: FileEntry, arcname: str, compress_type: int, level: int) -> None:
+    """Schreibt eine Datei blockweise über ZipFile.open (Speicherbedarf unabhängig von der Dateigröße)."""
+    with open(fe.path, "rb") as src:
+        zinfo = make_zipinfo(arcname, os.fstat(src.fileno()))
+        zinfo.compress_type = compress_type
+        zinfo._compresslevel = level
+        with zf.open(zinfo, "w") as dest:
+            shutil.copyfileobj(src, dest, READ_CHUNK_SIZE)
+
+
+def write_members_sequential(zf: ZipFile, base_dir: str, files: List[FileEntry]):
+    """Schreibt die Dateien nacheinander ins ZIP und liefert die Indizes erfolgreich hinzugefügter Dateien."""
+    for idx, fe in enumerate(files):
+        arcname = os.path.relpath(fe.path, base_dir)
+        try:
+            write_member_streaming(zf, fe, arcname, *choose_compression(fe.path))
+        except Exception as e:
+            print(f"Fehler beim Hinzufügen: {arcname}: {e}")
+            continue
+        yield idx
+
+
+def write_members_parallel(zf: ZipFile, base_dir: str, files: List[FileEntry], workers: int):
+    """Komprimiert die Dateien in einem Prozesspool und schreibt sie in Originalreihenfolge.
+
+    Es sind höchstens 2 * workers Dateien gleichzeitig in Arbeit, jede höchstens
+    PARALLEL_MAX_FILE_MB groß; damit bleibt der Speicherbedarf für fertig komprimierte,
+    noch nicht geschriebene Einträge begrenzt. Größere Dateien und gespeicherte
+    (ZIP_STORED, dort gibt es nichts zu parallelisieren) schreibt der Hauptprozess an
+    ihrer Position selbst per write_member_streaming.
+    """
+    max_bytes = PARALLEL_MAX_FILE_MB * 1024 * 1024
+    pending = deque()
+    next_idx = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while next_idx < len(files) or pending:
+            while next_idx < len(files) and len(pending) < 2 * workers:
+                fe = files[next_idx]
+                compress_type, level = choose_compression(fe.path)
+                if compress_type == ZIP_STORED or fe.size > max_bytes:
+                    pending.append((next_idx, None, compress_type, level))
+                else:
+                    pending.append((next_idx, pool.submit(compress_member, fe.path, compress_type, level),
+                                    compress_type, level))
+                next_idx += 1
+            idx, future, compress_type, level = pending.popleft()
+            fe = files[idx]
+            arcname = os.path.relpath(fe.path, base_dir)
             try:
-                zf.write(fp, arcname)
+                if future is None:
+                    write_member_streaming(zf, fe, arcname, compress_type, level)
+                else:
+                    compress_type, crc, size, st, data = future.result()
+                    zinfo = make_zipinfo(arcname, st)
+                    zinfo.compress_type = compress_type
+                    zinfo.CRC = crc
+                    zinfo.file_size = size
+                    zinfo.compress_size = len(data)
+                    write_precompressed(zf, zinfo, data)
             except Exception as e:
                 print(f"Fehler beim Hinzufügen: {arcname}: {e}")
                 continue
-            processed_files += 1
-            processed_bytes += sizes[idx]
-            if SHOW_PROGRESS:
-                pct = (processed_bytes / total_bytes * 100) if total_bytes else 100.0
-                mb_done = processed_bytes / (1024*1024)
-                mb_total = total_bytes / (1024*1024)
-                elapsed = (datetime.now() - start_time).total_seconds()
-                rate_mb_s = (processed_bytes / (1024*1024) / elapsed) if elapsed > 0 else 0.0
-                remaining_files = len(files) - processed_files
-                if SINGLE_LINE_PROGRESS:
-                    line = (f"Datei: {os.path.basename(fp)} | {processed_files}/{len(files)} ({pct:.2f}%) | "
-                            f"Daten: {mb_done:.2f}/{mb_total:.2f} MB | Rate: {rate_mb_s:.2f} MB/s | Verbleibend: {remaining_files}")
-                    print("\r" + line.ljust(140), end="", flush=True)
-                else:
-                    if processed_files % PROGRESS_EVERY_N == 0 or processed_files == len(files):
-                        print(f"Fortschritt: {processed_files}/{len(files)} Dateien ({pct:.2f}%) | Daten: {mb_done:.2f}/{mb_total:.2f} MB")
-    if SHOW_PROGRESS and SINGLE_LINE_PROGRESS:
+            yield idx
+
+
+class SplitWriter(io.RawIOBase):
+    """Nicht seekbarer Schreibstrom, der auf Teildateien <base_path>.001, .002, ... verteilt.
+
+    Jede Teildatei ist höchstens part_size Bytes groß und wird geschlossen, sobald
+    sie voll ist. Ist SPLIT_PART_COMMAND gesetzt, wird der Befehl für jedes fertige
+    Teil im Hintergrund gestartet. Teile eines früheren Laufs mit gleichem Namen
+    werden vor dem ersten Teil gelöscht, sonst hängt "cat <name>.*" sie mit an.
+    """
+
+    def __init__(self, base_path: str, part_size: int):
+        super().__init__()
+        self.base_path = base_path
+        self.part_size = part_size
+        self.parts: List[str] = []
+        self._fh: Optional[BinaryIO] = None
+        self._in_part = 0
+        self._procs: List[Tuple[str, subprocess.Popen]] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def _remove_stale_parts(self) -> None:
+        dir_path, name = os.path.split(self.base_path)
+        pattern = re.compile(re.escape(name) + r"\.\d{3,}")
+        try:
+            names = os.listdir(dir_path or ".")
+        except OSError:
+            return
+        for entry in names:
+            if pattern.fullmatch(entry):
+                os.remove(os.path.join(dir_path, entry))
+
+    def _open_next(self) -> None:
+        if not self.parts:
+            self._remove_stale_parts()
+        path = f"{self.base_path}.{len(self.parts) + 1:03d}"
+        self._fh = open(path, "wb")
+        self._in_part = 0
+        self.parts.append(path)
+
+    def _finish_part(self) -> None:
+        self._fh.close()
+        self._fh = None
+        path = self.parts[-1]
+        if SPLIT_PART_COMMAND:
+            cmd = SPLIT_PART_COMMAND.format(path=shlex.quote(path))
+            self._procs.append((path, subprocess.Popen(cmd, shell=True)))
+
+    def write(self, b) -> int:
+        view = memoryview(b).cast("B")
+        total = len(view)
+        while view:
+            if self._fh is None:
+                self._open_next()
+            n = min(len(view), self.part_size - self._in_part)
+            self._fh.write(view[:n])
+            self._in_part += n
+            view = view[n:]
+            if self._in_part >= self.part_size:
+                self._finish_part()
+        return total
+
+    def close(self) -> None:
+        if not self.closed:
+            if self._fh is not None:
+                self._finish_part()
+            for path, proc in self._procs:
+                if proc.wait() != 0:
+                    print(f"SPLIT_PART_COMMAND für {path} beendet mit Code {proc.returncode}")
+        super().close()
+
+
+def open_stream_sink(dest_dir: str, output_name: str) -> Tuple[Optional[BinaryIO], str]:
+    """Liefert das Ausgabeziel gemäß STREAM_OUTPUT / SPLIT_SIZE_MB.
+
+    Rückgabe: (Schreibstrom oder None für eine normale Datei, Beschreibung des Ziels).
+    dest_dir wird nur angelegt, wenn das Archiv (bzw. seine Teile) dort landet.
+    """
+    if STREAM_OUTPUT == "-":
+        return sys.__stdout__.buffer, "<stdout>"
+    if STREAM_OUTPUT:
+        return open(STREAM_OUTPUT, "wb"), STREAM_OUTPUT
+    os.makedirs(dest_dir, exist_ok=True)
+    path = os.path.join(dest_dir, output_name)
+    if SPLIT_SIZE_MB and SPLIT_SIZE_MB > 0:
+        return SplitWriter(path, int(SPLIT_SIZE_MB * 1024 * 1024)), f"{path}.001 ..."
+    return None, path
+
+
+def close_stream_sink(sink: BinaryIO) -> None:
+    if sink is sys.__stdout__.buffer:
+        sink.flush()
+    else:
+        sink.close()
+
+
+def create_zip(base_dir: str, dest_dir: str, files: List[FileEntry], output_name: str,
+               workers: Optional[int] = None, show_progress: Optional[bool] = None) -> str:
+    sink, zip_path = open_stream_sink(dest_dir, output_name)
+    if workers is None:
+        workers = resolve_workers()
+    if show_progress is None:
+        show_progress = SHOW_PROGRESS
+    mode = "w"
+    if INCREMENTAL and sink is None and os.path.exists(zip_path):
+        try:
+            files = prepare_incremental(zip_path, base_dir, files, workers)
+            mode = "a"
+        except (BadZipFile, OSError, ValueError, struct.error) as e:
+            # z.B. abgeschnittenes ZIP eines abgebrochenen Laufs (auch bei intaktem zentralen Verzeichnis)
+            print(f"Vorhandenes ZIP nicht lesbar ({e}), erstelle es vollständig neu: {zip_path}")
+    total_bytes = sum(fe.size for fe in files)
+    start_time = datetime.now()
+    processed_bytes = 0
+    processed_files = 0
+    try:
+        with ZipFile(sink if sink is not None else zip_path, mode, compression=ZIP_DEFLATED) as zf:
+            if workers > 1 and len(files) > 1:
+                added = write_members_parallel(zf, base_dir, files, workers)
+            else:
+                added = write_members_sequential(zf, base_dir, files)
+            for idx in added:
+                processed_files += 1
+                processed_bytes += files[idx].size
+                if show_progress:
+                    print_progress(files[idx].path, processed_files, len(files), processed_bytes, total_bytes, start_time)
+    finally:
+        if sink is not None:
+            close_stream_sink(sink)
+    if show_progress and SINGLE_LINE_PROGRESS:
         print()  # Zeilenumbruch nach letzter Statuszeile
     return zip_path
 
 
+def open_tar_output(target: BinaryIO, workers: int):
+    """Öffnet ein komprimiertes tar-Archiv gemäß OUTPUT_FORMAT auf dem Schreibstrom target.
+
+    Der Strom muss nicht seekbar sein. Rückgabe: (TarFile, Aufräumfunktion). Die
+    Aufräumfunktion schließt den Kompressor (lzma, zstandard-Strom bzw. zstd-Prozess)
+    nach dem TarFile; target selbst bleibt offen.
+    """
+    if OUTPUT_FORMAT == "tar.xz":
+        xz = lzma.open(target, "wb", preset=TAR_COMPRESS_LEVEL)
+        return tarfile.open(fileobj=xz, mode="w|"), xz.close
+    if OUTPUT_FORMAT != "tar.zst":
+        raise ValueError(f"Unbekanntes Ausgabeformat: {OUTPUT_FORMAT}")
+    if zstandard is not None:
+        cctx = zstandard.ZstdCompressor(level=TAR_COMPRESS_LEVEL, threads=workers if workers > 1 else 0)
+        writer = cctx.stream_writer(target, closefd=False)
+        return tarfile.open(fileobj=writer, mode="w|"), writer.close
+    zstd_bin = shutil.which("zstd")
+    if not zstd_bin:
+        raise RuntimeError("Für tar.zst wird das Python-Paket zstandard oder das Programm zstd benötigt.")
+    try:
+        target.flush()
+        out_fd = target.fileno()
+    except (AttributeError, OSError):
+        out_fd = None
+    proc = subprocess.Popen([zstd_bin, "-q", "-c", f"-{TAR_COMPRESS_LEVEL}", f"-T{workers}"],
+                            stdin=subprocess.PIPE,
+                            stdout=out_fd if out_fd is not None else subprocess.PIPE)
+    pump = None
+    if out_fd is None:
+        # Ziel ohne Dateideskriptor (z.B. SplitWriter): Ausgabe von zstd umkopieren
+        pump = threading.Thread(target=shutil.copyfileobj, args=(proc.stdout, target, READ_CHUNK_SIZE), daemon=True)
+        pump.start()
+
+    def close_proc():
+        proc.stdin.close()
+        if pump is not None:
+            pump.join()
+        if proc.wait() != 0:
+            raise RuntimeError(f"zstd beendet mit Code {proc.returncode}")
+    return tarfile.open(fileobj=proc.stdin, mode="w|"), close_proc
+
+
+def create_tar(base_dir: str, dest_dir: str, files: List[FileEntry], output_name: str,
+               workers: Optional[int] = None, show_progress: Optional[bool] = None) -> str:
+    """Wie create_zip, schreibt aber ein tar.zst- bzw. tar.xz-Archiv (immer vollständig neu)."""
+    sink, tar_path = open_stream_sink(dest_dir, output_name)
+    total_bytes = sum(fe.size for fe in files)
+    if workers is None:
+        workers = resolve_workers()
+    if show_progress is None:
+        show_progress = SHOW_PROGRESS
+    start_time = datetime.now()
+    processed_bytes = 0
+    processed_files = 0
+    target = sink if sink is not None else open(tar_path, "wb")
+    try:
+        tar, close_compressor = open_tar_output(target, workers)
+        try:
+            for fe in files:
+                arcname = os.path.relpath(fe.path, base_dir)
+                try:
+                    with open(fe.path, "rb") as src:
+                        tinfo = make_tarinfo(fe, arcname, src)
+                        tar.addfile(tinfo, src)
+                except Exception as e:
+                    print(f"Fehler beim Hinzufügen: {arcname}: {e}")
+                    continue
+                processed_files += 1
+                processed_bytes += tinfo.size
+                if show_progress:
+                    print_progress(fe.path, processed_files, len(files), processed_bytes, total_bytes, start_time)
+        finally:
+            tar.close()
+            close_compressor()
+    finally:
+        close_stream_sink(target)
+    if show_progress and SINGLE_LINE_PROGRESS:
+        print()
+    return tar_path
+
+
+def create_archive(base_dir: str, dest_dir: str, files: List[FileEntry], output_name: str,
+                   workers: Optional[int] = None, show_progress: Optional[bool] = None) -> str:
+    """Erstellt das Archiv im konfigurierten OUTPUT_FORMAT."""
+    if OUTPUT_FORMAT == "zip":
+        return create_zip(base_dir, dest_dir, files, output_name, workers, show_progress)
+    return create_tar(base_dir, dest_dir, files, output_name, workers, show_progress)
+
+
+def _report_codecs() -> List[Tuple[str, object]]:
+    """Varianten für den Kompressionsbericht: (Name, Funktion(Pfad, Daten) -> komprimierte Größe)."""
+    def deflate(level):
+        return lambda path, data: len(zlib.compress(data, level))
+
+    def policy_auto(path, data):
+        compress_type, level = choose_compression(path, data[:ENTROPY_SAMPLE_BYTES])
+        return len(data) if compress_type == ZIP_STORED else len(zlib.compress(data, level))
+
+    codecs: List[Tuple[str, object]] = [
+        ("zip-deflate-1", deflate(1)),
+        ("zip-deflate-6", deflate(6)),
+        ("zip-deflate-9", deflate(9)),
+        ("zip-auto", policy_auto),
+        ("xz-0", lambda path, data: len(lzma.compress(data, preset=0))),
+        ("xz-6", lambda path, data: len(lzma.compress(data, preset=6))),
+    ]
+    if zstandard is not None:
+        for level in (1, 3, 9):
+            cctx = zstandard.ZstdCompressor(level=level)
+            codecs.append((f"zstd-{level}", lambda path, data, c=cctx: len(c.compress(data))))
+    return codecs
+
+
+def compression_report(files: List[FileEntry]) -> List[dict]:
+    """Misst Kompressionsrate und Durchsatz (ein Kern) je Variante an einer Stichprobe.
+
+    Die Stichprobe (max. REPORT_SAMPLE_MB) wird vorab in den Speicher gelesen,
+    damit die Messung nur die CPU-Zeit der Kompression enthält.
+    """
+    limit = REPORT_SAMPLE_MB * 1024 * 1024
+    sample: List[Tuple[str, bytes]] = []
+    total = 0
+    for fe in files:
+        if total >= limit:
+            break
+        try:
+            with open(fe.path, "rb") as f:
+                data = f.read(limit - total)
+        except OSError:
+            continue
+        sample.append((fe.path, data))
+        total += len(data)
+    results = []
+    if not total:
+        return results
+    for name, codec in _report_codecs():
+        start = time.perf_counter()
+        compressed = sum(codec(fp, data) for fp, data in sample)
+        duration = max(time.perf_counter() - start, 1e-9)
+        results.append({
+            "policy": name,
+            "files": len(sample),
+            "input_mb": round(total / (1024 * 1024), 2),
+            "ratio": round(total / compressed, 2) if compressed else 0.0,
+            "mb_per_s": round(total / (1024 * 1024) / duration, 2),
+        })
+    return results
+
+
+def print_compression_report(files: List[FileEntry]) -> None:
+    results = compression_report(files)
+    if not results:
+        print("Keine Daten für den Kompressionsbericht.")
+        return
+    print(f"Kompressionsbericht ({results[0]['files']} Dateien, {results[0]['input_mb']:.2f} MB, ein Kern):")
+    print(f"  {'Variante':<16} {'Ratio':>8} {'MB/s':>10}")
+    for r in results:
+        print(f"  {r['policy']:<16} {r['ratio']:>8.2f} {r['mb_per_s']:>10.2f}")
+    if zstandard is None:
+        print("  (zstd-Varianten nur mit installiertem Python-Paket zstandard)")
+
+
+def create_archives_batch(base_dir: str, dest_dir: str, jobs: List[Tuple[str, List[FileEntry]]]) -> Dict[str, str]:
+    """Schreibt mehrere Archive gleichzeitig, je Archiv ein Prozess mit sequentieller Kompression.
+
+    jobs: Liste von (Ausgabename, Dateiliste). Rückgabe: Ausgabename -> ZIP-Pfad
+    für alle erfolgreich erstellten Archive.
+    """
+    results: Dict[str, str] = {}
+    workers = min(resolve_workers(), max(1, len(jobs)))
+    if workers <= 1:
+        for name, files in jobs:
+            results[name] = create_archive(base_dir, dest_dir, files, name)
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(create_archive, base_dir, dest_dir, files, name, 1, False): (name, files)
+                   for name, files in jobs}
+        for future in as_completed(futures):
+            name, files = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"Fehler beim Erstellen von {name}: {e}")
+                continue
+            print(f"Archiv erstellt: {results[name]} ({len(files)} Dateien)")
+    return results
+
+
+def run_batch(dt_from: datetime, dt_to: datetime) -> int:
+    """Batch-Modus: ein Suchlauf über den Gesamtzeitraum, ein ZIP pro Zeitfenster."""
+    if STREAM_OUTPUT:
+        print("STREAM_OUTPUT ist im Batch-Modus nicht möglich (mehrere Archive).")
+        return 2
+    try:
+        windows = build_windows(dt_from, dt_to)
+    except Exception as e:
+        print(f"Fehler beim Aufbau der Zeitfenster: {e}")
+        return 2
+    if not windows:
+        print("Keine Zeitfenster konfiguriert.")
+        return 3
+    range_from = min(w[0] for w in windows)
+    range_to = max(w[1] for w in windows)
+    print(f"Batch: {len(windows)} Zeitfenster, suche Dateien in '{BASE_DIR}' zwischen {range_from} und {range_to} ...")
+    files = search_files(BASE_DIR, range_from, range_to)
+    print(f"Gefundene passende Dateien: {len(files)}")
+    buckets = route_files(files, windows)
+    jobs = [(build_output_name(w_from, w_to), bucket) for (w_from, w_to), bucket in zip(windows, buckets)]
+    if DRY_RUN:
+        print("Dry-Run aktiv. Würde ZIPs erstellen:")
+        print(f"  Zielordner: {DEST_DIR}")
+        for name, bucket in jobs:
+            print(f"  {name}: {len(bucket)} Dateien")
+        return 0
+    start_zip = datetime.now()
+    results = create_archives_batch(BASE_DIR, DEST_DIR, jobs)
+    duration = (datetime.now() - start_zip).total_seconds()
+    total_bytes = sum(fe.size for _, bucket in jobs for fe in bucket)
+    rate_mb_s = (total_bytes/1024/1024 / duration) if duration > 0 else 0.0
+    print(f"Archive erstellt: {len(results)}/{len(jobs)} in {DEST_DIR}")
+    print(f"Dateien: {sum(len(b) for b in buckets)} | Gesamtgröße: {total_bytes/1024/1024:.2f} MB | Dauer: {duration:.2f} s | Rate: {rate_mb_s:.2f} MB/s")
+    return 0 if len(results) == len(jobs) else 5
+
+
 def main():
+    if STREAM_OUTPUT == "-":
+        # stdout gehört dem Archiv, alle Meldungen nach stderr
+        sys.stdout = sys.stderr
     try:
         dt_from = parse_config_dt(FROM_STR)
         dt_to = parse_config_dt(TO_STR)
@@ -153,9 +1154,14 @@ def main():
     if not os.path.isdir(BASE_DIR):
         print(f"Basisordner nicht gefunden: {BASE_DIR}")
         return 4
+    if BATCH_WINDOWS or BATCH_BUCKET:
+        return run_batch(dt_from, dt_to)
     print(f"Suche Dateien in '{BASE_DIR}' mit Zeitstempel zwischen {dt_from} und {dt_to} ...")
-    files = find_matching_files(BASE_DIR, dt_from, dt_to)
+    files = search_files(BASE_DIR, dt_from, dt_to)
     print(f"Gefundene passende Dateien: {len(files)}")
+    if COMPRESSION_REPORT:
+        print_compression_report(files)
+        return 0
     output_name = OUTPUT_NAME or build_output_name(dt_from, dt_to)
     if not files:
         print("Keine passenden Dateien gefunden.")
@@ -166,18 +1172,18 @@ def main():
         print("Dry-Run aktiv. Würde ZIP erstellen:")
         print(f"  Zielordner: {DEST_DIR}")
         print(f"  ZIP-Datei: {output_name}")
-        for fp in files[:20]:
-            print("  +", os.path.relpath(fp, BASE_DIR))
+        for fe in files[:20]:
+            print("  +", os.path.relpath(fe.path, BASE_DIR))
         if len(files) > 20:
             print(f"  ... {len(files)-20} weitere Dateien")
         return 0
     start_zip = datetime.now()
-    zip_path = create_zip(BASE_DIR, DEST_DIR, files, output_name)
+    zip_path = create_archive(BASE_DIR, DEST_DIR, files, output_name)
     end_zip = datetime.now()
-    total_bytes = sum(os.path.getsize(f) for f in files) if files else 0
+    total_bytes = sum(fe.size for fe in files)
     duration = (end_zip - start_zip).total_seconds()
     rate_mb_s = (total_bytes/1024/1024 / duration) if duration > 0 else 0.0
-    print(f"ZIP erstellt: {zip_path}")
+    print(f"Archiv erstellt: {zip_path}")
     print(f"Dateien: {len(files)} | Gesamtgröße: {total_bytes/1024/1024:.2f} MB | Dauer: {duration:.2f} s | Rate: {rate_mb_s:.2f} MB/s")
     return 0
 